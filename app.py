@@ -1,8 +1,14 @@
+import os
+import time
 import streamlit as st
-from utils.transcript import get_transcript, extract_video_id
-from utils.openai_api import extract_actions_and_summary
-from utils.format import parse_actions_json
-import json
+from utils.env import load_env
+
+# Before the other utils modules read their settings
+load_env()
+
+from utils.transcript import extract_video_id, Transcript, TranscriptFailure
+from utils.format import format_summary_html, format_timestamp
+from utils.preprocess import compaction_stats
 
 st.set_page_config(
     page_title="YouTube Action Extractor",
@@ -94,44 +100,38 @@ st.markdown("""
 st.markdown('<h1 class="main-header">🎬 YouTube Action Extractor</h1>', unsafe_allow_html=True)
 st.markdown('<p class="sub-header">Transform YouTube tutorials into actionable step-by-step guides with AI</p>', unsafe_allow_html=True)
 
-# Import local file-based cache
-from utils.cache import load_from_cache, save_to_cache
+# Cache-aware pipeline: in-memory LRU + local file cache + single-flight deduplication
+from utils import cache
+from utils import pipeline
+from utils.memory_cache import memory_cache
+from utils import search_index
+from utils.metrics import metrics, serve_metrics
+from utils import jobs
+
+# Local /metrics endpoint (Prometheus text) and /metrics.json; started once per process
+serve_metrics()
+# Analysis workers (JOB_WORKERS threads); started once per process
+jobs.start_workers()
 
-# Cache configuration - dual caching: Streamlit (in-memory) + local file (persistent)
-@st.cache_data(ttl=3600)  # Streamlit cache for speed
+# The pipeline keeps a bounded in-process LRU tier (keyed by cache key, not by
+# transcript contents) in front of the local file cache, so no st.cache_data here
 def get_cached_transcript(video_id: str):
     """Cached transcript fetching by video ID with persistent local cache."""
-    # Check local file cache first (survives app restarts)
-    cached = load_from_cache('transcript', video_id, ttl=3600)
-    if cached is not None:
-        return cached
-    
-    # Not in cache, fetch from YouTube
-    transcript = get_transcript(video_id)
-    
-    # Save to local cache for persistence
-    save_to_cache('transcript', video_id, transcript)
-    
-    return transcript
+    return pipeline.get_cached_transcript(video_id)
 
-@st.cache_data(ttl=86400)  # Streamlit cache for speed
-def get_cached_analysis(video_id: str, transcript: str):
+def get_cached_analysis(video_id: str, transcript: Transcript):
     """Cached OpenAI analysis with persistent local file cache."""
-    # Check local file cache first (survives app restarts)
-    cached = load_from_cache('analysis', video_id, ttl=86400)
-    if cached is not None:
-        return tuple(cached) if isinstance(cached, list) else cached
-    
-    # Not in cache, call OpenAI API
-    try:
-        actions, summary = extract_actions_and_summary(transcript)
-        
-        # Save to local cache for persistence
-        save_to_cache('analysis', video_id, [actions, summary])
-        
-        return actions, summary
-    except Exception as e:
-        raise Exception(f"Error calling OpenAI API: {e}")
+    return pipeline.get_cached_analysis(video_id, transcript)
+
+def load_cached_result(video_id: str):
+    """(transcript or failure, analysis) already in the cache, or None if a job must compute them."""
+    transcript = pipeline.get_cached_transcript(video_id, cached_only=True)
+    if isinstance(transcript, TranscriptFailure):
+        return transcript, None
+    if transcript is None:
+        return None
+    analysis = pipeline.load_cached_analysis(video_id, transcript)
+    return None if analysis is None else (transcript, analysis)
 
 # Input section with better styling
 st.markdown("---")
@@ -153,6 +153,189 @@ with col2:
 col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
 with col_btn2:
     analyze_button = st.button("🚀 Analyze Video", type="primary", use_container_width=True)
+    stream_mode = st.checkbox(
+        "⚡ Stream results as they are generated",
+        value=os.getenv("STREAMING_MODE", "1") != "0"
+    )
+
+# How often a streamed job's preview is refreshed
+STREAM_POLL_SECONDS = 0.3
+
+# Full-text search across every analyzed video
+with col_btn2:
+    with st.expander("🔎 Search processed videos"):
+        query = st.text_input("Search steps, tools, code and transcripts", placeholder="docker compose volume")
+        if query:
+            hits = search_index.search(query, limit=20)
+            if not hits:
+                st.info("No matches in processed videos.")
+            for hit in hits:
+                seconds = (hit["start_ms"] or 0) // 1000
+                link = f"https://www.youtube.com/watch?v={hit['video_id']}&t={seconds}s"
+                timestamp = format_timestamp(seconds) if hit["start_ms"] is not None else "N/A"
+                st.markdown(f"[`{hit['video_id']}` ⏱️ {timestamp}]({link}) · *{hit['kind']}* — {hit['snippet']}")
+
+def show_stream_preview(events):
+    """Render the summary and steps a streamed job has published so far."""
+    summary_text = "".join(payload for kind, payload in events if kind == "summary")
+    steps = [payload for kind, payload in events if kind == "step"]
+    st.markdown("### 🧠 Video Summary")
+    st.markdown(summary_text or "...")
+    st.markdown("### ✅ Actionable Steps")
+    for step in steps:
+        st.markdown(f"⏱️ `{step.get('timestamp', 'N/A')}` {step.get('step', '')}")
+
+def show_transcript_failure(failure: TranscriptFailure):
+    """Render a transcript failure and the hints in its message."""
+    # Format error message with better styling
+    st.error("❌ **Transcript Error**")
+    # Split multi-line errors for better readability
+    error_lines = failure.message.split("\n")
+    for line in error_lines:
+        if line.strip():
+            if line.strip().startswith("Error:"):
+                st.warning(line.strip())
+            elif any(bullet in line for bullet in ["•", "-", "Solutions:", "What you can do:"]):
+                st.markdown(f"• {line.strip()}")
+            else:
+                st.info(line.strip())
+
+def show_results(video_id: str, transcript: Transcript, analysis, first_content: float, total_time: float):
+    """Render the metrics, summary, tools and steps of an analysis."""
+    st.caption(f"⚡ First content after {first_content:.2f}s · complete after {total_time:.2f}s")
+    if transcript.stale or analysis.stale:
+        st.caption("♻️ Served from an expired cache entry; a fresh copy is being prepared in the background")
+    render_started = time.perf_counter()
+
+    st.markdown("---")
+    
+    # Video metrics
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("📹 Video ID", video_id[:20] + "...")
+    with col2:
+        # Validated when cached: ready to render, nothing to parse
+        steps = analysis.steps
+        st.metric("📋 Steps Found", len(steps))
+    with col3:
+        transcript_length = len(transcript.text.split())
+        st.metric("📝 Transcript Words", f"{transcript_length:,}")
+    with col4:
+        # Prompt tokens before/after the pre-processing stage (utils/preprocess.py),
+        # tokenized once per video: reruns (and job polls) reuse the numbers
+        session_token_stats = st.session_state.setdefault("token_stats", {})
+        token_stats = session_token_stats.get(video_id)
+        if token_stats is None:
+            token_stats = session_token_stats[video_id] = compaction_stats(transcript)
+        st.metric(
+            "🔤 Prompt Tokens",
+            f"{token_stats['tokens_after']:,}",
+            delta=f"-{token_stats['saved_ratio']:.0%} of {token_stats['tokens_before']:,}",
+            delta_color="off"
+        )
+
+    # Display Summary in a styled card
+    st.markdown("---")
+    st.markdown("### 🧠 Video Summary")
+    with st.container():
+        # One line per bullet, joined with HTML breaks
+        summary_html = format_summary_html(analysis.summary)
+        
+        st.markdown(f'<div class="summary-card"><p style="margin:0; font-size:1.1rem; line-height:1.8; white-space: pre-wrap;">{summary_html}</p></div>', unsafe_allow_html=True)
+
+    tools = analysis.tools
+    
+    # Display Tools Section (if any tools mentioned)
+    if tools:
+        st.markdown("---")
+        st.markdown("### 🛠️ Tools & Technologies")
+        st.info(f"📦 Found {len(tools)} tool(s) discussed in this video")
+        
+        for tool in tools:
+            with st.expander(f"🔧 **{tool.name}** ⏱️ `{tool.timestamp}`", expanded=True):
+                if tool.purpose:
+                    st.markdown(f"**🎯 Purpose:** {tool.purpose}")
+                if tool.context:
+                    st.markdown(f"**📖 Context:** {tool.context}")
+                if tool.usage:
+                    st.markdown(f"**⚙️ Usage:** {tool.usage}")
+    
+    # Display Actionable Steps
+    st.markdown("---")
+    st.markdown("### ✅ Actionable Steps")
+    
+    if not steps:
+        st.warning("⚠️ No actionable steps found in this video.")
+    else:
+        st.info(f"📊 Found {len(steps)} actionable step(s) from this video")
+    
+    # Display steps in styled cards
+    for idx, step in enumerate(steps, 1):
+        timestamp = step.timestamp
+        step_text = step.text
+        code = step.code
+        tool_context = step.tool_context
+        
+        # Step card with better styling
+        with st.container():
+            st.markdown(
+                f"""
+                <div class="step-card" style="color: #1f2937;">
+                    <h3 style="color: #1f2937;">Step {idx} ⏱️ <code style="background-color: #e8f4f8; color: #667eea; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-weight: 600;">{timestamp}</code></h3>
+                    <p style="color: #1f2937;"><strong>📝 Action:</strong> {step_text}</p>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+            
+            # Display tool context if mentioned in this step
+            if tool_context:
+                st.markdown(f"**🛠️ Tool Context:** {tool_context}")
+            
+            if code:
+                st.markdown("**💻 Code Snippet:**")
+                st.code(code, language="python")
+        
+        if idx < len(steps):
+            st.markdown("<br>", unsafe_allow_html=True)
+    metrics.observe("render", time.perf_counter() - render_started)
+    
+    # Sidebar with info
+    with st.sidebar:
+        st.markdown("### ℹ️ About")
+        st.markdown("""
+        **YouTube Action Extractor** transforms tutorial videos into:
+        - ✅ Clear step-by-step guides
+        - 📋 Actionable items with timestamps
+        - 💻 Code snippets (when available)
+        - 🧠 Quick summaries
+        """)
+        
+        st.markdown("### ⚡ Features")
+        st.markdown("""
+        - 🌍 French & English support
+        - 💾 Smart caching (24h)
+        - 🤖 Powered by GPT-4o-mini
+        - ⚡ Fast & efficient
+        """)
+        
+        st.markdown("### 💾 Cache")
+        cache_stats = memory_cache.stats()
+        st.markdown(f"""
+        - In memory: {cache_stats['entries']} entries, {cache_stats['bytes'] / (1024 * 1024):.1f} / {cache_stats['max_bytes'] / (1024 * 1024):.0f} MB
+        - Hit ratio: {cache_stats['hit_ratio']:.0%} ({cache_stats['hits']} hits, {cache_stats['misses']} misses)
+        """)
+
+        st.markdown("### 🔒 Privacy")
+        if cache.backend.is_shared:
+            cache_location = f"Cache shared with other app instances ({cache.backend.name})"
+        else:
+            cache_location = "Cached locally only"
+        st.markdown(f"""
+        - API keys stay secure
+        - No video data stored
+        - {cache_location}
+        """)
 
 if analyze_button:
     if not url:
@@ -161,164 +344,96 @@ if analyze_button:
     
     # Extract video ID for caching
     try:
-        video_id = extract_video_id(url)
+        with metrics.timer("url_parse"):
+            video_id = extract_video_id(url)
     except Exception as e:
         st.error(f"Invalid YouTube URL: {e}")
         st.stop()
-    
-    # Get cached transcript (won't fetch again if same video was processed)
-    with st.spinner("Fetching transcript..."):
-        transcript = get_cached_transcript(video_id)
-    
-    if transcript.startswith("Error"):
-        # Format error message with better styling
-        st.error("❌ **Transcript Error**")
-        # Split multi-line errors for better readability
-        error_lines = transcript.split("\n")
-        for line in error_lines:
-            if line.strip():
-                if line.strip().startswith("Error:"):
-                    st.warning(line.strip())
-                elif any(bullet in line for bullet in ["•", "-", "Solutions:", "What you can do:"]):
-                    st.markdown(f"• {line.strip()}")
-                else:
-                    st.info(line.strip())
+
+    st.session_state.pop("first_content", None)
+    # A warm cache hit is rendered straight away, without a round trip through the job queue
+    lookup_started = time.perf_counter()
+    cached_result = load_cached_result(video_id)
+    if cached_result is None:
+        # Runs on the job workers: survives reruns, and the same video is only queued once.
+        # Streamed jobs publish the summary and steps as they are generated
+        st.session_state["job_id"] = jobs.submit(video_id, stream=stream_mode).id
+        st.session_state.pop("cached_result", None)
+    else:
+        st.session_state["cached_result"] = (video_id, *cached_result, time.perf_counter() - lookup_started)
+        st.session_state.pop("job_id", None)
+
+# Kept across reruns, like a finished job
+if st.session_state.get("cached_result"):
+    video_id, transcript, analysis, elapsed = st.session_state["cached_result"]
+    if isinstance(transcript, TranscriptFailure):
+        show_transcript_failure(transcript)
+    else:
+        show_results(video_id, transcript, analysis, elapsed, elapsed)
+# Poll the submitted job; each rerun shows its progress until it finishes
+elif st.session_state.get("job_id"):
+    job = jobs.get_job(st.session_state["job_id"])
+    if job is None:
+        st.session_state.pop("job_id")
+    elif job.active:
+        if job.status == jobs.QUEUED:
+            progress = f"⏳ Queued ({jobs.queue_position(job)} ahead)..."
+        elif job.stage == "analysis":
+            progress = "🤖 Analyzing with AI..."
+        else:
+            progress = "Fetching transcript..."
+        events = jobs.get_job_events(job.id) if job.stream else []
+        with st.spinner(progress):
+            if events:
+                # Seen by this poll, so accurate to STREAM_POLL_SECONDS
+                st.session_state.setdefault("first_content", time.time() - job.created_at)
+                show_stream_preview(events)
+            # Poll faster while a live preview is on screen
+            time.sleep(STREAM_POLL_SECONDS if job.stream else jobs.JOB_POLL_SECONDS)
+        st.rerun()
+    elif job.failure() is not None:
+        show_transcript_failure(job.failure())
+    elif job.status == jobs.FAILED:
+        st.error(f"❌ Error: {job.error}")
     else:
-        # Get cached analysis (won't call OpenAI API if already cached - saves tokens!)
-        with st.spinner("🤖 Analyzing with AI..."):
+        # The job left both results in the cache
+        transcript = get_cached_transcript(job.video_id)
+        if isinstance(transcript, TranscriptFailure):
+            show_transcript_failure(transcript)
+        else:
             try:
-                actions, summary = get_cached_analysis(video_id, transcript)
+                analysis = get_cached_analysis(job.video_id, transcript)
             except Exception as e:
                 st.error(f"❌ Error: {str(e)}")
                 st.stop()
+            elapsed = job.finished_at - job.created_at
+            show_results(job.video_id, transcript, analysis,
+                         st.session_state.get("first_content", elapsed), elapsed)
 
-        st.markdown("---")
-        
-        # Video metrics
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            st.metric("📹 Video ID", video_id[:20] + "...")
-        with col2:
-            steps = parse_actions_json(actions)
-            st.metric("📋 Steps Found", len(steps) if steps else 0)
-        with col3:
-            transcript_length = len(transcript.split())
-            st.metric("📝 Transcript Words", f"{transcript_length:,}")
-
-        # Display Summary in a styled card
-        st.markdown("---")
-        st.markdown("### 🧠 Video Summary")
-        with st.container():
-            # Process summary to add line breaks for bullets
-            # First, normalize newlines
-            summary_formatted = summary.replace('\r\n', '\n').replace('\r', '\n')
-            
-            # Handle bullet points - ensure they're on separate lines
-            summary_formatted = summary_formatted.replace('• ', '\n• ').replace('- ', '\n- ').replace('* ', '\n* ')
-            
-            # Split by newlines and process each line
-            lines = summary_formatted.split('\n')
-            formatted_lines = []
-            for line in lines:
-                line = line.strip()
-                if line:  # Skip empty lines
-                    formatted_lines.append(line)
-            
-            # Join with HTML breaks
-            summary_html = '<br>'.join(formatted_lines)
-            
-            st.markdown(f'<div class="summary-card"><p style="margin:0; font-size:1.1rem; line-height:1.8; white-space: pre-wrap;">{summary_html}</p></div>', unsafe_allow_html=True)
-
-        # Parse tools if available
-        try:
-            parsed_actions = json.loads(actions)
-            tools = parsed_actions.get("tools", [])
-        except:
-            tools = []
-        
-        # Display Tools Section (if any tools mentioned)
-        if tools:
-            st.markdown("---")
-            st.markdown("### 🛠️ Tools & Technologies")
-            st.info(f"📦 Found {len(tools)} tool(s) discussed in this video")
-            
-            for tool in tools:
-                tool_name = tool.get("name", "Unknown Tool")
-                tool_timestamp = tool.get("timestamp", "N/A")
-                tool_purpose = tool.get("purpose", "")
-                tool_context = tool.get("context", "")
-                tool_usage = tool.get("usage", "")
-                
-                with st.expander(f"🔧 **{tool_name}** ⏱️ `{tool_timestamp}`", expanded=True):
-                    if tool_purpose:
-                        st.markdown(f"**🎯 Purpose:** {tool_purpose}")
-                    if tool_context:
-                        st.markdown(f"**📖 Context:** {tool_context}")
-                    if tool_usage:
-                        st.markdown(f"**⚙️ Usage:** {tool_usage}")
-        
-        # Display Actionable Steps
-        st.markdown("---")
-        st.markdown("### ✅ Actionable Steps")
-        
-        if not steps:
-            st.warning("⚠️ No actionable steps found in this video.")
-        else:
-            st.info(f"📊 Found {len(steps)} actionable step(s) from this video")
-        
-        # Display steps in styled cards
-        for idx, step in enumerate(steps, 1):
-            timestamp = step.get("timestamp", "N/A")
-            step_text = step.get("step", "")
-            code = step.get("code", "")
-            tool_context = step.get("tool_context", "")
-            
-            # Step card with better styling
-            with st.container():
-                st.markdown(
-                    f"""
-                    <div class="step-card" style="color: #1f2937;">
-                        <h3 style="color: #1f2937;">Step {idx} ⏱️ <code style="background-color: #e8f4f8; color: #667eea; padding: 0.25rem 0.5rem; border-radius: 0.25rem; font-weight: 600;">{timestamp}</code></h3>
-                        <p style="color: #1f2937;"><strong>📝 Action:</strong> {step_text}</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-                
-                # Display tool context if mentioned in this step
-                if tool_context and tool_context.strip():
-                    st.markdown(f"**🛠️ Tool Context:** {tool_context}")
-                
-                if code and code.strip():
-                    st.markdown("**💻 Code Snippet:**")
-                    st.code(code, language="python")
-            
-            if idx < len(steps):
-                st.markdown("<br>", unsafe_allow_html=True)
-        
-        # Sidebar with info
-        with st.sidebar:
-            st.markdown("### ℹ️ About")
-            st.markdown("""
-            **YouTube Action Extractor** transforms tutorial videos into:
-            - ✅ Clear step-by-step guides
-            - 📋 Actionable items with timestamps
-            - 💻 Code snippets (when available)
-            - 🧠 Quick summaries
-            """)
-            
-            st.markdown("### ⚡ Features")
-            st.markdown("""
-            - 🌍 French & English support
-            - 💾 Smart caching (24h)
-            - 🤖 Powered by GPT-4o-mini
-            - ⚡ Fast & efficient
-            """)
-            
-            st.markdown("### 🔒 Privacy")
-            st.markdown("""
-            - API keys stay secure
-            - No video data stored
-            - Cached locally only
-            """)
-
+# Operator view of the process-wide metrics (also served on /metrics)
+if os.getenv("ADMIN_PANEL", "0") == "1":
+    with st.sidebar:
+        st.markdown("### 📈 Metrics")
+        stage_stats = metrics.stage_stats()
+        if stage_stats:
+            st.table([
+                {"stage": stage, "count": stats["count"],
+                 "p50 (ms)": round(stats["p50"] * 1000, 1), "p95 (ms)": round(stats["p95"] * 1000, 1)}
+                for stage, stats in stage_stats.items()
+            ])
+        counters = metrics.counters()
+        tokens = {}
+        for item in counters.get("llm_tokens", []):
+            kind = item["labels"].get("kind", "")
+            tokens[kind] = tokens.get(kind, 0) + item["value"]
+        requests = {}
+        for item in counters.get("cache_requests", []):
+            tier_result = (item["labels"].get("tier", ""), item["labels"].get("result", ""))
+            requests[tier_result] = requests.get(tier_result, 0) + item["value"]
+        st.markdown(f"""
+        - LLM requests: {sum(item["value"] for item in counters.get("llm_requests", [])):.0f}
+        - Tokens: {tokens.get("prompt", 0):,.0f} prompt, {tokens.get("completion", 0):,.0f} completion
+        - Memory tier: {requests.get(("memory", "hit"), 0):.0f} hits, {requests.get(("memory", "miss"), 0):.0f} misses
+        - File cache: {requests.get(("file", "hit"), 0):.0f} hits, {requests.get(("file", "miss"), 0):.0f} misses
+        - Jobs: {", ".join(f"{count} {status}" for status, count in jobs.get_job_stats().items())}
+        """)
@@ -0,0 +1,222 @@
+"""
+Headless batch processing for lists of YouTube videos and playlists.
+
+Runs the same cache-aware pipeline as the Streamlit app over many videos with
+separate concurrency limits for YouTube and OpenAI, and streams one JSON
+result per line. Re-running with the same output file resumes where a
+previous run stopped; anything already analyzed is served from the cache.
+
+Usage:
+    python batch.py urls.txt -o results.jsonl
+    python batch.py --playlist "https://www.youtube.com/playlist?list=..." -o results.jsonl
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Set
+
+from utils.env import load_env
+
+# Before the other utils modules read their settings
+load_env()
+
+from utils import pipeline
+from utils.openai_api import estimate_analysis_tokens
+from utils.rate_limit import PRIORITY_BATCH
+from utils.transcript import extract_video_id, TranscriptFailure
+
+
+def read_video_ids(path: str) -> List[str]:
+    """Read URLs or video IDs from a file, one per line (``#`` starts a comment)."""
+    video_ids = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                video_ids.append(extract_video_id(line))
+    return video_ids
+
+
+def playlist_video_ids(playlist_url: str) -> List[str]:
+    """List the video IDs of a playlist without downloading anything (needs yt-dlp)."""
+    try:
+        from yt_dlp import YoutubeDL
+    except ImportError:
+        raise SystemExit("Playlist support requires yt-dlp: pip install yt-dlp")
+
+    with YoutubeDL({'extract_flat': True, 'quiet': True, 'skip_download': True}) as ydl:
+        info = ydl.extract_info(playlist_url, download=False)
+    return [entry['id'] for entry in info.get('entries') or [] if entry and entry.get('id')]
+
+
+def completed_video_ids(output_path: Path) -> Set[str]:
+    """Video IDs that already have a successful result in the output file."""
+    done = set()
+    if not output_path.exists():
+        return done
+    # A crash can cut the last line in the middle of a multibyte character
+    with open(output_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Partial last line from a crash
+                continue
+            if record.get('status') == 'ok':
+                done.add(record.get('video_id'))
+    return done
+
+
+def terminate_partial_line(output_path: Path) -> None:
+    """Append a newline if a crash left the output file's last line unterminated."""
+    # Bytes, not text: the file may end in the middle of a character
+    with open(output_path, 'ab+') as f:
+        if f.tell() > 0:
+            f.seek(-1, 2)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+
+
+def _dedupe(video_ids: Iterable[str]) -> List[str]:
+    seen = set()
+    return [v for v in video_ids if not (v in seen or seen.add(v))]
+
+
+class BatchRunner:
+    """
+    Two-stage worker pool: transcripts on one pool, analyses on another.
+
+    Args:
+        output: Open text file results are appended to
+        youtube_workers: Concurrent YouTube transcript fetches
+        openai_workers: Concurrent analyses (each may issue several requests)
+    """
+
+    def __init__(self, output, youtube_workers: int = 2, openai_workers: int = 4):
+        self.output = output
+        self.youtube_pool = ThreadPoolExecutor(max_workers=youtube_workers, thread_name_prefix='youtube')
+        self.openai_pool = ThreadPoolExecutor(max_workers=openai_workers, thread_name_prefix='openai')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._all_done = threading.Event()
+        self.started = time.perf_counter()
+        self.ok = 0
+        self.failed = 0
+        self.cached = 0
+        self.tokens = 0
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+            if record['status'] == 'ok':
+                self.ok += 1
+            else:
+                self.failed += 1
+            self._pending -= 1
+            if self._pending == 0:
+                self._all_done.set()
+
+    def _fetch(self, video_id: str) -> None:
+        started = time.perf_counter()
+        try:
+            transcript = pipeline.get_cached_transcript(video_id)
+        except Exception as e:
+            transcript = TranscriptFailure('failed', f"Error fetching transcript: {e}")
+        if isinstance(transcript, TranscriptFailure):
+            self._write({'video_id': video_id, 'status': 'error', 'stage': 'transcript',
+                         'kind': transcript.kind, 'error': transcript.message,
+                         'seconds': round(time.perf_counter() - started, 3)})
+            return
+        self.openai_pool.submit(self._analyze, video_id, transcript, started)
+
+    def _analyze(self, video_id: str, transcript, started: float) -> None:
+        try:
+            # Warm-up recomputes analyses past their soft TTL instead of serving them stale
+            if pipeline.load_cached_analysis(video_id, transcript, allow_stale=False) is not None:
+                with self._lock:
+                    self.cached += 1
+            else:
+                tokens = estimate_analysis_tokens(transcript)
+                with self._lock:
+                    self.tokens += tokens
+            # Batch warm-up yields to interactive UI requests
+            analysis = pipeline.get_cached_analysis(video_id, transcript, priority=PRIORITY_BATCH,
+                                                    allow_stale=False)
+        except Exception as e:
+            self._write({'video_id': video_id, 'status': 'error', 'stage': 'analysis',
+                         'error': str(e), 'seconds': round(time.perf_counter() - started, 3)})
+            return
+
+        self._write({
+            'video_id': video_id,
+            'status': 'ok',
+            'language': transcript.language,
+            'summary': analysis.summary,
+            'steps': [step.to_dict() for step in analysis.steps],
+            'tools': [tool.to_dict() for tool in analysis.tools],
+            'seconds': round(time.perf_counter() - started, 3),
+        })
+
+    def run(self, video_ids: List[str], progress_every: float = 30.0) -> None:
+        """Process every video and block until all results are written."""
+        if not video_ids:
+            return
+        self._pending = len(video_ids)
+        # With a shared cache, pull what other replicas already computed in a few round trips
+        pipeline.prefetch_videos(video_ids)
+        for video_id in video_ids:
+            self.youtube_pool.submit(self._fetch, video_id)
+        while not self._all_done.wait(progress_every):
+            print(self.report(len(video_ids)), file=sys.stderr)
+        self.youtube_pool.shutdown()
+        self.openai_pool.shutdown()
+
+    def report(self, total: int) -> str:
+        """One-line throughput summary (tokens are estimated prompt tokens)."""
+        minutes = max(time.perf_counter() - self.started, 1e-9) / 60
+        done = self.ok + self.failed
+        return (f"{done}/{total} videos ({self.ok} ok, {self.failed} failed, {self.cached} cached) | "
+                f"{done / minutes:.1f} videos/min | {self.tokens / minutes:,.0f} tokens/min")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Extract steps and summaries for many YouTube videos.")
+    parser.add_argument('input', nargs='?', help="File with one YouTube URL or video ID per line")
+    parser.add_argument('--playlist', action='append', default=[], help="Playlist URL (repeatable)")
+    parser.add_argument('-o', '--output', default='results.jsonl', help="JSONL output file (appended to)")
+    parser.add_argument('--youtube-workers', type=int, default=2, help="Concurrent transcript fetches")
+    parser.add_argument('--openai-workers', type=int, default=4, help="Concurrent analyses")
+    parser.add_argument('--no-resume', action='store_true', help="Reprocess videos already in the output file")
+    args = parser.parse_args(argv)
+
+    if not args.input and not args.playlist:
+        parser.error("provide an input file and/or --playlist")
+
+    video_ids = read_video_ids(args.input) if args.input else []
+    for playlist_url in args.playlist:
+        video_ids.extend(playlist_video_ids(playlist_url))
+    video_ids = _dedupe(video_ids)
+
+    output_path = Path(args.output)
+    if not args.no_resume:
+        done = completed_video_ids(output_path)
+        if done:
+            print(f"Resuming: skipping {len(done)} already processed video(s)", file=sys.stderr)
+        video_ids = [v for v in video_ids if v not in done]
+
+    terminate_partial_line(output_path)
+    with open(output_path, 'a', encoding='utf-8') as output:
+        runner = BatchRunner(output, args.youtube_workers, args.openai_workers)
+        runner.run(video_ids)
+    print(runner.report(len(video_ids)), file=sys.stderr)
+    return 1 if runner.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
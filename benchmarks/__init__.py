@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the YouTube Action Extractor.
+"""
@@ -0,0 +1,58 @@
+"""
+Wall-clock latency of the analysis calls, sequential vs concurrent.
+
+Runs against a local fake OpenAI server where action and summary requests take
+a fixed amount of time. With the requests running concurrently, total latency
+should be close to the slower of the two instead of their sum.
+
+Usage:
+    python -m benchmarks.bench_analysis_latency [--action-delay 0.8] [--summary-delay 0.5]
+"""
+import argparse
+import time
+
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from utils import openai_api
+from utils.transcript import Transcript
+
+
+def run_sequential(client, transcript: Transcript) -> None:
+    """Baseline: every request one after the other."""
+    annotated = transcript.annotated_text()
+    chunks = openai_api.split_transcript(annotated) or [annotated]
+    for part, chunk in enumerate(chunks, 1):
+        openai_api._analyze_chunk(client, chunk, part, len(chunks))
+    openai_api._summarize(client, chunks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--action-delay", type=float, default=0.8)
+    parser.add_argument("--summary-delay", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    transcript = Transcript.from_segments(
+        {"text": f"step {i} of the tutorial", "start": i * 3.0, "duration": 3.0}
+        for i in range(200)
+    )
+
+    with FakeOpenAIServer(json_delay=args.action_delay, text_delay=args.summary_delay) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url)
+
+        for name, run in (
+            ("sequential", lambda: run_sequential(client, transcript)),
+            ("concurrent", lambda: openai_api.extract_actions_and_summary(transcript, client=client)),
+        ):
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+            print(f"{name:>10}: best {min(timings):.3f}s  (action {args.action_delay}s, summary {args.summary_delay}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Token usage and latency of the two-call and single-call analysis modes.
+
+Replays the transcript and model responses of a fixture against a local fake
+OpenAI server. Each request's latency is modeled from its size (fixed
+overhead plus prefill and decode time per token), so the comparison reflects
+both the number of round trips and the tokens each mode sends.
+
+Usage:
+    python -m benchmarks.bench_analysis_modes [--fixture benchmarks/fixtures/fastapi_tutorial.json]
+"""
+import argparse
+import statistics
+import time
+
+from openai import OpenAI
+
+from benchmarks.fake_openai import FakeOpenAIServer, count_tokens
+from benchmarks.replay import DEFAULT_FIXTURE, fixture_responder, load_fixture
+from utils import openai_api
+from utils.transcript import Transcript
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", default=str(DEFAULT_FIXTURE))
+    parser.add_argument("--overhead", type=float, default=0.3, help="Seconds per request")
+    parser.add_argument("--prefill-ms", type=float, default=0.05, help="Milliseconds per prompt token")
+    parser.add_argument("--decode-ms", type=float, default=8.0, help="Milliseconds per completion token")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fixture = load_fixture(args.fixture)
+    transcript = Transcript.from_segments(fixture["segments"], language=fixture.get("language"))
+
+    def latency(request: dict, content: str) -> float:
+        prompt_tokens, completion_tokens = count_tokens(request, content)
+        return args.overhead + (prompt_tokens * args.prefill_ms + completion_tokens * args.decode_ms) / 1000
+
+    with FakeOpenAIServer(responder=fixture_responder(fixture["responses"]), latency=latency) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url)
+
+        print(f"{'mode':>12} {'requests':>9} {'prompt tok':>11} {'completion tok':>15} {'best':>8} {'median':>8}")
+        for mode in openai_api.ANALYSIS_MODES:
+            server.reset_counters()
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                openai_api.extract_actions_and_summary(transcript, client=client, mode=mode)
+                timings.append(time.perf_counter() - start)
+            print(f"{mode:>12} {server.request_count / args.repeat:>9.0f} "
+                  f"{server.prompt_tokens / args.repeat:>11,.0f} {server.completion_tokens / args.repeat:>15,.0f} "
+                  f"{min(timings):>7.3f}s {statistics.median(timings):>7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Read/write latency of the file, redis and tiered cache backends, and how a
+new replica warms up from the shared cache.
+
+The shared cache is a local fake Redis server with a per-command delay that
+models the network round trip. Entries are the transcript of a fixture
+stored under many keys.
+
+Usage:
+    python -m benchmarks.bench_cache_backends [--entries 200] [--rtt-ms 0.5]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.fake_redis import FakeRedisServer
+from benchmarks.replay import DEFAULT_FIXTURE, load_fixture
+from utils.cache import CACHE_HARD_TTLS, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_SWEEP_INTERVAL, make_cache_key
+from utils.cache_backends import FileBackend, RedisBackend, TieredBackend
+from utils.transcript import Transcript
+
+
+def file_backend(root: Path) -> FileBackend:
+    return FileBackend(root, CACHE_HARD_TTLS, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_SWEEP_INTERVAL)
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def per_op_ms(seconds: float, count: int) -> str:
+    return f"{seconds / count * 1000:8.3f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", default=str(DEFAULT_FIXTURE))
+    parser.add_argument("--entries", type=int, default=200)
+    parser.add_argument("--rtt-ms", type=float, default=0.5, help="Simulated round trip per command")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    fixture = load_fixture(args.fixture)
+    data = Transcript.from_segments(fixture["segments"], language=fixture.get("language")).to_dict()
+    keys = [make_cache_key("transcript", f"video{i}") for i in range(args.entries)]
+    now = time.time()
+
+    with FakeRedisServer(latency=args.rtt_ms / 1000) as server, tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        backends = {
+            "file": file_backend(tmp / "file"),
+            "redis": RedisBackend(server.url, CACHE_HARD_TTLS, prefix="bench:redis:"),
+            "tiered": TieredBackend(file_backend(tmp / "near"),
+                                    RedisBackend(server.url, CACHE_HARD_TTLS, prefix="bench:tiered:")),
+        }
+
+        print(f"{args.entries} entries of {len(str(data)) / 1024:.0f} KiB, {args.rtt_ms} ms simulated RTT")
+        print(f"{'backend':>8} {'set ms':>8} {'get ms':>8} {'get_many ms':>12}")
+        for name, backend in backends.items():
+            set_s = timed(lambda: [backend.set("transcript", key, data, now) for key in keys])
+            get_s = min(timed(lambda: [backend.get("transcript", key) for key in keys])
+                        for _ in range(args.repeat))
+            many_s = min(timed(lambda: backend.get_many("transcript", keys)) for _ in range(args.repeat))
+            print(f"{name:>8} {per_op_ms(set_s, len(keys))} {per_op_ms(get_s, len(keys))} "
+                  f"{per_op_ms(many_s, len(keys)):>12}")
+
+        # A replica started after a deploy: empty near cache, shared cache already warm
+        print("\nNew replica, first read of every entry (tiered):")
+        shared = backends["tiered"].shared
+        results = {}
+        for label, warm in (("one GET per key", False), ("prefetch (MGET batches)", True)):
+            timings = []
+            round_trips = []
+            for _ in range(args.repeat):
+                replica = TieredBackend(file_backend(Path(tempfile.mkdtemp(dir=tmp))), shared)
+                before = sum(server.commands.values())
+                start = time.perf_counter()
+                if warm:
+                    replica.prefetch("transcript", keys)
+                found = sum(replica.get("transcript", key) is not None for key in keys)
+                timings.append(time.perf_counter() - start)
+                round_trips.append(sum(server.commands.values()) - before)
+                assert found == len(keys)
+            results[label] = statistics.median(timings)
+            print(f"  {label:>24}: {statistics.median(timings) * 1000:8.1f} ms, "
+                  f"{statistics.median(round_trips):.0f} round trips")
+        print(f"  speedup: {results['one GET per key'] / results['prefetch (MGET batches)']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Size and read/write throughput of cache entries in the previous JSON file
+formats and in the compressed format, with and without a trained dictionary.
+
+Transcripts are the fixture scaled to several lengths. Past the first pass,
+each repetition has its words shuffled, so compressors with a long window
+cannot just copy the earlier passes. Dictionaries are trained on transcripts
+shuffled with another seed, and never see the measured payloads verbatim.
+
+``ratio`` is the size of the indented JSON file over the size of the entry.
+``header`` is reading an entry's key and timestamp only, which is all a
+freshness check or a copy between cache tiers needs.
+
+Usage:
+    python -m benchmarks.bench_cache_compression [--minutes 10 60 180] [--repeat 5]
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.replay import DEFAULT_FIXTURE, load_fixture, scale_segments
+from utils.analysis import Analysis
+from utils.cache_backends import Entry
+from utils.compression import CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD, Compressor, _zstd
+from utils.transcript import Transcript
+
+
+def shuffled_segments(segments: List[Dict[str, Any]], minutes: float, seed: int) -> List[Dict[str, Any]]:
+    """scale_segments(), with the words of every repeated segment shuffled."""
+    rng = random.Random(seed)
+    count = len(segments)
+    scaled = scale_segments(segments, minutes)
+    for segment in scaled[count:]:
+        words = segment["text"].split()
+        rng.shuffle(words)
+        segment["text"] = " ".join(words)
+    return scaled
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", default=str(DEFAULT_FIXTURE))
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10, 60, 180])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fixture = load_fixture(args.fixture)
+    language = fixture.get("language")
+    responses = fixture["responses"]
+    payloads = {
+        f"transcript {minutes:g}m": ("transcript", Transcript.from_segments(
+            shuffled_segments(fixture["segments"], minutes, seed=1), language=language).to_dict())
+        for minutes in args.minutes
+    }
+    payloads["analysis"] = ("analysis", Analysis.from_response(
+        json.dumps(responses["actions"]), responses["summary"]).to_dict())
+
+    with tempfile.TemporaryDirectory() as dict_dir:
+        compressors = {CODEC_NONE: Compressor(CODEC_NONE), CODEC_ZLIB: Compressor(CODEC_ZLIB)}
+        codecs = [CODEC_ZLIB]
+        if _zstd() is not None:
+            compressors[CODEC_ZSTD] = Compressor(CODEC_ZSTD)
+            codecs.append(CODEC_ZSTD)
+        samples = [
+            json.dumps(Transcript.from_segments(shuffled_segments(fixture["segments"], minutes, seed=seed),
+                                                language=language).to_dict(),
+                       ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            for seed in range(2, 12) for minutes in (5, 15, 30)
+        ]
+        for codec in codecs:
+            trained = Compressor(codec, dict_dir=f"{dict_dir}/{codec}")
+            trained.train("transcript", samples)
+            compressors[f"{codec}+dict"] = trained
+
+        print(f"{'payload':>16} {'format':>14} {'KiB':>8} {'ratio':>6} "
+              f"{'write MB/s':>11} {'read MB/s':>10} {'header us':>10}")
+        for label, (cache_type, data) in payloads.items():
+            raw_size = len(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            # The JSON files written before compression; read back as legacy entries
+            formats: Dict[str, Callable[[], bytes]] = {
+                "json indented": lambda: json.dumps({"key": "k", "timestamp": 0, "data": data},
+                                                    ensure_ascii=False, indent=2).encode("utf-8"),
+                "json": lambda: json.dumps({"key": "k", "timestamp": 0, "data": data},
+                                           ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            }
+            for name, compressor in compressors.items():
+                if name.endswith("+dict") and cache_type != "transcript":
+                    continue
+                formats[name] = (lambda compressor=compressor:
+                                 Entry.create(cache_type, "k", data, 0, compressor).encode(cache_type))
+
+            baseline = None
+            for name, write in formats.items():
+                compressor = compressors.get(name, compressors[CODEC_NONE])
+                stored = write()
+                assert Entry.decode(stored, "k", compressor).data == data
+                baseline = baseline or len(stored)
+                write_s = best_of(write, args.repeat)
+                read_s = best_of(lambda: Entry.decode(stored, "k", compressor).data, args.repeat)
+                header_s = best_of(lambda: Entry.decode(stored, "k", compressor).timestamp, args.repeat)
+                print(f"{label:>16} {name:>14} {len(stored) / 1024:8.1f} {baseline / len(stored):5.1f}x "
+                      f"{raw_size / write_s / 1e6:11.1f} {raw_size / read_s / 1e6:10.1f} "
+                      f"{header_s * 1e6:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
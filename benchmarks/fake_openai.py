@@ -0,0 +1,163 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+Serves ``POST /v1/chat/completions`` with canned responses after a configurable
+delay, so the real ``openai`` client can be pointed at it with ``base_url``.
+Requests with ``stream=True`` get server-sent events, with the delay spread
+over the streamed pieces.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+def default_responder(request: dict) -> str:
+    """Return a minimal actions document for JSON requests, text otherwise."""
+    response_format = request.get("response_format") or {}
+    if response_format:
+        document = {
+            "steps": [{"step": "Install the CLI", "segment": 0, "code": "", "tool_context": ""}],
+            "tools": []
+        }
+        if response_format.get("type") == "json_schema":
+            document["summary"] = "• First point\n• Second point\n• Third point"
+        return json.dumps(document)
+    return "• First point\n• Second point\n• Third point"
+
+
+def count_tokens(request: dict, content: str) -> tuple:
+    """Approximate (prompt_tokens, completion_tokens) at ~4 characters per token."""
+    prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+    return prompt_tokens, len(content) // 4
+
+
+class FakeOpenAIServer:
+    """
+    Threaded HTTP server that answers chat completion requests.
+
+    Args:
+        json_delay: Seconds to wait before answering JSON-mode (action) requests
+        text_delay: Seconds to wait before answering text (summary) requests
+        responder: Callable mapping the request body to the message content
+        latency: Callable mapping (request body, content) to the delay in
+            seconds; overrides json_delay/text_delay (e.g. to model latency
+            that grows with prompt and completion tokens)
+
+    Attributes ``request_count``, ``prompt_tokens`` and ``completion_tokens``
+    add up over every request served.
+    """
+
+    def __init__(self, json_delay: float = 0.0, text_delay: float = 0.0,
+                 responder: Optional[Callable[[dict], str]] = None,
+                 latency: Optional[Callable[[dict, str], float]] = None):
+        self.json_delay = json_delay
+        self.text_delay = text_delay
+        self.responder = responder or default_responder
+        self.latency = latency
+        self.request_count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                content = server.responder(request)
+                prompt_tokens, completion_tokens = count_tokens(request, content)
+                with server._lock:
+                    server.request_count += 1
+                    server.prompt_tokens += prompt_tokens
+                    server.completion_tokens += completion_tokens
+                if server.latency is not None:
+                    delay = server.latency(request, content)
+                else:
+                    delay = server.json_delay if request.get("response_format") else server.text_delay
+                if request.get("stream"):
+                    self._stream(request, content, delay)
+                    return
+                time.sleep(delay)
+                body = json.dumps({
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "gpt-4o-mini"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    }
+                }).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream(self, request, content, delay):
+                pieces = [content[i:i + 8] for i in range(0, len(content), 8)] or [""]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for piece in pieces:
+                    time.sleep(delay / len(pieces))
+                    event = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model", "gpt-4o-mini"),
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                    }
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.request_count = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
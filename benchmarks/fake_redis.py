@@ -0,0 +1,173 @@
+"""
+Local stand-in for a Redis server.
+
+Speaks enough of the Redis protocol (RESP2) for the shared cache backend:
+PING, AUTH, SELECT, GET, SET (with EX/PX), MGET, DEL, EXISTS, SCAN, DBSIZE,
+FLUSHDB and TTL, on an in-memory dict with key expiry. An optional delay per
+command models the network round trip to a real server.
+"""
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class FakeRedisServer:
+    """
+    Threaded TCP server answering Redis commands from memory.
+
+    Args:
+        latency: Seconds to wait before answering each command (one round trip)
+        password: Require ``AUTH`` with this password before other commands
+
+    Attribute ``commands`` counts the commands served by name.
+    """
+
+    def __init__(self, latency: float = 0.0, password: Optional[str] = None):
+        self.latency = latency
+        self.password = password
+        self.commands: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # key -> (value, expires_at or None)
+        self._data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+    def _live(self, key: bytes) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.time():
+            del self._data[key]
+            return None
+        return item[0]
+
+    def execute(self, args: List[bytes], session: dict) -> Any:
+        """Run one command; returns the reply or raises ValueError for an error reply."""
+        name = args[0].decode().upper()
+        with self._lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+            if name == "AUTH":
+                if args[-1].decode() != self.password:
+                    raise ValueError("WRONGPASS invalid username-password pair")
+                session["authenticated"] = True
+                return "OK"
+            if self.password and not session.get("authenticated"):
+                raise ValueError("NOAUTH Authentication required.")
+            if name == "PING":
+                return "PONG"
+            if name == "SELECT":
+                return "OK"
+            if name == "GET":
+                return self._live(args[1])
+            if name == "MGET":
+                return [self._live(key) for key in args[1:]]
+            if name == "SET":
+                expires_at = None
+                options = [arg.decode().upper() for arg in args[3:]]
+                for i, option in enumerate(options):
+                    if option == "EX":
+                        expires_at = time.time() + int(options[i + 1])
+                    elif option == "PX":
+                        expires_at = time.time() + int(options[i + 1]) / 1000
+                self._data[args[1]] = (args[2], expires_at)
+                return "OK"
+            if name == "DEL":
+                removed = 0
+                for key in args[1:]:
+                    if self._live(key) is not None:
+                        del self._data[key]
+                        removed += 1
+                return removed
+            if name == "EXISTS":
+                return sum(self._live(key) is not None for key in args[1:])
+            if name == "TTL":
+                if self._live(args[1]) is None:
+                    return -2
+                expires_at = self._data[args[1]][1]
+                return -1 if expires_at is None else int(expires_at - time.time())
+            if name == "SCAN":
+                # The whole keyspace in one page
+                pattern = "*"
+                options = [arg.decode() for arg in args[2:]]
+                for i, option in enumerate(options):
+                    if option.upper() == "MATCH":
+                        pattern = options[i + 1]
+                keys = [key for key in list(self._data)
+                        if self._live(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)]
+                return [b"0", keys]
+            if name == "DBSIZE":
+                return sum(self._live(key) is not None for key in list(self._data))
+            if name == "FLUSHDB":
+                self._data.clear()
+                return "OK"
+        raise ValueError(f"ERR unknown command '{name}'")
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                session = {}
+                while True:
+                    args = self._read_command()
+                    if args is None:
+                        return
+                    if server.latency:
+                        time.sleep(server.latency)
+                    if args[0].upper() == b"QUIT":
+                        self.wfile.write(b"+OK\r\n")
+                        return
+                    try:
+                        reply = server.execute(args, session)
+                    except ValueError as e:
+                        self.wfile.write(b"-" + str(e).encode() + b"\r\n")
+                        continue
+                    self.wfile.write(_encode(reply))
+
+            def _read_command(self) -> Optional[List[bytes]]:
+                line = self.rfile.readline()
+                if not line.startswith(b"*"):
+                    return None
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                return args
+
+        return Handler
+
+    def start(self) -> "FakeRedisServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeRedisServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _encode(reply: Any) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, str):
+        return b"+" + reply.encode() + b"\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(_encode(item) for item in reply)
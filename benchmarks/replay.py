@@ -0,0 +1,92 @@
+"""
+Replay of recorded fixtures for the benchmarks.
+
+Fixtures (``benchmarks/fixtures/*.json``) hold a caption payload as returned
+by ``youtube_transcript_api`` and the model responses for it. The payload is
+replayed through a stand-in for ``YouTubeTranscriptApi`` and the responses
+through the fake OpenAI server.
+"""
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+DEFAULT_FIXTURE = FIXTURES_DIR / "fastapi_tutorial.json"
+
+
+def load_fixture(path=DEFAULT_FIXTURE) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def scale_segments(segments: List[Dict[str, Any]], minutes: float) -> List[Dict[str, Any]]:
+    """
+    Repeat (or cut) a caption payload until it covers ``minutes`` of video.
+
+    Repetitions are shifted in time so the result looks like one long video.
+    """
+    target = minutes * 60
+    span = max(segment["start"] + segment["duration"] for segment in segments)
+    scaled = []
+    offset = 0.0
+    while True:
+        for segment in segments:
+            start = segment["start"] + offset
+            if start >= target:
+                return scaled
+            scaled.append({"text": segment["text"], "start": round(start, 2), "duration": segment["duration"]})
+        offset += span
+
+
+class _ReplayedTranscript:
+    """Quacks like youtube_transcript_api's FetchedTranscript."""
+
+    def __init__(self, segments: List[Dict[str, Any]], language_code: str):
+        self._segments = segments
+        self.language_code = language_code
+
+    def to_raw_data(self) -> List[Dict[str, Any]]:
+        return [dict(segment) for segment in self._segments]
+
+
+class ReplayTranscriptApi:
+    """
+    Stand-in for ``YouTubeTranscriptApi`` serving recorded payloads.
+
+    Args:
+        payloads: video_id -> (segments, language_code)
+        latency: Seconds each fetch takes, like a round trip to YouTube
+    """
+
+    def __init__(self, payloads: Optional[Dict[str, tuple]] = None, latency: float = 0.0):
+        self.payloads = payloads if payloads is not None else {}
+        self.latency = latency
+        self.fetch_count = 0
+
+    def __call__(self) -> "ReplayTranscriptApi":
+        # utils.transcript instantiates the API class for every fetch
+        return self
+
+    def fetch(self, video_id: str, languages=("en",)) -> _ReplayedTranscript:
+        from youtube_transcript_api._errors import NoTranscriptFound
+
+        time.sleep(self.latency)
+        self.fetch_count += 1
+        if video_id not in self.payloads:
+            raise NoTranscriptFound(video_id, list(languages), None)
+        segments, language_code = self.payloads[video_id]
+        return _ReplayedTranscript(segments, language_code)
+
+
+def fixture_responder(responses: Dict[str, Any]) -> Callable[[dict], str]:
+    """Answer each kind of chat completion with the fixture's response for it."""
+    def respond(request: dict) -> str:
+        response_type = (request.get("response_format") or {}).get("type")
+        if response_type == "json_schema":
+            return json.dumps(responses["structured"], ensure_ascii=False)
+        if response_type == "json_object":
+            return json.dumps(responses["actions"], ensure_ascii=False)
+        return responses["summary"]
+    return respond
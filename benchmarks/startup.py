@@ -0,0 +1,129 @@
+"""
+Startup cost of the app's modules: how long a fresh interpreter takes to
+import them, and what importing them loads or creates.
+
+Each run imports a module in a new process under ``python -X importtime``,
+with CACHE_DIR pointing at a directory that does not exist yet. Importing
+must not load the dependencies deferred to first use (DEFERRED_MODULES) or
+create the cache directory; either is reported as a problem. Entry points
+load ``.env`` before anything else, so only utils modules are also held to
+not loading python-dotenv. The suite (benchmarks/suite.py) records the
+import times as ``startup/<module>`` cases and compares them with its
+baseline.
+
+Usage:
+    python -m benchmarks.startup [utils.pipeline batch] [--repeat 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# What app.py and batch.py import before serving anything
+STARTUP_MODULES = ("utils.pipeline", "batch")
+
+# Loaded on first real use only: a request that misses the cache
+DEFERRED_MODULES = ("openai", "httpx", "youtube_transcript_api")
+
+_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def import_once(module: str) -> Tuple[float, List[Tuple[str, int, int]], bool]:
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        (seconds, [(imported module, self us, cumulative us)], whether CACHE_DIR was created)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, "cache")
+        env = dict(os.environ, CACHE_DIR=cache_dir, PYTHONPATH=str(REPO_ROOT), METRICS_PORT="0")
+        for name in ("JOBS_DB", "SEARCH_DB", "CACHE_MANIFEST_DB", "CACHE_DICT_DIR"):
+            env.pop(name, None)
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", _SCRIPT.format(module=module)],
+                                cwd=tmp, env=env, capture_output=True, text=True, check=True)
+        created = os.path.exists(cache_dir)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return float(result.stdout.strip().splitlines()[-1]), imports, created
+
+
+def check(module: str, imports: List[Tuple[str, int, int]], created: bool) -> List[str]:
+    """Problems found while importing a module."""
+    problems = []
+    loaded = {name.split(".")[0] for name, _, _ in imports}
+    deferred_modules = DEFERRED_MODULES + (("dotenv",) if module.startswith("utils.") else ())
+    for deferred in deferred_modules:
+        if deferred in loaded:
+            problems.append(f"{module}: imports {deferred} at startup")
+    if created:
+        problems.append(f"{module}: creates CACHE_DIR on import")
+    return problems
+
+
+def measure_startup(modules=STARTUP_MODULES, repeat: int = 5) -> Tuple[Dict[str, Dict[str, float]], List[str]]:
+    """
+    Time the import of each module.
+
+    Returns:
+        (``{"startup/<module>": timings}`` in the suite's format, problems found)
+    """
+    results = {}
+    problems = []
+    for module in modules:
+        timings = []
+        for _ in range(repeat):
+            seconds, imports, created = import_once(module)
+            timings.append(seconds * 1000)
+        problems.extend(check(module, imports, created))
+        results[f"startup/{module}"] = {
+            "median_ms": round(statistics.median(timings), 3),
+            "min_ms": round(min(timings), 3),
+            "max_ms": round(max(timings), 3),
+            "runs": repeat,
+        }
+    return results, problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(STARTUP_MODULES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list per module")
+    args = parser.parse_args(argv)
+
+    results, problems = measure_startup(args.modules, args.repeat)
+    for module in args.modules:
+        print(f"{module}: {results[f'startup/{module}']['median_ms']:.1f} ms (median of {args.repeat})")
+        _, imports, _ = import_once(module)
+        # Top-level packages by cumulative time of their own first import
+        packages: Dict[str, int] = {}
+        for name, _, cumulative_us in imports:
+            package = name.split(".")[0]
+            packages[package] = max(packages.get(package, 0), cumulative_us)
+        for package, cumulative_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {cumulative_us / 1000:8.1f} ms  {package}")
+    for problem in problems:
+        print(f"PROBLEM {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+Offline benchmark suite for the transcript/analysis pipeline.
+
+Replays a recorded caption payload (scaled from 1 minute to 3 hours) through
+a YouTubeTranscriptApi stand-in and recorded chat completions through the
+fake OpenAI server, in a throwaway cache directory, and measures:
+
+- ``cold``: nothing cached; fetch, analyze and write every cache
+- ``warm_file``: in-process tier dropped; served from the file cache
+- ``memory_hit``: served from the in-process tier
+- ``json_parse``: cached transcript and analysis entry decode (decompress and parse)
+- ``render_prep``: what app.py computes before drawing the results page
+- ``startup``: importing the pipeline and batch.py in a fresh interpreter
+  (benchmarks/startup.py); loading a deferred dependency or creating the
+  cache directory on import counts as a regression
+
+Results are written as JSON and can be compared with a saved baseline.
+
+Usage:
+    python -m benchmarks.suite -o benchmark_results.json
+    python -m benchmarks.suite --baseline baseline.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.replay import DEFAULT_FIXTURE, ReplayTranscriptApi, fixture_responder, load_fixture, scale_segments
+from benchmarks.startup import measure_startup
+
+
+DURATIONS_MINUTES = (1, 10, 60, 180)
+
+
+def _measure(run: Callable[[], None], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "runs": repeat,
+    }
+
+
+def run_suite(fixture: dict, durations, repeat: int, openai_latency: float,
+              youtube_latency: float) -> Dict[str, Dict[str, float]]:
+    """Run every case for every duration; returns ``{"case/<n>m": timings}``."""
+    # Imported here so CACHE_DIR and the OpenAI settings apply (see main())
+    from utils import openai_api, pipeline, transcript as transcript_module
+    from utils.analysis import Analysis
+    from utils.cache import compressor
+    from utils.cache_backends import Entry
+    from utils.format import format_summary_html
+    from utils.memory_cache import memory_cache
+    from utils.preprocess import compaction_stats
+    from utils.transcript import Transcript
+
+    replay = ReplayTranscriptApi(latency=youtube_latency)
+    transcript_module.YouTubeTranscriptApi = replay
+    language = fixture.get("language", "en")
+    results = {}
+
+    with FakeOpenAIServer(json_delay=openai_latency, text_delay=openai_latency,
+                          responder=fixture_responder(fixture["responses"])) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+        openai_api.refresh_openai_client()
+
+        for minutes in durations:
+            segments = scale_segments(fixture["segments"], minutes)
+            label = f"{minutes}m"
+            cold_ids = iter(range(repeat))
+
+            def cold():
+                video_id = f"bench{minutes}m{next(cold_ids)}"
+                replay.payloads[video_id] = (segments, language)
+                transcript = pipeline.get_cached_transcript(video_id)
+                pipeline.get_cached_analysis(video_id, transcript)
+
+            video_id = f"bench{minutes}m0"
+
+            def warm_file():
+                memory_cache.discard()
+                transcript = pipeline.get_cached_transcript(video_id)
+                pipeline.get_cached_analysis(video_id, transcript)
+
+            def memory_hit():
+                transcript = pipeline.get_cached_transcript(video_id)
+                pipeline.get_cached_analysis(video_id, transcript)
+
+            results[f"cold/{label}"] = _measure(cold, repeat)
+            results[f"warm_file/{label}"] = _measure(warm_file, repeat)
+            results[f"memory_hit/{label}"] = _measure(memory_hit, repeat)
+
+            transcript = pipeline.get_cached_transcript(video_id)
+            analysis = pipeline.get_cached_analysis(video_id, transcript)
+            # Entries as stored: header line and compressed body
+            transcript_entry = Entry.create('transcript', video_id, transcript.to_dict(), 0,
+                                            compressor).encode('transcript')
+            analysis_entry = Entry.create('analysis', video_id, analysis.to_dict(), 0,
+                                          compressor).encode('analysis')
+
+            def json_parse():
+                Transcript.from_dict(Entry.decode(transcript_entry, video_id, compressor).data)
+                Analysis.from_dict(Entry.decode(analysis_entry, video_id, compressor).data)
+
+            def render_prep():
+                [(step.timestamp, step.text) for step in analysis.steps]
+                [(tool.timestamp, tool.name) for tool in analysis.tools]
+                format_summary_html(analysis.summary)
+                compaction_stats(transcript)
+                len(transcript.text.split())
+
+            results[f"json_parse/{label}"] = _measure(json_parse, repeat)
+            results[f"render_prep/{label}"] = _measure(render_prep, repeat)
+            print(f"{label:>5}: " + "  ".join(
+                f"{case} {results[f'{case}/{label}']['median_ms']:.1f}ms"
+                for case in ("cold", "warm_file", "memory_hit", "json_parse", "render_prep")
+            ), file=sys.stderr)
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """
+    Print current vs baseline medians.
+
+    Returns:
+        Names of cases whose median grew by more than ``threshold`` (e.g. 0.2 = 20%)
+    """
+    regressions = []
+    print(f"{'case':<22} {'baseline':>12} {'current':>12} {'change':>8}")
+    for case, timings in results.items():
+        before = baseline.get(case, {}).get("median_ms")
+        current = timings["median_ms"]
+        if not before:
+            print(f"{case:<22} {'-':>12} {current:>10.2f}ms {'new':>8}")
+            continue
+        change = current / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(case)
+            flag = "  REGRESSION"
+        print(f"{case:<22} {before:>10.2f}ms {current:>10.2f}ms {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite (recorded fixtures, stand-in servers).")
+    parser.add_argument("--fixture", default=str(DEFAULT_FIXTURE))
+    parser.add_argument("--durations", default=",".join(str(m) for m in DURATIONS_MINUTES),
+                        help="Transcript lengths in minutes, comma-separated")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--openai-latency", type=float, default=0.05, help="Seconds per chat completion")
+    parser.add_argument("--youtube-latency", type=float, default=0.05, help="Seconds per transcript fetch")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="Results file (JSON)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    # Isolated cache and search index; must be set before utils is imported
+    cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+    os.environ["CACHE_DIR"] = cache_dir
+    os.environ.pop("SEARCH_DB", None)
+
+    durations = [float(m) if "." in m else int(m) for m in args.durations.split(",") if m]
+    try:
+        results = run_suite(load_fixture(args.fixture), durations, args.repeat,
+                            args.openai_latency, args.youtube_latency)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    startup, startup_problems = measure_startup(repeat=args.repeat)
+    results.update(startup)
+    for problem in startup_problems:
+        print(f"Startup: {problem}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fixture": os.path.basename(args.fixture),
+            "repeat": args.repeat,
+            "openai_latency": args.openai_latency,
+            "youtube_latency": args.youtube_latency,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    if startup_problems and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
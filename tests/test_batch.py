@@ -0,0 +1,51 @@
+"""
+Tests for resuming a batch run from a crashed output file.
+
+Run with:
+    python -m unittest discover -s tests
+"""
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import batch
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.output = self.directory / "results.jsonl"
+        done = json.dumps({"video_id": "dQw4w9WgXcQ", "status": "ok", "summary": "Café crème ☕"},
+                          ensure_ascii=False)
+        partial = json.dumps({"video_id": "9bZkp7q19f0", "status": "ok", "summary": "Résumé ☕"},
+                             ensure_ascii=False).encode("utf-8")
+        # Cut the last line inside the three-byte encoding of ☕
+        cut = partial.index("☕".encode("utf-8")) + 1
+        self.output.write_bytes(done.encode("utf-8") + b"\n" + partial[:cut])
+
+    def test_completed_ids_skip_line_cut_mid_character(self):
+        self.assertEqual(batch.completed_video_ids(self.output), {"dQw4w9WgXcQ"})
+
+    def test_partial_line_is_terminated(self):
+        batch.terminate_partial_line(self.output)
+        data = self.output.read_bytes()
+        self.assertTrue(data.endswith(b"\n"))
+        batch.terminate_partial_line(self.output)
+        self.assertEqual(self.output.read_bytes(), data)
+
+    def test_resume_from_file_cut_mid_character(self):
+        urls = self.directory / "urls.txt"
+        urls.write_text("https://www.youtube.com/watch?v=dQw4w9WgXcQ\n", encoding="utf-8")
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            self.assertEqual(batch.main([str(urls), "-o", str(self.output)]), 0)
+        self.assertIn("skipping 1 already processed", stderr.getvalue())
+        self.assertTrue(self.output.read_bytes().endswith(b"\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
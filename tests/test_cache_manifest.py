@@ -0,0 +1,63 @@
+"""
+Tests for rebuilding the file cache manifest from a directory scan.
+
+Run with:
+    python -m unittest discover -s tests
+"""
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from utils.cache_manifest import CacheManifest
+
+
+class RebuildTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "manifest.sqlite3")
+        self.manifest = CacheManifest(self.path)
+        self.old = time.time() - 3600
+
+    def keys(self):
+        return sorted(entry['key'] for entry in self.manifest.entries())
+
+    def test_rows_missing_from_disk_are_removed(self):
+        self.manifest.record('transcript', 'a', 'kept', 10, self.old)
+        self.manifest.record('transcript', 'b', 'gone', 10, self.old)
+        time.sleep(0.01)
+        self.manifest.rebuild([('transcript', 'a', 'kept', 10, self.old, self.old)])
+        self.assertEqual(self.keys(), ['kept'])
+        self.assertEqual(self.manifest.totals(), {'transcript': (1, 10)})
+
+    def test_row_recorded_during_scan_is_kept_despite_old_timestamp(self):
+        def scan():
+            yield ('transcript', 'a', 'scanned', 10, self.old, self.old)
+            # A copy written with its original timestamp after the scanner passed its directory
+            self.manifest.record('analysis', 'c', 'copied', 20, self.old)
+
+        self.manifest.rebuild(scan())
+        self.assertEqual(self.keys(), ['copied', 'scanned'])
+
+    def test_manifest_without_recorded_column_is_migrated(self):
+        connection = sqlite3.connect(self.path)
+        connection.executescript(
+            "CREATE TABLE entries (cache_type TEXT NOT NULL, digest TEXT NOT NULL, key TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL, "
+            "PRIMARY KEY (cache_type, digest)) WITHOUT ROWID;"
+        )
+        connection.execute("INSERT INTO entries VALUES ('transcript', 'a', 'legacy', 10, ?, ?)",
+                           (self.old, self.old))
+        connection.commit()
+        connection.close()
+
+        manifest = CacheManifest(self.path)
+        manifest.record('transcript', 'b', 'new', 10, self.old)
+        manifest.rebuild([('transcript', 'b', 'new', 10, self.old, self.old)])
+        self.assertEqual(sorted(entry['key'] for entry in manifest.entries()), ['new'])
+
+
+if __name__ == "__main__":
+    unittest.main()
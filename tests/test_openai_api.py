@@ -0,0 +1,313 @@
+"""
+Tests for transcript chunking and the merge of per-window analyses.
+
+Run with:
+    python -m unittest discover -s tests
+"""
+import json
+import re
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from utils import openai_api
+from utils.rate_limit import OpenAIScheduler
+
+
+def words(count: int, prefix: str = "w") -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+class StubClient:
+    """
+    OpenAI-compatible client answering chat completions from a function.
+
+    ``respond(prompt, kwargs)`` returns the message content or raises.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.prompts = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, timeout=None, **kwargs):
+        prompt = messages[-1]["content"]
+        with self._lock:
+            self.prompts.append(prompt)
+        content = self.respond(prompt, kwargs)
+        if kwargs.get("stream"):
+            return iter([
+                SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 16]))],
+                                usage=None)
+                for i in range(0, len(content), 16)
+            ])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+def unique_step(part: int) -> str:
+    """A step that is not similar to the step of any other part."""
+    return ("Install", "Configure", "Deploy", "Monitor", "Rollback", "Archive", "Document", "Review")[part - 1]
+
+
+def part_of(prompt: str) -> int:
+    return int(re.search(r"This is part (\d+) of", prompt).group(1))
+
+
+class SplitTranscriptTest(unittest.TestCase):
+    def test_short_transcript_is_one_window(self):
+        text = words(50)
+        self.assertEqual(openai_api.split_transcript(text, max_tokens=1000, overlap_tokens=10), [text])
+
+    def test_empty_transcript_has_no_windows(self):
+        self.assertEqual(openai_api.split_transcript("", max_tokens=100, overlap_tokens=10), [])
+        self.assertEqual(openai_api.split_transcript("   ", max_tokens=100, overlap_tokens=10), [])
+
+    def test_windows_respect_budget_and_word_boundaries(self):
+        text = words(2000)
+        max_tokens = 100
+        chunks = openai_api.split_transcript(text, max_tokens=max_tokens, overlap_tokens=20)
+        self.assertGreater(len(chunks), 1)
+        vocabulary = set(text.split())
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), max_tokens * openai_api.CHARS_PER_TOKEN)
+            # No word is cut in half at either end of a window
+            self.assertTrue(set(chunk.split()) <= vocabulary)
+
+    def test_windows_cover_transcript_in_order(self):
+        text = words(2000)
+        chunks = openai_api.split_transcript(text, max_tokens=100, overlap_tokens=20)
+        self.assertTrue(text.startswith(chunks[0]))
+        self.assertTrue(text.endswith(chunks[-1]))
+        covered = []
+        for chunk in chunks:
+            for word in chunk.split():
+                if not covered or int(word[1:]) > int(covered[-1][1:]):
+                    covered.append(word)
+        self.assertEqual(covered, text.split())
+
+    def test_consecutive_windows_overlap(self):
+        text = words(2000)
+        overlap_tokens = 20
+        chunks = openai_api.split_transcript(text, max_tokens=100, overlap_tokens=overlap_tokens)
+        for previous, current in zip(chunks, chunks[1:]):
+            previous_words = previous.split()
+            current_words = current.split()
+            shared = previous_words[previous_words.index(current_words[0]):]
+            self.assertEqual(current_words[:len(shared)], shared)
+            # Roughly overlap_tokens worth of characters, give or take a word
+            shared_chars = len(" ".join(shared))
+            self.assertGreater(shared_chars, overlap_tokens * openai_api.CHARS_PER_TOKEN - 10)
+            self.assertLessEqual(shared_chars, overlap_tokens * openai_api.CHARS_PER_TOKEN)
+
+    def test_overlap_is_capped_at_half_a_window(self):
+        text = words(500)
+        chunks = openai_api.split_transcript(text, max_tokens=50, overlap_tokens=500)
+        self.assertGreater(len(chunks), 1)
+        # Every window still makes progress through the transcript
+        starts = [text.index(chunk) for chunk in chunks]
+        self.assertEqual(starts, sorted(set(starts)))
+
+    def test_word_longer_than_window_is_split(self):
+        text = "x" * 50
+        chunks = openai_api.split_transcript(text, max_tokens=5, overlap_tokens=0)
+        self.assertEqual("".join(chunks), text)
+
+
+class MergeChunkResultsTest(unittest.TestCase):
+    def test_duplicate_step_from_overlap_is_dropped(self):
+        merged = openai_api.merge_chunk_results([
+            {"steps": [{"step": "Install the package"}, {"step": "Create a config file"}]},
+            {"steps": [{"step": "Create a config file."}, {"step": "Run the server"}]},
+        ])
+        self.assertEqual([step["step"] for step in merged["steps"]],
+                         ["Install the package", "Create a config file", "Run the server"])
+
+    def test_similarity_threshold(self):
+        kept = "Open the settings page and enable dark mode"
+        near = "Open the settings page and enable the dark mode"
+        different = "Close the settings page and restart the app"
+        normalize = openai_api._normalize_text
+        self.assertGreaterEqual(
+            openai_api.SequenceMatcher(None, normalize(near), normalize(kept)).ratio(),
+            openai_api.STEP_SIMILARITY_THRESHOLD)
+        self.assertLess(
+            openai_api.SequenceMatcher(None, normalize(different), normalize(kept)).ratio(),
+            openai_api.STEP_SIMILARITY_THRESHOLD)
+
+        merged = openai_api.merge_chunk_results([
+            {"steps": [{"step": kept}]},
+            {"steps": [{"step": near}, {"step": different}]},
+        ])
+        self.assertEqual([step["step"] for step in merged["steps"]], [kept, different])
+
+    def test_only_recent_steps_are_compared(self):
+        # A step repeated long after its first occurrence is a real repeat, not overlap
+        steps = [{"step": text} for text in (
+            "Install Python", "Create a virtual environment", "Clone the repository",
+            "Copy the example env file", "Add your API key", "Install the requirements",
+            "Run the migrations", "Start the development server", "Open the browser",
+            "Log in as admin", "Deploy to production")]
+        merged = openai_api.merge_chunk_results([
+            {"steps": steps},
+            {"steps": [{"step": steps[0]["step"]}]},
+        ])
+        self.assertEqual(len(merged["steps"]), 12)
+
+    def test_steps_keep_window_order_and_skip_invalid(self):
+        merged = openai_api.merge_chunk_results([
+            {"steps": [{"step": "First"}, "not a dict", {"step": ""}]},
+            {"steps": None},
+            {"steps": [{"step": "Second"}]},
+        ])
+        self.assertEqual([step["step"] for step in merged["steps"]], ["First", "Second"])
+
+    def test_tools_are_merged_across_windows(self):
+        merged = openai_api.merge_chunk_results([
+            {"tools": [{"name": "Docker", "purpose": "", "context": "containers"}]},
+            {"tools": [{"name": "docker!", "purpose": "run the app", "context": "other"},
+                       {"name": "Redis", "purpose": "cache"}]},
+            {"tools": [{"name": ""}, "Redis"]},
+        ])
+        self.assertEqual(merged["tools"], [
+            {"name": "Docker", "purpose": "run the app", "context": "containers"},
+            {"name": "Redis", "purpose": "cache"},
+        ])
+
+    def test_input_results_are_not_modified(self):
+        first = {"name": "Docker", "purpose": ""}
+        openai_api.merge_chunk_results([{"tools": [first]}, {"tools": [{"name": "Docker", "purpose": "x"}]}])
+        self.assertEqual(first, {"name": "Docker", "purpose": ""})
+
+
+class ExtractActionsAndSummaryTest(unittest.TestCase):
+    def setUp(self):
+        # Generous limits so the tests never wait on the shared scheduler
+        patches = [
+            mock.patch.object(openai_api, "scheduler", OpenAIScheduler(1e9, 1e12)),
+            mock.patch.object(openai_api, "PREPROCESS_ENABLED", False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        # Small windows so a short transcript spans many of them
+        split = openai_api.split_transcript
+        patch = mock.patch.object(openai_api, "split_transcript",
+                                  lambda text, max_tokens=100, overlap_tokens=10: split(text, max_tokens, overlap_tokens))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_windows_are_merged_in_order(self):
+        def respond(prompt, kwargs):
+            if kwargs.get("response_format"):
+                part = part_of(prompt)
+                return json.dumps({
+                    "steps": [{"step": "Shared setup step"}, {"step": unique_step(part)}],
+                    "tools": [{"name": "Git", "purpose": f"part {part}" if part == 2 else ""}],
+                })
+            return "A summary"
+
+        client = StubClient(respond)
+        text = words(300)
+        actions, summary = openai_api.extract_actions_and_summary(text, client=client)
+        total = len(openai_api.split_transcript(text))
+        self.assertTrue(2 < total <= 8)
+
+        merged = json.loads(actions)
+        self.assertEqual(summary, "A summary")
+        self.assertEqual(len(client.prompts), total + 1)
+        self.assertEqual([step["step"] for step in merged["steps"]],
+                         ["Shared setup step"] + [unique_step(part) for part in range(1, total + 1)])
+        self.assertEqual([tool["name"] for tool in merged["tools"]], ["Git"])
+        self.assertEqual(merged["tools"][0]["purpose"], "part 2")
+
+    def test_first_failure_cancels_queued_windows(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def respond(prompt, kwargs):
+            if not kwargs.get("response_format"):
+                return "A summary"
+            if part_of(prompt) == 1:
+                raise RuntimeError("window 1 failed")
+            release.wait(10)
+            return json.dumps({"steps": [], "tools": []})
+
+        client = StubClient(respond)
+        text = words(5000)
+        total = len(openai_api.split_transcript(text))
+        self.assertGreater(total, openai_api.MAX_PARALLEL_CHUNKS * 3)
+
+        with self.assertRaisesRegex(RuntimeError, "window 1 failed"):
+            openai_api.extract_actions_and_summary(text, client=client)
+        started = len(client.prompts)
+        release.set()
+
+        # Only the windows already running (plus a worker that freed up before
+        # the pool was shut down) were sent; the rest were cancelled
+        self.assertLessEqual(started, openai_api.MAX_PARALLEL_CHUNKS + 3)
+        self.assertLess(started, total)
+
+
+class SingleCallSummaryTest(unittest.TestCase):
+    REDUCED = "• Sets up the project\n• Deploys it\n• Monitors it"
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(openai_api, "scheduler", OpenAIScheduler(1e9, 1e12)),
+            mock.patch.object(openai_api, "PREPROCESS_ENABLED", False),
+            mock.patch.object(openai_api, "SINGLE_CALL_CHUNK_TOKENS", 100),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def respond(self, prompt, kwargs):
+        if kwargs.get("response_format"):
+            part = part_of(prompt)
+            return json.dumps({
+                "steps": [{"step": unique_step(part), "code": "", "tool_context": "", "segment": 0}],
+                "tools": [],
+                "summary": "\n".join(f"• Part {part} point {point}" for point in range(1, 4)),
+            })
+        return self.REDUCED
+
+    def assert_one_summary(self, client, summary, windows):
+        self.assertEqual(summary, self.REDUCED)
+        self.assertEqual(summary.count("•"), 3)
+        # Every window, then one request condensing their summaries
+        self.assertEqual(len(client.prompts), windows + 1)
+        reduce_prompt = client.prompts[-1]
+        for part in range(1, windows + 1):
+            self.assertIn(f"• Part {part} point 1", reduce_prompt)
+
+    def test_multi_window_run_returns_one_summary(self):
+        client = StubClient(self.respond)
+        text = words(300)
+        windows = len(openai_api.split_transcript(text, max_tokens=100))
+        self.assertGreater(windows, 1)
+        _, summary = openai_api.extract_actions_and_summary(
+            text, client=client, mode=openai_api.ANALYSIS_MODE_SINGLE_CALL)
+        self.assert_one_summary(client, summary, windows)
+
+    def test_streamed_multi_window_run_returns_one_summary(self):
+        client = StubClient(self.respond)
+        text = words(300)
+        windows = len(openai_api.split_transcript(text, max_tokens=100))
+        events = list(openai_api.stream_actions_and_summary(
+            text, client=client, mode=openai_api.ANALYSIS_MODE_SINGLE_CALL))
+        _, summary = events[-1][1]
+        self.assertEqual("".join(payload for kind, payload in events if kind == "summary"), summary)
+        self.assert_one_summary(client, summary, windows)
+
+    def test_single_window_summary_is_used_as_is(self):
+        client = StubClient(self.respond)
+        _, summary = openai_api.extract_actions_and_summary(
+            words(20), client=client, mode=openai_api.ANALYSIS_MODE_SINGLE_CALL)
+        self.assertEqual(summary, "\n".join(f"• Part 1 point {point}" for point in range(1, 4)))
+        self.assertEqual(len(client.prompts), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+Tests for rolling-caption removal before prompting.
+
+Run with:
+    python -m unittest discover -s tests
+"""
+import unittest
+
+from utils.preprocess import preprocess_transcript
+from utils.transcript import Transcript
+
+
+def compact(*texts: str) -> str:
+    segments = [{"text": text, "start": float(i), "duration": 1.0} for i, text in enumerate(texts)]
+    return " ".join(segment["text"] for segment in preprocess_transcript(Transcript.from_segments(segments)).segments())
+
+
+class RollingCaptionTest(unittest.TestCase):
+    def test_repeated_phrase_is_removed(self):
+        self.assertEqual(compact("so first we open the", "open the terminal and run"),
+                         "so first we open the terminal and run")
+
+    def test_single_repeated_word_is_kept(self):
+        self.assertEqual(compact("it is very", "very important to save"),
+                         "it is very very important to save")
+        self.assertEqual(compact("I think that", "that works"), "I think that that works")
+
+    def test_overlap_ignores_case_and_punctuation(self):
+        self.assertEqual(compact("click on Save, then", "save then close it"),
+                         "click on Save, then close it")
+
+
+if __name__ == "__main__":
+    unittest.main()
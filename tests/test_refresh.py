@@ -0,0 +1,67 @@
+"""
+Tests for background refresh of stale cache entries.
+
+Run with:
+    python -m unittest discover -s tests
+"""
+import threading
+import time
+import unittest
+
+from utils.refresh import BackgroundRefresher
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BackgroundRefresherTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.refresher = BackgroundRefresher(workers=1, retry_after=60, clock=self.clock)
+        self.calls = 0
+
+    def refresh_and_wait(self, fn) -> bool:
+        def refresh():
+            self.calls += 1
+            fn()
+
+        queued = self.refresher.submit('transcript', 'key', refresh)
+        deadline = time.monotonic() + 5
+        while self.refresher.stats()['pending'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return queued
+
+    def fail(self):
+        raise RuntimeError("blocked")
+
+    def test_failed_key_backs_off(self):
+        self.assertTrue(self.refresh_and_wait(self.fail))
+        self.assertFalse(self.refresh_and_wait(lambda: None))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.refresher.stats()['backed_off'], 1)
+        self.assertEqual(self.refresher.stats()['backing_off'], 1)
+
+        self.clock.now += 61
+        self.assertTrue(self.refresh_and_wait(lambda: None))
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.refresher.stats()['backing_off'], 0)
+
+    def test_success_does_not_back_off(self):
+        self.assertTrue(self.refresh_and_wait(lambda: None))
+        self.assertTrue(self.refresh_and_wait(lambda: None))
+        self.assertEqual(self.calls, 2)
+
+    def test_backoff_is_per_key(self):
+        self.assertTrue(self.refresh_and_wait(self.fail))
+        done = threading.Event()
+        self.assertTrue(self.refresher.submit('analysis', 'key', done.set))
+        self.assertTrue(done.wait(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
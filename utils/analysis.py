@@ -0,0 +1,223 @@
+"""
+Validated, typed form of an analysis (steps, tools and summary).
+
+The model's actions JSON is checked and repaired once, when the analysis is
+written to the cache; the cache stores the result in a compact row encoding,
+so a cache hit yields ready-to-render objects without any JSON re-parsing.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.format import format_timestamp
+
+
+_TIMESTAMP_RE = re.compile(r"^\s*(?:(\d+):)?(\d{1,2}):(\d{2})\s*$")
+
+
+def _text(value: Any) -> Tuple[str, bool]:
+    """Coerce a field to a stripped string; the flag says whether it needed repair."""
+    if isinstance(value, str):
+        return value.strip(), False
+    if value is None:
+        return "", False
+    if isinstance(value, (list, tuple)):
+        return "\n".join(str(item) for item in value).strip(), True
+    return str(value).strip(), True
+
+
+def _start(item: Dict[str, Any]) -> Tuple[Optional[float], bool]:
+    """Start time in seconds from ``start`` or, for older analyses, the ``mm:ss`` timestamp."""
+    start = item.get("start")
+    if isinstance(start, (int, float)) and not isinstance(start, bool) and start >= 0:
+        return float(start), False
+    match = _TIMESTAMP_RE.match(str(item.get("timestamp") or ""))
+    if match:
+        hours, minutes, seconds = (int(group or 0) for group in match.groups())
+        return float(hours * 3600 + minutes * 60 + seconds), start is not None
+    return None, start is not None
+
+
+def _to_ms(start: Optional[float]) -> Optional[int]:
+    return None if start is None else int(round(start * 1000))
+
+
+def _from_ms(start_ms: Optional[int]) -> Optional[float]:
+    return None if start_ms is None else start_ms / 1000
+
+
+class Step:
+    """One actionable step; ``start`` is in seconds (None if the model cited no segment)."""
+
+    __slots__ = ("text", "code", "tool_context", "start")
+
+    def __init__(self, text: str, code: str = "", tool_context: str = "", start: Optional[float] = None):
+        self.text = text
+        self.code = code
+        self.tool_context = tool_context
+        self.start = start
+
+    @property
+    def timestamp(self) -> str:
+        return "N/A" if self.start is None else format_timestamp(self.start)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Same shape as a step of the actions JSON."""
+        step = {"step": self.text, "code": self.code, "tool_context": self.tool_context,
+                "timestamp": self.timestamp}
+        if self.start is not None:
+            step["start"] = self.start
+        return step
+
+    def __repr__(self) -> str:
+        return f"Step({self.timestamp}, {self.text[:40]!r})"
+
+
+class Tool:
+    """A tool or technology discussed in the video."""
+
+    __slots__ = ("name", "purpose", "context", "usage", "start")
+
+    def __init__(self, name: str, purpose: str = "", context: str = "", usage: str = "",
+                 start: Optional[float] = None):
+        self.name = name
+        self.purpose = purpose
+        self.context = context
+        self.usage = usage
+        self.start = start
+
+    @property
+    def timestamp(self) -> str:
+        return "N/A" if self.start is None else format_timestamp(self.start)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Same shape as a tool of the actions JSON."""
+        tool = {"name": self.name, "purpose": self.purpose, "context": self.context,
+                "usage": self.usage, "timestamp": self.timestamp}
+        if self.start is not None:
+            tool["start"] = self.start
+        return tool
+
+    def __repr__(self) -> str:
+        return f"Tool({self.name!r})"
+
+
+class Analysis:
+    """
+    Steps, tools and summary of one video.
+
+    Build it from a model response with from_response(), which validates and
+    repairs the actions JSON, or from its cached form with from_dict().
+    ``repairs`` counts the fixes from_response() had to make; ``stale`` is
+    set by the pipeline on a cached copy served past its soft TTL.
+    """
+
+    __slots__ = ("steps", "tools", "summary", "repairs", "stale")
+
+    def __init__(self, steps: Tuple[Step, ...], tools: Tuple[Tool, ...], summary: str, repairs: int = 0):
+        self.steps = steps
+        self.tools = tools
+        self.summary = summary
+        self.repairs = repairs
+        self.stale = False
+
+    @classmethod
+    def from_response(cls, actions_json: str, summary: str) -> "Analysis":
+        """
+        Validate and repair the (actions JSON, summary) pair produced by openai_api.
+
+        Items that are not objects or have no step text / tool name are
+        dropped, non-string fields are coerced to strings, and a missing
+        ``start`` is recovered from an ``mm:ss`` timestamp where possible.
+
+        Args:
+            actions_json: Actions JSON string with ``steps`` and ``tools``
+            summary: Summary text
+
+        Returns:
+            Analysis
+
+        Raises:
+            ValueError: If the actions are not a JSON document, or the summary
+                is not text
+        """
+        try:
+            data = json.loads(actions_json)
+        except (json.JSONDecodeError, TypeError) as e:
+            raise ValueError(f"Malformed actions JSON: {e}")
+        if not isinstance(summary, str):
+            raise ValueError(f"Malformed summary: expected text, got {type(summary).__name__}")
+
+        repairs = 0
+        if isinstance(data, list):
+            data = {"steps": data, "tools": []}
+            repairs += 1
+        if not isinstance(data, dict):
+            raise ValueError(f"Malformed actions JSON: expected an object, got {type(data).__name__}")
+
+        items = {}
+        for field in ("steps", "tools"):
+            value = data.get(field)
+            if value is None:
+                value = []
+            elif not isinstance(value, list):
+                value = []
+                repairs += 1
+            items[field] = value
+
+        steps = []
+        for item in items["steps"]:
+            if not isinstance(item, dict):
+                repairs += 1
+                continue
+            fields = [_text(item.get(name)) for name in ("step", "code", "tool_context")]
+            start, start_repaired = _start(item)
+            repairs += sum(repaired for _, repaired in fields) + start_repaired
+            text, code, tool_context = (value for value, _ in fields)
+            if not text:
+                repairs += 1
+                continue
+            steps.append(Step(text, code, tool_context, start))
+
+        tools = []
+        for item in items["tools"]:
+            if not isinstance(item, dict):
+                repairs += 1
+                continue
+            fields = [_text(item.get(name)) for name in ("name", "purpose", "context", "usage")]
+            start, start_repaired = _start(item)
+            repairs += sum(repaired for _, repaired in fields) + start_repaired
+            name, purpose, context, usage = (value for value, _ in fields)
+            if not name:
+                repairs += 1
+                continue
+            tools.append(Tool(name, purpose, context, usage, start))
+
+        return cls(tuple(steps), tuple(tools), summary.strip(), repairs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact, JSON-serializable form used for caching (one row per item, times in ms)."""
+        return {
+            "steps": [[s.text, s.code, s.tool_context, _to_ms(s.start)] for s in self.steps],
+            "tools": [[t.name, t.purpose, t.context, t.usage, _to_ms(t.start)] for t in self.tools],
+            "summary": self.summary,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Analysis":
+        """Rebuild an analysis from its cached form (already validated when written)."""
+        return cls(
+            tuple(Step(text, code, tool_context, _from_ms(start_ms))
+                  for text, code, tool_context, start_ms in data["steps"]),
+            tuple(Tool(name, purpose, context, usage, _from_ms(start_ms))
+                  for name, purpose, context, usage, start_ms in data["tools"]),
+            data["summary"],
+        )
+
+    def actions(self) -> Dict[str, List[Dict[str, Any]]]:
+        """The steps and tools as an actions document (``{"steps": [...], "tools": [...]}``)."""
+        return {"steps": [step.to_dict() for step in self.steps],
+                "tools": [tool.to_dict() for tool in self.tools]}
+
+    def __repr__(self) -> str:
+        return f"Analysis(steps={len(self.steps)}, tools={len(self.tools)})"
@@ -1,126 +1,294 @@
 """
-Local file-based cache system for transcripts and analysis results.
+Persistent cache for transcripts and analysis results.
 Persists across app restarts, unlike Streamlit's in-memory cache.
+
+Entries are stored by a pluggable backend (utils/cache_backends.py), chosen
+with CACHE_BACKEND:
+
+- ``file`` (default): hashed shard files under CACHE_DIR, written atomically
+  and swept in the background; local to this host.
+- ``redis``: a Redis-protocol server at CACHE_REDIS_URL, shared by every
+  replica behind the load balancer.
+- ``tiered``: CACHE_DIR as a near cache in front of the shared server, so
+  hot entries are read locally and every replica sees every result.
+
+Each cache type has a soft TTL, after which an entry is stale, and a hard
+TTL, after which it is gone. Between the two, load_entry() still returns the
+entry (with its age) so callers can serve it while they refresh it.
 """
 import os
-import json
 import time
-from typing import Optional, Any
+import hashlib
+from typing import Optional, Any, Iterable, List, Tuple
 from pathlib import Path
 
+from utils.cache_backends import CacheBackend, Entry, FileBackend, RedisBackend, TieredBackend, entry_path
+from utils.compression import Compressor
+from utils.metrics import metrics
+
+
+# Created by the first write, not on import
+CACHE_DIR = Path(os.getenv("CACHE_DIR", ".cache"))
+
+# Serve entries older than their soft TTL while refreshing them; 0 treats
+# the soft TTL as hard (expired entries are recomputed before serving)
+STALE_WHILE_REVALIDATE = os.getenv("STALE_WHILE_REVALIDATE", "1") == "1"
+
+
+def _ttl(kind: str, cache_type: str, default: int) -> int:
+    return int(os.getenv(f"CACHE_{kind}_TTL_{cache_type.upper()}", str(default)))
+
+
+# Soft TTLs (seconds): entries are fresh up to this age
+CACHE_TTLS = {
+    'transcript': _ttl('SOFT', 'transcript', 3600),
+    'transcript_error': _ttl('SOFT', 'transcript_error', 900),
+    'analysis': _ttl('SOFT', 'analysis', 86400),
+}
+
+# Hard TTLs (seconds): stale entries may be served up to this age; after it
+# the file store's sweeper deletes them and a shared server expires them
+_HARD_TTL_DEFAULTS = {
+    'transcript': 7 * 86400,
+    'transcript_error': 900,
+    'analysis': 30 * 86400,
+}
+CACHE_HARD_TTLS = {
+    cache_type: max(soft_ttl, _ttl('HARD', cache_type, _HARD_TTL_DEFAULTS[cache_type]))
+    if STALE_WHILE_REVALIDATE else soft_ttl
+    for cache_type, soft_ttl in CACHE_TTLS.items()
+}
+
+# Size bounds of the file store; the least recently used entries are evicted past either limit
+CACHE_MAX_BYTES = int(float(os.getenv("CACHE_MAX_MB", "512")) * 1024 * 1024)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+CACHE_SWEEP_INTERVAL = int(os.getenv("CACHE_SWEEP_INTERVAL", "300"))
+# Index of the file store's entries (see utils/cache_manifest.py)
+CACHE_MANIFEST_DB = os.getenv("CACHE_MANIFEST_DB", str(CACHE_DIR / "manifest.sqlite3"))
+
+# Trained compression dictionaries (see utils/compression.py); replicas sharing
+# a cache need the same ones
+CACHE_DICT_DIR = os.getenv("CACHE_DICT_DIR", str(CACHE_DIR / "dicts"))
+
+# 'file', 'redis' or 'tiered' (file near cache in front of redis)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "file")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+
+def create_backend(kind: str = CACHE_BACKEND) -> CacheBackend:
+    """
+    Build the cache backend named by ``kind`` from the settings above.
+
+    Args:
+        kind: 'file', 'redis' or 'tiered'
+
+    Returns:
+        CacheBackend
+    """
+    if kind == 'file':
+        return FileBackend(CACHE_DIR, CACHE_HARD_TTLS, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_SWEEP_INTERVAL,
+                           manifest_path=CACHE_MANIFEST_DB, compressor=compressor)
+    if kind == 'redis':
+        return RedisBackend(CACHE_REDIS_URL, CACHE_HARD_TTLS, compressor=compressor)
+    if kind == 'tiered':
+        return TieredBackend(create_backend('file'), create_backend('redis'))
+    raise ValueError(f"Unknown CACHE_BACKEND: {kind!r} (expected 'file', 'redis' or 'tiered')")
+
+
+# Shared by every session in this process
+compressor = Compressor(dict_dir=CACHE_DICT_DIR)
+backend = create_backend()
 
-CACHE_DIR = Path(".cache")
-CACHE_DIR.mkdir(exist_ok=True)
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Build a content-addressed cache key from everything that affects a result.
+
+    Args:
+        *parts: Values identifying the result (video ID, language, model, ...)
+
+    Returns:
+        Hex SHA-256 digest of the parts
+    """
+    joined = "\x1f".join("" if part is None else str(part) for part in parts)
+    return hashlib.sha256(joined.encode('utf-8')).hexdigest()
 
 
 def get_cache_file(cache_type: str, key: str) -> Path:
-    """Get the cache file path for a given type and key."""
-    # Sanitize key for filename
-    safe_key = "".join(c for c in key if c.isalnum() or c in ('-', '_'))[:50]
-    return CACHE_DIR / f"{cache_type}_{safe_key}.json"
+    """Get the path an entry has in the file store under CACHE_DIR."""
+    return entry_path(CACHE_DIR, cache_type, key)
 
 
-def load_from_cache(cache_type: str, key: str, ttl: int) -> Optional[Any]:
+def load_from_cache(cache_type: str, key: str, ttl: int,
+                    fallback_keys: Iterable[str] = ()) -> Optional[Any]:
     """
     Load cached data if it exists and is still valid.
-    
+
     Args:
         cache_type: Type of cache ('transcript' or 'analysis')
-        key: Cache key (video_id)
+        key: Cache key (see make_cache_key)
         ttl: Time to live in seconds
-    
+        fallback_keys: Older keys whose entries are still valid for this
+            lookup (e.g. a previous compatible prompt version). A hit on one
+            of them is copied to ``key`` with its original timestamp.
+
     Returns:
         Cached data if valid, None otherwise
     """
-    cache_file = get_cache_file(cache_type, key)
-    
-    if not cache_file.exists():
+    entry = load_entry(cache_type, key, ttl, fallback_keys=fallback_keys)
+    return None if entry is None else entry[0]
+
+
+def load_entry(cache_type: str, key: str, ttl: int, hard_ttl: Optional[int] = None,
+               fallback_keys: Iterable[str] = ()) -> Optional[Tuple[Any, float]]:
+    """
+    Load cached data together with its age, including stale entries.
+
+    Args:
+        cache_type: Type of cache ('transcript' or 'analysis')
+        key: Cache key (see make_cache_key)
+        ttl: Soft TTL in seconds; older entries are stale
+        hard_ttl: Entries older than this are never returned (defaults to ``ttl``)
+        fallback_keys: Older keys whose entries are still valid for this lookup
+
+    Returns:
+        (data, age in seconds), or None if there is no entry younger than ``hard_ttl``
+    """
+    hard_ttl = max(ttl, hard_ttl or 0)
+    now = time.time()
+    data = None
+    with metrics.timer('cache_lookup'):
+        entry = _unexpired(backend.get(cache_type, key, newer_than=now - ttl), now - hard_ttl)
+        if entry is None:
+            for fallback_key in fallback_keys:
+                entry = _unexpired(backend.get(cache_type, fallback_key, newer_than=now - ttl), now - hard_ttl)
+                if entry is not None:
+                    backend.set_entry(cache_type, entry.with_key(key))
+                    break
+        if entry is not None:
+            try:
+                # Only an unexpired entry is decompressed
+                data = entry.data
+            except ValueError:
+                # Corrupted body, or written with a dictionary this host doesn't have
+                backend.delete(cache_type, entry.key)
+                entry = None
+
+    if entry is None:
+        metrics.inc('cache_requests', tier=backend.name, type=cache_type, result='miss')
         return None
-    
-    try:
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            cache_data = json.load(f)
-        
-        # Check if cache is expired
-        current_time = time.time()
-        cache_time = cache_data.get('timestamp', 0)
-        
-        if current_time - cache_time > ttl:
-            # Cache expired, delete file
-            cache_file.unlink()
-            return None
-        
-        # Cache is valid
-        return cache_data.get('data')
-    
-    except (json.JSONDecodeError, KeyError, IOError) as e:
-        # Cache file corrupted or unreadable, delete it
-        if cache_file.exists():
-            cache_file.unlink()
+    age = max(0.0, now - entry.timestamp)
+    metrics.inc('cache_requests', tier=backend.name, type=cache_type, result='hit' if age <= ttl else 'stale')
+    return data, age
+
+
+def _unexpired(entry: Optional[Entry], oldest: float) -> Optional[Entry]:
+    """The entry if it was written at or after ``oldest``; expired ones are removed later."""
+    if entry is None or entry.timestamp < oldest:
         return None
+    return entry
 
 
-def save_to_cache(cache_type: str, key: str, data: Any) -> None:
+def save_to_cache(cache_type: str, key: str, data: Any, timestamp: Optional[float] = None) -> None:
     """
-    Save data to cache file.
-    
+    Save data to the cache backend, compressed (atomically; readers never see partial entries).
+
     Args:
         cache_type: Type of cache ('transcript' or 'analysis')
-        key: Cache key (video_id)
+        key: Cache key (see make_cache_key)
         data: Data to cache
+        timestamp: Creation time to record (defaults to now), e.g. to keep
+            the age of an entry rewritten in a new format
+    """
+    backend.set(cache_type, key, data, time.time() if timestamp is None else timestamp)
+
+
+def prefetch(cache_type: str, keys: Iterable[str]) -> int:
+    """
+    Copy entries from the shared cache into the near cache in batches.
+
+    Only the tiered backend has anything to warm; other backends return 0.
+
+    Args:
+        cache_type: Type of cache ('transcript' or 'analysis')
+        keys: Cache keys likely to be read soon
+
+    Returns:
+        Number of entries copied
+    """
+    return backend.prefetch(cache_type, keys)
+
+
+def sweep_cache() -> dict:
+    """
+    Remove expired entries and evict least recently used ones past the size limits.
+
+    The file store runs this in the background from its manifest, without
+    scanning the directory; a shared server expires entries itself.
+
+    Returns:
+        Dictionary with the number of expired and evicted entries
     """
-    cache_file = get_cache_file(cache_type, key)
-    
-    cache_data = {
-        'timestamp': time.time(),
-        'data': data
-    }
-    
-    try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
-    except IOError as e:
-        # Failed to write cache, but don't raise error
-        pass
+    return backend.sweep()
 
 
 def clear_cache(cache_type: Optional[str] = None) -> None:
     """
-    Clear cache files.
-    
+    Clear cache entries.
+
+    Search results point at cached analyses, so clearing analyses also
+    empties the search index.
+
     Args:
         cache_type: If provided, only clear this cache type ('transcript' or 'analysis')
                    If None, clear all caches
     """
-    if cache_type:
-        pattern = f"{cache_type}_*.json"
-    else:
-        pattern = "*.json"
-    
-    for cache_file in CACHE_DIR.glob(pattern):
-        try:
-            cache_file.unlink()
-        except IOError:
-            pass
+    backend.clear(cache_type)
+    if cache_type in (None, 'analysis'):
+        # Imported here: search_index imports this module
+        from utils import search_index
+        search_index.clear_index()
+
+
+def list_entries(cache_type: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[dict]:
+    """
+    List cached entries from the manifest, most recently used first.
+
+    Args:
+        cache_type: Only list this cache type
+        limit: Maximum number of entries
+        offset: Entries to skip (for paging)
+
+    Returns:
+        Dictionaries with type, key, size (bytes), created and accessed
+        (timestamps); empty for a backend without a manifest (redis)
+    """
+    return backend.entries(cache_type, limit, offset)
+
+
+def rebuild_manifest() -> int:
+    """
+    Rebuild the file store's manifest from the files on disk.
+
+    Runs automatically when the manifest is missing or corrupted, and as a
+    periodic reconcile (CACHE_MANIFEST_RECONCILE_SECONDS); call it after
+    restoring or copying cache files by hand.
+
+    Returns:
+        Number of entries indexed
+    """
+    return backend.rebuild_index()
 
 
 def get_cache_size() -> dict:
     """
     Get cache statistics.
-    
-    Returns:
-        Dictionary with cache size info
-    """
-    cache_files = list(CACHE_DIR.glob("*.json"))
-    total_size = sum(f.stat().st_size for f in cache_files if f.exists())
-    
-    transcript_count = len(list(CACHE_DIR.glob("transcript_*.json")))
-    analysis_count = len(list(CACHE_DIR.glob("analysis_*.json")))
-    
-    return {
-        'total_files': len(cache_files),
-        'transcript_files': transcript_count,
-        'analysis_files': analysis_count,
-        'total_size_mb': round(total_size / (1024 * 1024), 2)
-    }
 
+    Returns:
+        Dictionary with 'backend', 'total_entries', 'transcript_entries',
+        'analysis_entries' and 'total_size_mb' (None for the Redis backend),
+        plus backend-specific extras ('errors' for Redis; the tiered backend
+        reports the shared tier's counts and each tier's stats under 'near'
+        and 'shared')
+    """
+    return backend.stats()
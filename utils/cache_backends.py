@@ -0,0 +1,983 @@
+"""
+Storage backends behind the persistent cache (utils/cache.py).
+
+A backend stores entries by cache type and key; TTL policy stays in
+utils/cache.py. An entry is stored as one line of header JSON (key, creation
+time, codec) followed by its body, compressed by utils/compression.py and
+only decompressed when its data is read. Three implementations:
+
+- FileBackend: hashed shard directories under a local directory, written
+  atomically and indexed by a manifest (utils/cache_manifest.py), with a
+  background sweeper for expiry and LRU eviction.
+- RedisBackend: a key-value server speaking the Redis protocol (RESP),
+  shared by every replica. Keys expire on the server at their hard TTL.
+- TieredBackend: a local near cache (usually a FileBackend) in front of a
+  shared backend; reads go through to the shared one on a near miss and
+  copy the entry back, writes go to both.
+
+Backends swallow storage errors (a failed read is a miss, a failed write is
+dropped) so caching never breaks the app.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse, unquote
+
+from utils.cache_manifest import CacheManifest, Row
+from utils.compression import CODEC_NONE, Compressor
+from utils.metrics import metrics
+
+
+# Eviction trims the cache down to this fraction of the limits
+CACHE_EVICT_TARGET = 0.9
+# Leftover temp files older than this come from crashed writers
+STALE_TEMP_SECONDS = 3600
+
+CACHE_REDIS_PREFIX = os.getenv("CACHE_REDIS_PREFIX", "vidtodo:")
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", "2"))
+# After a connection failure, treat the server as down for this long instead
+# of paying a connect timeout on every lookup
+CACHE_REDIS_RETRY_SECONDS = float(os.getenv("CACHE_REDIS_RETRY_SECONDS", "10"))
+# Full rescans of the file store that pick up entries a crash left out of the manifest
+CACHE_MANIFEST_RECONCILE_SECONDS = float(os.getenv("CACHE_MANIFEST_RECONCILE_SECONDS", str(24 * 3600)))
+# Keys per MGET when reading many entries at once
+CACHE_MGET_BATCH = int(os.getenv("CACHE_MGET_BATCH", "100"))
+# Counting keys scans the whole keyspace; stats() reuses a count this recent
+CACHE_REDIS_STATS_SECONDS = float(os.getenv("CACHE_REDIS_STATS_SECONDS", "10"))
+
+# Keys every backend's stats() returns
+STATS_KEYS = ('backend', 'total_entries', 'transcript_entries', 'analysis_entries', 'total_size_mb')
+
+
+def _chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for i in range(0, len(items), max(1, size)):
+        yield items[i:i + size]
+
+
+_UNSET = object()
+
+
+class Entry:
+    """
+    One cache entry: a readable header (key, creation time, codec) and a body.
+
+    The body stays compressed until ``data`` is first read, so checking an
+    entry's age, or copying it between tiers, never decompresses it.
+
+    Args:
+        key: Cache key
+        timestamp: Creation time
+        codec: How the body is compressed (see utils/compression.py)
+        dictionary: Id of the dictionary the body was compressed with, if any
+        body: Stored body bytes, or None if only ``data`` is known
+        compressor: Decompresses the body
+        data: Already known data (skips decompression)
+    """
+
+    __slots__ = ("key", "timestamp", "codec", "dictionary", "body", "_compressor", "_data")
+
+    def __init__(self, key: str, timestamp: float, codec: str, dictionary: Optional[str],
+                 body: Optional[bytes], compressor: Compressor, data: Any = _UNSET):
+        self.key = key
+        self.timestamp = timestamp
+        self.codec = codec
+        self.dictionary = dictionary
+        self.body = body
+        self._compressor = compressor
+        self._data = data
+
+    @classmethod
+    def create(cls, cache_type: str, key: str, data: Any, timestamp: float, compressor: Compressor) -> "Entry":
+        """Serialize and compress data for storage."""
+        raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        codec, dictionary, body = compressor.compress(cache_type, raw)
+        return cls(key, timestamp, codec, dictionary, body, compressor, data)
+
+    @property
+    def data(self) -> Any:
+        """
+        The cached data, decompressed and parsed on first access.
+
+        Raises:
+            ValueError: If the body is corrupted or its dictionary is missing
+        """
+        if self._data is _UNSET:
+            self._data = json.loads(self._compressor.decompress(self.codec, self.dictionary, self.body))
+        return self._data
+
+    def with_key(self, key: str) -> "Entry":
+        """The same entry under another key (the body is reused as is)."""
+        return Entry(key, self.timestamp, self.codec, self.dictionary, self.body, self._compressor, self._data)
+
+    def encode(self, cache_type: str) -> bytes:
+        """Stored form: one line of header JSON, then the body."""
+        if self.body is None:
+            # Read from the previous format, where the data was inline
+            raw = json.dumps(self._data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self.codec, self.dictionary, self.body = self._compressor.compress(cache_type, raw)
+        header = {'key': self.key, 'timestamp': self.timestamp, 'codec': self.codec}
+        if self.dictionary:
+            header['dict'] = self.dictionary
+        return json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b"\n" + self.body
+
+    @classmethod
+    def decode(cls, payload: bytes, key: str, compressor: Compressor) -> Optional["Entry"]:
+        """
+        Parse a stored entry's header; the body is left compressed.
+
+        Entries in the previous format (one JSON document with the data
+        inline) are read too.
+
+        Returns:
+            The entry, or None if it belongs to another key
+
+        Raises:
+            ValueError: If the header is corrupted
+        """
+        newline = payload.find(b"\n")
+        try:
+            header = json.loads(payload if newline < 0 else payload[:newline])
+        except ValueError:
+            # Older entries were indented JSON spanning many lines
+            header = json.loads(payload)
+            newline = -1
+        if not isinstance(header, dict):
+            raise ValueError("Cache entry header is not an object")
+        # Guard against hash collisions
+        if header.get('key') != key:
+            return None
+        timestamp = header.get('timestamp', 0)
+        if 'data' in header:
+            return cls(key, timestamp, CODEC_NONE, None, None, compressor, header['data'])
+        if newline < 0 or 'codec' not in header:
+            raise ValueError("Cache entry has no body")
+        return cls(key, timestamp, header['codec'], header.get('dict'), payload[newline + 1:], compressor)
+
+    def __repr__(self) -> str:
+        return f"Entry({self.key[:12]!r}, {self.codec}, {len(self.body or b'')} bytes)"
+
+
+class CacheBackend:
+    """
+    Interface of a cache store of Entry objects.
+
+    ``get`` returns entries of any age; callers decide whether an entry is
+    fresh, stale or expired from its timestamp. Implementations set
+    ``compressor``, used to encode the entries they write, and ``is_shared``
+    when other hosts read the same entries.
+    """
+
+    name = 'base'
+    is_shared = False
+    compressor: Compressor
+
+    def get(self, cache_type: str, key: str, newer_than: Optional[float] = None) -> Optional[Entry]:
+        """
+        Return the entry for a key, or None.
+
+        Args:
+            cache_type: Type of cache ('transcript' or 'analysis')
+            key: Cache key
+            newer_than: Hint that the caller only wants entries written after
+                this time; tiered backends then look past an older near copy
+        """
+        raise NotImplementedError
+
+    def get_many(self, cache_type: str, keys: Iterable[str]) -> Dict[str, Entry]:
+        """Return ``{key: entry}`` for the keys that have an entry."""
+        entries = {}
+        for key in keys:
+            entry = self.get(cache_type, key)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def exists(self, cache_type: str, key: str) -> bool:
+        return self.get(cache_type, key) is not None
+
+    def set(self, cache_type: str, key: str, data: Any, timestamp: float) -> None:
+        """Store data under a key, recording ``timestamp`` as its creation time."""
+        try:
+            entry = Entry.create(cache_type, key, data, timestamp, self.compressor)
+        except (TypeError, ValueError):
+            # Not serializable: don't cache it
+            return
+        self.set_entry(cache_type, entry)
+
+    def set_entry(self, cache_type: str, entry: Entry) -> None:
+        """Store an entry as is (e.g. one read from another backend)."""
+        raise NotImplementedError
+
+    def delete(self, cache_type: str, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self, cache_type: Optional[str] = None) -> None:
+        """Remove every entry, or only those of one cache type."""
+        raise NotImplementedError
+
+    def prefetch(self, cache_type: str, keys: Iterable[str]) -> int:
+        """Warm a local tier with the given keys; returns the number of entries copied."""
+        return 0
+
+    def sweep(self) -> dict:
+        """Remove expired entries and evict past the size limits, where the backend does so itself."""
+        return {'expired': 0, 'evicted': 0}
+
+    def entries(self, cache_type: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[dict]:
+        """List entries (type, key, size, created, accessed), most recently used first, if the backend indexes them."""
+        return []
+
+    def rebuild_index(self) -> int:
+        """Rebuild the backend's entry index from its storage; returns the number of entries indexed."""
+        return 0
+
+    def stats(self) -> dict:
+        """
+        Entry counts and size.
+
+        Every backend returns STATS_KEYS: ``backend``, ``total_entries``
+        (every cache type), ``transcript_entries``, ``analysis_entries`` and
+        ``total_size_mb`` (None when the backend cannot measure it cheaply),
+        plus extras of its own alongside them.
+        """
+        raise NotImplementedError
+
+    def _stats(self, counts: Dict[str, int], size_bytes: Optional[int], **extras: Any) -> dict:
+        """Build stats() from per-type entry counts."""
+        return {
+            'backend': self.name,
+            'total_entries': sum(counts.values()),
+            'transcript_entries': counts.get('transcript', 0),
+            'analysis_entries': counts.get('analysis', 0),
+            'total_size_mb': round(size_bytes / (1024 * 1024), 2) if size_bytes is not None else None,
+            **extras,
+        }
+
+
+def _unlink_if_unchanged(cache_file: Path, inode: int) -> None:
+    """Delete a file only if it has not been replaced since we read it."""
+    try:
+        if os.stat(cache_file).st_ino == inode:
+            cache_file.unlink()
+    except OSError:
+        pass
+
+
+def entry_path(root: Path, cache_type: str, key: str) -> Path:
+    """Path of an entry in a file store rooted at ``root``."""
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return root / cache_type / digest[:2] / f"{digest}.json"
+
+
+_KEY_RE = re.compile(rb'^\s*\{\s*"key"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def _read_key(path: Path) -> Optional[str]:
+    """Key of an entry file, read from its first bytes (the key is written first)."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(1024)
+            match = _KEY_RE.match(head)
+            if match:
+                return json.loads(match.group(1))
+            entry = json.loads(head + f.read())
+    except (OSError, ValueError):
+        return None
+    return entry.get('key') if isinstance(entry, dict) and isinstance(entry.get('key'), str) else None
+
+
+class FileBackend(CacheBackend):
+    """
+    Entries as files in hashed shard directories (``<root>/<type>/<ab>/<sha256>.json``).
+
+    Files are written atomically (temp file + rename), with mtime set to the
+    entry's creation time. A manifest (utils/cache_manifest.py) indexes every
+    entry's size, creation and last use, so the background sweeper, stats,
+    clears and listings never walk the directory tree. The sweeper deletes
+    entries past their hard TTL and evicts the least recently used ones when
+    the store grows past its size limits; it also rebuilds the manifest from
+    disk when it is new or corrupted, and reconciles it every
+    ``reconcile_interval`` seconds.
+
+    Args:
+        root: Directory holding the entries
+        hard_ttls: Seconds after which each cache type's entries are deleted
+        max_bytes: Evict least recently used entries past this total size
+        max_entries: Evict least recently used entries past this count
+        sweep_interval: Seconds between background sweeps
+        manifest_path: Manifest database (defaults to ``<root>/manifest.sqlite3``)
+        reconcile_interval: Seconds between full rescans of the directory; 0 disables them
+        compressor: Compresses entry bodies (defaults to the CACHE_COMPRESSION codec)
+    """
+
+    name = 'file'
+
+    def __init__(self, root: Path, hard_ttls: Dict[str, int], max_bytes: int,
+                 max_entries: int, sweep_interval: float, manifest_path: Optional[str] = None,
+                 reconcile_interval: float = CACHE_MANIFEST_RECONCILE_SECONDS,
+                 compressor: Optional[Compressor] = None):
+        self.root = Path(root)
+        self.compressor = compressor or Compressor()
+        self.hard_ttls = hard_ttls
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.manifest = CacheManifest(manifest_path or str(self.root / 'manifest.sqlite3'))
+        self.reconcile_interval = reconcile_interval
+        self._manifest_lock = threading.Lock()
+        self._manifest_ready = False
+        self._reconciled_at = 0.0
+        self._sweeper_lock = threading.Lock()
+        self._sweeper_thread = None
+        self._sweep_requested = threading.Event()
+        self._bytes_since_sweep = 0
+
+    def path(self, cache_type: str, key: str) -> Path:
+        return entry_path(self.root, cache_type, key)
+
+    def _digest_path(self, cache_type: str, digest: str) -> Path:
+        return self.root / cache_type / digest[:2] / f"{digest}.json"
+
+    def get(self, cache_type: str, key: str, newer_than: Optional[float] = None) -> Optional[Entry]:
+        self._ensure_sweeper()
+        cache_file = self.path(cache_type, key)
+        try:
+            f = open(cache_file, 'rb')
+        except OSError:
+            return None
+
+        with f:
+            try:
+                entry = Entry.decode(f.read(), key, self.compressor)
+            except (ValueError, OSError):
+                # Writes are atomic, so this file really is corrupted
+                _unlink_if_unchanged(cache_file, os.fstat(f.fileno()).st_ino)
+                self._unindex(cache_type, cache_file.stem)
+                return None
+        if entry is None:
+            return None
+
+        # Last use, for LRU eviction (written to the manifest in batches)
+        try:
+            self.manifest.touch(cache_type, cache_file.stem)
+        except sqlite3.Error:
+            pass
+        return entry
+
+    def exists(self, cache_type: str, key: str) -> bool:
+        return self.path(cache_type, key).exists()
+
+    def set_entry(self, cache_type: str, entry: Entry) -> None:
+        self._ensure_sweeper()
+        cache_file = self.path(cache_type, entry.key)
+        timestamp = entry.timestamp
+        try:
+            payload = entry.encode(cache_type)
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_file.parent, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(payload)
+                # mtime records the creation time, which survives a manifest rebuild
+                os.utime(tmp_path, (timestamp, timestamp))
+                os.replace(tmp_path, cache_file)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError):
+            # Failed to write cache, but don't raise error
+            return
+
+        try:
+            self.manifest.record(cache_type, cache_file.stem, entry.key, len(payload), timestamp)
+        except sqlite3.Error:
+            # Picked up by the next reconcile
+            pass
+
+        # Sweep early when a burst of writes may have pushed us past the size limit
+        with self._sweeper_lock:
+            self._bytes_since_sweep += len(payload)
+            if self._bytes_since_sweep > self.max_bytes * (1 - CACHE_EVICT_TARGET):
+                self._bytes_since_sweep = 0
+                self._sweep_requested.set()
+
+    def delete(self, cache_type: str, key: str) -> None:
+        cache_file = self.path(cache_type, key)
+        try:
+            cache_file.unlink()
+        except OSError:
+            pass
+        self._unindex(cache_type, cache_file.stem)
+
+    def _unindex(self, cache_type: str, digest: str) -> None:
+        try:
+            self.manifest.remove(cache_type, digest)
+        except sqlite3.Error:
+            pass
+
+    def _ready(self) -> bool:
+        """Open the manifest, rebuilding it from disk if it is new or corrupted."""
+        if self._manifest_ready:
+            return True
+        with self._manifest_lock:
+            if self._manifest_ready:
+                return True
+            try:
+                try:
+                    built_at = self.manifest.built_at()
+                except sqlite3.DatabaseError:
+                    self.manifest.reset()
+                    built_at = None
+                if built_at is None:
+                    self.rebuild_index()
+                else:
+                    self._reconciled_at = built_at
+            except (sqlite3.Error, OSError):
+                return False
+            self._manifest_ready = True
+        return True
+
+    def _iter_entries(self, cache_type: Optional[str] = None) -> Iterator[Tuple[str, Path, os.stat_result]]:
+        """Yield (cache_type, path, stat) for every entry file on disk."""
+        if cache_type:
+            type_dirs = [self.root / cache_type]
+        else:
+            try:
+                type_dirs = [entry for entry in self.root.iterdir()
+                             if entry.is_dir() and not entry.name.startswith('.')]
+            except OSError:
+                return
+        for type_dir in type_dirs:
+            if not type_dir.is_dir():
+                continue
+            for shard in os.scandir(type_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        yield type_dir.name, Path(entry.path), entry.stat()
+                    except OSError:
+                        continue
+
+    def _scan(self) -> Iterator[Row]:
+        """Manifest rows for every entry on disk; removes stale temp files and unreadable entries."""
+        now = time.time()
+        for cache_type, path, stat in self._iter_entries():
+            if path.name.startswith('.tmp-'):
+                if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                    _unlink_if_unchanged(path, stat.st_ino)
+                continue
+            key = _read_key(path)
+            if key is None:
+                _unlink_if_unchanged(path, stat.st_ino)
+                continue
+            yield (cache_type, path.stem, key, stat.st_size, stat.st_mtime, max(stat.st_atime, stat.st_mtime))
+
+    def rebuild_index(self) -> int:
+        """
+        Rebuild the manifest from the files on disk (recovery after a crash or corruption).
+
+        Returns:
+            Number of entries indexed
+        """
+        count = self.manifest.rebuild(self._scan())
+        self._reconciled_at = time.time()
+        self._remove_flat_files()
+        return count
+
+    def _remove_flat_files(self, cache_type: Optional[str] = None) -> None:
+        """
+        Delete files of the original flat layout (``<type>_<video id>.json``).
+
+        They are never read: their analyses came from older prompts, and
+        their transcripts have no segment timings.
+        """
+        for name in [cache_type] if cache_type else self.hard_ttls:
+            for cache_file in self.root.glob(f"{name}_*.json"):
+                try:
+                    cache_file.unlink()
+                except OSError:
+                    pass
+
+    def _remove_trash(self) -> None:
+        try:
+            trash = [entry for entry in self.root.iterdir() if entry.name.startswith('.trash-')]
+        except OSError:
+            return
+        for path in trash:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self, cache_type: Optional[str] = None) -> None:
+        # Renaming a whole type directory is one operation however many entries it holds;
+        # the files are deleted in the background
+        if cache_type:
+            cache_types = [cache_type]
+        else:
+            cache_types = set(self.hard_ttls)
+            if self._ready():
+                cache_types.update(self.manifest.cache_types())
+        for name in cache_types:
+            try:
+                os.rename(self.root / name, self.root / f".trash-{uuid.uuid4().hex}")
+            except OSError:
+                pass
+        try:
+            self.manifest.clear(cache_type)
+        except sqlite3.Error:
+            pass
+        threading.Thread(target=self._remove_trash, name='cache-clear', daemon=True).start()
+        self._remove_flat_files(cache_type)
+
+    def _evict(self, items: List[Tuple[str, str, float]]) -> None:
+        """Delete (cache_type, digest, created) entries that were not rewritten since they were selected."""
+        for cache_type, digest, created in items:
+            path = self._digest_path(cache_type, digest)
+            try:
+                if abs(os.stat(path).st_mtime - created) < 0.001:
+                    path.unlink()
+            except OSError:
+                pass
+        self.manifest.evict(items)
+
+    def sweep(self) -> dict:
+        if not self._ready():
+            return {'expired': 0, 'evicted': 0}
+        now = time.time()
+        if self.reconcile_interval and now - self._reconciled_at >= self.reconcile_interval:
+            self.rebuild_index()
+        self._remove_trash()
+
+        expired = 0
+        default_ttl = max(self.hard_ttls.values())
+        for cache_type in set(self.hard_ttls) | set(self.manifest.cache_types()):
+            ttl = self.hard_ttls.get(cache_type, default_ttl)
+            while True:
+                rows = self.manifest.created_before(cache_type, now - ttl)
+                self._evict([(cache_type, digest, created) for digest, created in rows])
+                expired += len(rows)
+                if len(rows) < 1000:
+                    break
+
+        evicted = 0
+        totals = self.manifest.totals().values()
+        count = sum(entries for entries, _ in totals)
+        total_bytes = sum(size for _, size in totals)
+        if total_bytes > self.max_bytes or count > self.max_entries:
+            target_bytes = self.max_bytes * CACHE_EVICT_TARGET
+            target_entries = self.max_entries * CACHE_EVICT_TARGET
+            while total_bytes > target_bytes or count > target_entries:
+                # Oldest access first
+                batch = []
+                for cache_type, digest, size, created in self.manifest.least_recently_used(500):
+                    if total_bytes <= target_bytes and count <= target_entries:
+                        break
+                    batch.append((cache_type, digest, created))
+                    total_bytes -= size
+                    count -= 1
+                if not batch:
+                    break
+                self._evict(batch)
+                evicted += len(batch)
+
+        metrics.inc('cache_evictions', expired, tier='file', reason='expired')
+        metrics.inc('cache_evictions', evicted, tier='file', reason='lru')
+        return {'expired': expired, 'evicted': evicted}
+
+    def _sweeper_loop(self) -> None:
+        # A new or corrupted manifest is rebuilt here rather than in a request
+        self._ready()
+        while True:
+            self._sweep_requested.wait(self.sweep_interval)
+            self._sweep_requested.clear()
+            try:
+                self.sweep()
+            except (OSError, sqlite3.Error):
+                pass
+
+    def _ensure_sweeper(self) -> None:
+        """Start the background sweeper thread once per backend."""
+        if self._sweeper_thread is not None:
+            return
+        with self._sweeper_lock:
+            if self._sweeper_thread is None:
+                self._sweeper_thread = threading.Thread(target=self._sweeper_loop, name='cache-sweeper',
+                                                        daemon=True)
+                self._sweeper_thread.start()
+
+    def entries(self, cache_type: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[dict]:
+        if not self._ready():
+            return []
+        try:
+            return self.manifest.entries(cache_type, limit, offset)
+        except sqlite3.Error:
+            return []
+
+    def stats(self) -> dict:
+        totals = None
+        if self._ready():
+            try:
+                totals = self.manifest.totals()
+            except sqlite3.Error:
+                pass
+        if totals is None:
+            # No usable manifest: count the files on disk
+            totals = {}
+            for cache_type, path, stat in self._iter_entries():
+                if not path.name.startswith('.tmp-'):
+                    count, size = totals.get(cache_type, (0, 0))
+                    totals[cache_type] = (count + 1, size + stat.st_size)
+
+        return self._stats({cache_type: count for cache_type, (count, _) in totals.items()},
+                           sum(size for _, size in totals.values()))
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+class _RespConnection:
+    """One socket speaking RESP2: commands out as arrays of bulk strings, replies parsed back."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def send(self, *args: Any) -> None:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        self.sock.sendall(b"".join(parts))
+
+    def read(self) -> Any:
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the cache server")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest.decode('utf-8')
+        if prefix == b"-":
+            raise RespError(rest.decode('utf-8', 'replace'))
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by the cache server")
+            return data[:-2]
+        if prefix == b"*":
+            length = int(rest)
+            return None if length < 0 else [self.read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from the cache server: {line[:40]!r}")
+
+    def close(self) -> None:
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisClient:
+    """
+    Minimal thread-safe Redis client over a small pool of connections.
+
+    Args:
+        url: ``redis://[[user]:password@]host[:port][/db]``
+        timeout: Connect and read timeout in seconds
+        max_idle: Idle connections kept for reuse
+    """
+
+    def __init__(self, url: str, timeout: float = CACHE_REDIS_TIMEOUT, max_idle: int = 8):
+        parsed = urlparse(url)
+        if parsed.scheme != 'redis':
+            raise ValueError(f"Unsupported cache URL: {url!r} (expected redis://host:port/db)")
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: List[_RespConnection] = []
+
+    def _connect(self) -> _RespConnection:
+        conn = _RespConnection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                auth = (self.username, self.password) if self.username else (self.password,)
+                conn.send('AUTH', *auth)
+                conn.read()
+            if self.db:
+                conn.send('SELECT', self.db)
+                conn.read()
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def execute(self, *args: Any) -> Any:
+        """
+        Send one command and return its reply.
+
+        Raises:
+            RespError: The server answered with an error
+            OSError: The connection failed (it is then discarded)
+        """
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            conn.send(*args)
+            reply = conn.read()
+        except RespError:
+            self._release(conn)
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn: _RespConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class RedisBackend(CacheBackend):
+    """
+    Entries in a Redis-protocol key-value server shared by every replica.
+
+    Keys are ``<prefix><cache_type>:<key>`` and expire on the server when the
+    entry reaches its hard TTL, so no sweeper is needed. While the server is
+    unreachable every lookup is a miss and every write is dropped.
+
+    Args:
+        url: Server URL (``redis://host:port/db``)
+        hard_ttls: Seconds after which each cache type's entries expire
+        prefix: Namespace for this app's keys
+        batch_size: Keys per MGET in get_many()
+        client: Client to use instead of one built from ``url``
+        compressor: Compresses entry bodies (defaults to the CACHE_COMPRESSION codec)
+    """
+
+    name = 'redis'
+    is_shared = True
+
+    def __init__(self, url: str, hard_ttls: Dict[str, int], prefix: str = CACHE_REDIS_PREFIX,
+                 batch_size: int = CACHE_MGET_BATCH, client: Optional[RedisClient] = None,
+                 compressor: Optional[Compressor] = None):
+        self.client = client or RedisClient(url)
+        self.compressor = compressor or Compressor()
+        self.hard_ttls = hard_ttls
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self._down_until = 0.0
+        self.errors = 0
+        self._counts: Optional[Dict[str, int]] = None
+        self._counted_at = 0.0
+
+    def _key(self, cache_type: str, key: str) -> str:
+        return f"{self.prefix}{cache_type}:{key}"
+
+    def _call(self, *args: Any) -> Any:
+        if time.monotonic() < self._down_until:
+            raise ConnectionError("Cache server marked unavailable")
+        try:
+            return self.client.execute(*args)
+        except OSError:
+            self._down_until = time.monotonic() + CACHE_REDIS_RETRY_SECONDS
+            raise
+
+    def _failed(self) -> None:
+        self.errors += 1
+        metrics.inc('cache_backend_errors', backend=self.name)
+
+    def get(self, cache_type: str, key: str, newer_than: Optional[float] = None) -> Optional[Entry]:
+        try:
+            payload = self._call('GET', self._key(cache_type, key))
+            return None if payload is None else Entry.decode(payload, key, self.compressor)
+        except ValueError:
+            return None
+        except (OSError, RespError):
+            self._failed()
+            return None
+
+    def get_many(self, cache_type: str, keys: Iterable[str]) -> Dict[str, Entry]:
+        entries = {}
+        for batch in _chunks(list(keys), self.batch_size):
+            try:
+                payloads = self._call('MGET', *(self._key(cache_type, key) for key in batch))
+            except (OSError, RespError):
+                self._failed()
+                break
+            for key, payload in zip(batch, payloads or ()):
+                try:
+                    entry = None if payload is None else Entry.decode(payload, key, self.compressor)
+                except ValueError:
+                    continue
+                if entry is not None:
+                    entries[key] = entry
+        return entries
+
+    def set_entry(self, cache_type: str, entry: Entry) -> None:
+        ttl = self.hard_ttls.get(cache_type, max(self.hard_ttls.values()))
+        remaining = int(ttl - (time.time() - entry.timestamp))
+        if remaining <= 0:
+            return
+        try:
+            payload = entry.encode(cache_type)
+            self._call('SET', self._key(cache_type, entry.key), payload, 'EX', remaining)
+        except (TypeError, ValueError):
+            return
+        except (OSError, RespError):
+            self._failed()
+
+    def delete(self, cache_type: str, key: str) -> None:
+        try:
+            self._call('DEL', self._key(cache_type, key))
+        except (OSError, RespError):
+            self._failed()
+
+    def _scan(self, pattern: str) -> Iterator[bytes]:
+        cursor = b"0"
+        while True:
+            cursor, keys = self._call('SCAN', cursor, 'MATCH', pattern, 'COUNT', 1000)
+            yield from keys
+            if cursor in (b"0", "0", 0):
+                return
+
+    def clear(self, cache_type: Optional[str] = None) -> None:
+        pattern = f"{self.prefix}{cache_type}:*" if cache_type else f"{self.prefix}*"
+        self._counts = None
+        try:
+            keys = list(self._scan(pattern))
+            for batch in _chunks(keys, self.batch_size):
+                self._call('DEL', *batch)
+        except (OSError, RespError):
+            self._failed()
+
+    def stats(self) -> dict:
+        counts = self._counts
+        if counts is None or time.monotonic() - self._counted_at >= CACHE_REDIS_STATS_SECONDS:
+            counts = {}
+            try:
+                for name in self._scan(f"{self.prefix}*"):
+                    cache_type = name.decode('utf-8')[len(self.prefix):].split(':', 1)[0]
+                    counts[cache_type] = counts.get(cache_type, 0) + 1
+            except (OSError, RespError):
+                self._failed()
+            self._counts, self._counted_at = counts, time.monotonic()
+        # Sizing keys would take a MEMORY USAGE round trip per key
+        return self._stats(counts, None, errors=self.errors)
+
+
+class TieredBackend(CacheBackend):
+    """
+    A local near cache in front of a shared backend (read-through, write-through).
+
+    A near miss, or a near copy older than the caller's ``newer_than``, reads
+    the shared backend and copies a newer entry into the near cache with its
+    original timestamp. Writes and deletes go to both tiers. prefetch() warms
+    the near cache in MGET batches, e.g. after a deploy.
+
+    Args:
+        near: Local backend checked first
+        shared: Backend shared with the other replicas
+    """
+
+    name = 'tiered'
+    is_shared = True
+
+    def __init__(self, near: CacheBackend, shared: CacheBackend):
+        self.near = near
+        self.shared = shared
+        self.compressor = near.compressor
+
+    def get(self, cache_type: str, key: str, newer_than: Optional[float] = None) -> Optional[Entry]:
+        entry = self.near.get(cache_type, key)
+        if entry is not None and (newer_than is None or entry.timestamp >= newer_than):
+            metrics.inc('cache_requests', tier='near', type=cache_type, result='hit')
+            return entry
+        metrics.inc('cache_requests', tier='near', type=cache_type, result='miss' if entry is None else 'stale')
+
+        shared = self.shared.get(cache_type, key)
+        if shared is not None and (entry is None or shared.timestamp > entry.timestamp):
+            self.near.set_entry(cache_type, shared)
+            return shared
+        return entry
+
+    def get_many(self, cache_type: str, keys: Iterable[str]) -> Dict[str, Entry]:
+        keys = list(keys)
+        entries = self.near.get_many(cache_type, keys)
+        missing = [key for key in keys if key not in entries]
+        if missing:
+            fetched = self.shared.get_many(cache_type, missing)
+            for entry in fetched.values():
+                self.near.set_entry(cache_type, entry)
+            entries.update(fetched)
+        return entries
+
+    def prefetch(self, cache_type: str, keys: Iterable[str]) -> int:
+        missing = [key for key in keys if not self.near.exists(cache_type, key)]
+        if not missing:
+            return 0
+        fetched = self.shared.get_many(cache_type, missing)
+        for entry in fetched.values():
+            self.near.set_entry(cache_type, entry)
+        metrics.inc('cache_prefetched', len(fetched), type=cache_type)
+        return len(fetched)
+
+    def set_entry(self, cache_type: str, entry: Entry) -> None:
+        self.near.set_entry(cache_type, entry)
+        self.shared.set_entry(cache_type, entry)
+
+    def delete(self, cache_type: str, key: str) -> None:
+        self.near.delete(cache_type, key)
+        self.shared.delete(cache_type, key)
+
+    def clear(self, cache_type: Optional[str] = None) -> None:
+        self.near.clear(cache_type)
+        self.shared.clear(cache_type)
+
+    def sweep(self) -> dict:
+        return self.near.sweep()
+
+    def entries(self, cache_type: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[dict]:
+        return self.near.entries(cache_type, limit, offset)
+
+    def rebuild_index(self) -> int:
+        return self.near.rebuild_index()
+
+    def stats(self) -> dict:
+        # Writes go to both tiers, so the shared one holds every entry
+        shared = self.shared.stats()
+        stats = {key: shared[key] for key in STATS_KEYS}
+        stats.update(backend=self.name, near=self.near.stats(), shared=shared)
+        return stats
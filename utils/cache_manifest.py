@@ -0,0 +1,268 @@
+"""
+Index of the entries in the file cache: type, key, size, creation and last access.
+
+The file store (utils/cache_backends.FileBackend) records every write,
+delete and eviction here, and reads in batches, so statistics, type-filtered
+clears, TTL sweeps and listings are index lookups instead of directory scans.
+Per-type entry counts and bytes live in a ``totals`` table kept up to date by
+triggers, so statistics are constant time.
+
+The files remain the source of truth. A missing or corrupted manifest is
+rebuilt from one directory scan, and the file store reconciles the manifest
+with the disk periodically to pick up writes a crash left unrecorded.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.metrics import metrics
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    cache_type TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    recorded REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (cache_type, digest)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_created ON entries (cache_type, created);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS totals (
+    cache_type TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT OR IGNORE INTO totals VALUES (new.cache_type, 0, 0);
+    UPDATE totals SET count = count + 1, bytes = bytes + new.size WHERE cache_type = new.cache_type;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET count = count - 1, bytes = bytes - old.size WHERE cache_type = old.cache_type;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_resize AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET bytes = bytes + new.size - old.size WHERE cache_type = new.cache_type;
+END;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+# Buffered reads are written to the manifest past this many entries or this age
+TOUCH_BATCH = 256
+TOUCH_FLUSH_SECONDS = 30.0
+
+# (cache_type, digest, key, size, created, accessed)
+Row = Tuple[str, str, str, int, float, float]
+
+# ``recorded`` is when the row was last written, unlike ``created`` (the
+# entry's own timestamp, which copies and rewrites keep)
+_INSERT = ("INSERT INTO entries (cache_type, digest, key, size, created, accessed, recorded) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?) ")
+
+
+class CacheManifest:
+    """
+    SQLite index of cache entries, shared by every process using the cache directory.
+
+    Args:
+        path: Database file
+
+    Errors from SQLite propagate; the file store catches them, since the
+    manifest can always be rebuilt from disk.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        # Bumped by reset() so threads reopen their connections
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._touched_since = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.generation == self._generation:
+            return connection
+        if connection is not None:
+            connection.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Transactions are explicit (BEGIN IMMEDIATE) where several statements must agree
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(entries)")}
+        if 'recorded' not in columns:
+            # Manifests written before the column existed
+            try:
+                connection.execute("ALTER TABLE entries ADD COLUMN recorded REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                # Another process added it first
+                pass
+        self._local.connection = connection
+        self._local.generation = self._generation
+        return connection
+
+    def built_at(self) -> Optional[float]:
+        """When the manifest was last rebuilt from disk, or None if it never was."""
+        row = self._connect().execute("SELECT value FROM meta WHERE name = 'built_at'").fetchone()
+        return None if row is None else row[0]
+
+    def reset(self) -> None:
+        """Move a corrupted database aside so the next use starts an empty one."""
+        with self._lock:
+            self._generation += 1
+            self._touched.clear()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.replace(self.path + suffix, self.path + '.corrupt' + suffix)
+            except OSError:
+                pass
+
+    def record(self, cache_type: str, digest: str, key: str, size: int, created: float) -> None:
+        """Add or replace the entry just written."""
+        now = time.time()
+        self._connect().execute(
+            _INSERT + "ON CONFLICT (cache_type, digest) DO UPDATE SET "
+            "key = excluded.key, size = excluded.size, created = excluded.created, "
+            "accessed = max(accessed, excluded.accessed), recorded = excluded.recorded",
+            (cache_type, digest, key, size, created, now, now)
+        )
+
+    def touch(self, cache_type: str, digest: str) -> None:
+        """Note a read; reads are written in batches (see flush())."""
+        now = time.time()
+        with self._lock:
+            if not self._touched:
+                self._touched_since = now
+            self._touched[(cache_type, digest)] = now
+            due = len(self._touched) >= TOUCH_BATCH or now - self._touched_since >= TOUCH_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered read times."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            self._write_many(
+                "UPDATE entries SET accessed = max(accessed, ?) WHERE cache_type = ? AND digest = ?",
+                [(accessed, cache_type, digest) for (cache_type, digest), accessed in touched.items()]
+            )
+
+    def _write_many(self, statement: str, params: List[tuple]) -> None:
+        """Run a statement for many rows in one transaction."""
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(statement, params)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def remove(self, cache_type: str, digest: str) -> None:
+        self._connect().execute("DELETE FROM entries WHERE cache_type = ? AND digest = ?", (cache_type, digest))
+
+    def evict(self, items: Iterable[Tuple[str, str, float]]) -> None:
+        """Remove (cache_type, digest, created) entries unless they were rewritten since."""
+        self._write_many("DELETE FROM entries WHERE cache_type = ? AND digest = ? AND created = ?", list(items))
+
+    def clear(self, cache_type: Optional[str] = None) -> None:
+        if cache_type:
+            self._connect().execute("DELETE FROM entries WHERE cache_type = ?", (cache_type,))
+        else:
+            self._connect().execute("DELETE FROM entries")
+
+    def cache_types(self) -> List[str]:
+        return [row[0] for row in self._connect().execute("SELECT cache_type FROM totals")]
+
+    def totals(self) -> Dict[str, Tuple[int, int]]:
+        """Return ``{cache_type: (entries, bytes)}``."""
+        return {cache_type: (count, size) for cache_type, count, size in
+                self._connect().execute("SELECT cache_type, count, bytes FROM totals WHERE count > 0")}
+
+    def created_before(self, cache_type: str, before: float, limit: int = 1000) -> List[Tuple[str, float]]:
+        """(digest, created) of entries of a type written before ``before``, oldest first."""
+        return self._connect().execute(
+            "SELECT digest, created FROM entries WHERE cache_type = ? AND created < ? "
+            "ORDER BY created LIMIT ?", (cache_type, before, limit)
+        ).fetchall()
+
+    def least_recently_used(self, limit: int) -> List[Tuple[str, str, int, float]]:
+        """(cache_type, digest, size, created) of the entries read longest ago."""
+        self.flush()
+        return self._connect().execute(
+            "SELECT cache_type, digest, size, created FROM entries ORDER BY accessed LIMIT ?", (limit,)
+        ).fetchall()
+
+    def entries(self, cache_type: Optional[str] = None, limit: int = 100,
+                offset: int = 0) -> List[Dict[str, Any]]:
+        """List entries, most recently used first."""
+        self.flush()
+        where, params = ("WHERE cache_type = ?", (cache_type,)) if cache_type else ("", ())
+        rows = self._connect().execute(
+            f"SELECT cache_type, key, size, created, accessed FROM entries {where} "
+            "ORDER BY accessed DESC LIMIT ? OFFSET ?", params + (limit, offset)
+        ).fetchall()
+        return [{'type': row[0], 'key': row[1], 'size': row[2], 'created': row[3], 'accessed': row[4]}
+                for row in rows]
+
+    def rebuild(self, rows: Iterable[Row]) -> int:
+        """
+        Replace the manifest with entries scanned from disk.
+
+        Read times already known are kept when newer than the file's. Rows
+        recorded after the scan started are kept too, since their files may
+        have been written after the scanner passed their directory; this goes
+        by when the row was recorded, as a copied or rewritten entry keeps an
+        old ``created``.
+
+        Args:
+            rows: (cache_type, digest, key, size, created, accessed) per file
+
+        Returns:
+            Number of entries indexed
+        """
+        started = time.time()
+        rows = list(rows)
+        self.flush()
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("CREATE TEMP TABLE IF NOT EXISTS scanned (cache_type TEXT, digest TEXT, "
+                               "PRIMARY KEY (cache_type, digest))")
+            connection.execute("DELETE FROM scanned")
+            connection.executemany("INSERT OR IGNORE INTO scanned VALUES (?, ?)",
+                                   [(row[0], row[1]) for row in rows])
+            connection.execute(
+                "DELETE FROM entries WHERE recorded < ? AND NOT EXISTS (SELECT 1 FROM scanned "
+                "WHERE scanned.cache_type = entries.cache_type AND scanned.digest = entries.digest)",
+                (started,)
+            )
+            # A file rewritten since it was scanned keeps its newer row
+            connection.executemany(
+                _INSERT + "ON CONFLICT (cache_type, digest) DO UPDATE SET "
+                "key = excluded.key, size = excluded.size, created = excluded.created, "
+                "accessed = max(accessed, excluded.accessed) WHERE created <= excluded.created",
+                [row + (started,) for row in rows]
+            )
+            # Triggers keep totals exact, but a rebuild also repairs them
+            connection.execute("DELETE FROM totals")
+            connection.execute("INSERT INTO totals SELECT cache_type, count(*), sum(size) "
+                               "FROM entries GROUP BY cache_type")
+            connection.execute("INSERT OR REPLACE INTO meta VALUES ('built_at', ?)", (started,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        metrics.inc('cache_manifest_rebuilds')
+        return len(rows)
@@ -0,0 +1,264 @@
+"""
+Compression of cache entry bodies.
+
+Bodies are compressed with zlib, or with zstd when CACHE_COMPRESSION=zstd
+and the optional ``zstandard`` package is installed. Transcripts share most
+of their structure and vocabulary, so a dictionary trained on cached
+transcripts primes the compressor for each new one:
+
+    python -m utils.compression train --type transcript
+
+Every entry records the codec and dictionary it was written with, so entries
+written before a new dictionary, or with another codec, stay readable as long
+as their dictionary file is kept. Replicas sharing a cache need the same
+dictionary directory (CACHE_DICT_DIR); an entry whose dictionary is missing
+reads as a miss.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.metrics import metrics
+
+
+CODEC_NONE = 'none'
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+
+# 'zlib' (default), 'zstd' (needs zstandard; falls back to zlib) or 'none'
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", CODEC_ZLIB)
+CACHE_COMPRESSION_LEVEL = int(os.getenv("CACHE_COMPRESSION_LEVEL", "6"))
+# Bodies smaller than this are stored as plain JSON
+MIN_COMPRESS_BYTES = 256
+# zlib can only look back 32 KiB, so a larger dictionary would be wasted
+DICT_SIZES = {CODEC_ZLIB: 32 * 1024, CODEC_ZSTD: 64 * 1024}
+
+# Words (with their leading space) that dictionary training counts
+_FRAGMENT_RE = re.compile(rb' ?[^\s\d\[\],:"{}]{2,}')
+
+_zstd_module = None
+
+
+def _zstd():
+    """The zstandard module, or None if it is not installed."""
+    global _zstd_module
+    if _zstd_module is None:
+        try:
+            import zstandard
+            _zstd_module = zstandard
+        except ImportError:
+            _zstd_module = False
+    return _zstd_module or None
+
+
+def train_zlib_dictionary(samples: Iterable[bytes], size: int = DICT_SIZES[CODEC_ZLIB]) -> bytes:
+    """
+    Build a zlib preset dictionary from sample bodies.
+
+    Words and word pairs found in more than one sample are ranked by the
+    bytes they would save (documents containing them times length) and
+    packed with the most valuable last, where zlib finds matches cheapest.
+
+    Args:
+        samples: Uncompressed bodies (e.g. transcript JSON)
+        size: Maximum dictionary size in bytes
+
+    Returns:
+        Dictionary bytes
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        words = _FRAGMENT_RE.findall(sample)
+        fragments = set(words)
+        fragments.update(a + b for a, b in zip(words, words[1:]))
+        counts.update(fragment for fragment in fragments if len(fragment) >= 4)
+
+    ranked = sorted(((count * len(fragment), fragment) for fragment, count in counts.items() if count > 1),
+                    reverse=True)
+    picked = []
+    total = 0
+    for _, fragment in ranked:
+        if total + len(fragment) > size:
+            continue
+        picked.append(fragment)
+        total += len(fragment)
+    return b"".join(reversed(picked))
+
+
+class Compressor:
+    """
+    Compress and decompress entry bodies, with an optional trained dictionary per cache type.
+
+    Args:
+        codec: 'zlib', 'zstd' or 'none'
+        level: Compression level
+        dict_dir: Directory holding trained dictionaries (None disables them)
+    """
+
+    def __init__(self, codec: str = CACHE_COMPRESSION, level: int = CACHE_COMPRESSION_LEVEL,
+                 dict_dir: Optional[str] = None):
+        if codec == CODEC_ZSTD and _zstd() is None:
+            codec = CODEC_ZLIB
+        if codec not in (CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD):
+            raise ValueError(f"Unknown CACHE_COMPRESSION: {codec!r} (expected 'zlib', 'zstd' or 'none')")
+        self.codec = codec
+        self.level = level
+        self.dict_dir = dict_dir
+        self._lock = threading.Lock()
+        # dictionary id -> bytes
+        self._dictionaries: Dict[str, bytes] = {}
+        # cache type -> active dictionary id for self.codec
+        self._active: Dict[str, Optional[str]] = {}
+
+    def _active_path(self, cache_type: str) -> str:
+        return os.path.join(self.dict_dir, f"{cache_type}.{self.codec}.active")
+
+    def active_dictionary(self, cache_type: str) -> Optional[str]:
+        """Id of the dictionary new entries of a cache type are compressed with, if any."""
+        if not self.dict_dir or self.codec == CODEC_NONE:
+            return None
+        if cache_type not in self._active:
+            try:
+                with open(self._active_path(cache_type), 'r', encoding='utf-8') as f:
+                    dict_id = f.read().strip() or None
+            except OSError:
+                dict_id = None
+            with self._lock:
+                self._active[cache_type] = dict_id
+        return self._active[cache_type]
+
+    def _dictionary(self, dict_id: str) -> bytes:
+        zdict = self._dictionaries.get(dict_id)
+        if zdict is None:
+            if not self.dict_dir or not re.fullmatch(r"[a-z]+-[0-9a-f]+", dict_id):
+                raise ValueError(f"Unknown compression dictionary: {dict_id!r}")
+            try:
+                with open(os.path.join(self.dict_dir, f"{dict_id}.dict"), 'rb') as f:
+                    zdict = f.read()
+            except OSError:
+                raise ValueError(f"Missing compression dictionary: {dict_id!r}")
+            with self._lock:
+                self._dictionaries[dict_id] = zdict
+        return zdict
+
+    def compress(self, cache_type: str, raw: bytes) -> Tuple[str, Optional[str], bytes]:
+        """
+        Compress a body.
+
+        Returns:
+            (codec, dictionary id or None, compressed bytes)
+        """
+        if self.codec == CODEC_NONE or len(raw) < MIN_COMPRESS_BYTES:
+            return CODEC_NONE, None, raw
+        dict_id = self.active_dictionary(cache_type)
+        try:
+            zdict = self._dictionary(dict_id) if dict_id else None
+        except ValueError:
+            dict_id, zdict = None, None
+        with metrics.timer('cache_compress'):
+            if self.codec == CODEC_ZSTD:
+                zstandard = _zstd()
+                dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+                body = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data).compress(raw)
+            else:
+                compressor = zlib.compressobj(self.level, zdict=zdict) if zdict else zlib.compressobj(self.level)
+                body = compressor.compress(raw) + compressor.flush()
+        return self.codec, dict_id, body
+
+    def decompress(self, codec: str, dict_id: Optional[str], body: bytes) -> bytes:
+        """
+        Decompress a body written by compress() with any codec and dictionary.
+
+        Raises:
+            ValueError: If the body is corrupted, or its codec or dictionary is unavailable
+        """
+        if codec == CODEC_NONE:
+            return body
+        zdict = self._dictionary(dict_id) if dict_id else None
+        with metrics.timer('cache_decompress'):
+            if codec == CODEC_ZLIB:
+                try:
+                    decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+                    return decompressor.decompress(body) + decompressor.flush()
+                except zlib.error as e:
+                    raise ValueError(f"Corrupted cache entry: {e}")
+            if codec == CODEC_ZSTD:
+                zstandard = _zstd()
+                if zstandard is None:
+                    raise ValueError("Cache entry needs zstd: pip install zstandard")
+                dict_data = zstandard.ZstdCompressionDict(zdict) if zdict else None
+                try:
+                    return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(body)
+                except zstandard.ZstdError as e:
+                    raise ValueError(f"Corrupted cache entry: {e}")
+        raise ValueError(f"Unknown cache entry codec: {codec!r}")
+
+    def train(self, cache_type: str, samples: List[bytes], size: Optional[int] = None) -> str:
+        """
+        Train a dictionary on sample bodies and use it for new entries of a cache type.
+
+        Args:
+            cache_type: Cache type the dictionary is for
+            samples: Uncompressed bodies
+            size: Dictionary size in bytes (defaults to DICT_SIZES for the codec)
+
+        Returns:
+            Id of the new dictionary
+        """
+        if not self.dict_dir or self.codec == CODEC_NONE:
+            raise ValueError("Dictionaries need a dictionary directory and a compression codec")
+        size = size or DICT_SIZES[self.codec]
+        if self.codec == CODEC_ZSTD:
+            zdict = _zstd().train_dictionary(size, samples).as_bytes()
+        else:
+            zdict = train_zlib_dictionary(samples, size)
+        dict_id = f"{self.codec}-{hashlib.sha256(zdict).hexdigest()[:16]}"
+
+        os.makedirs(self.dict_dir, exist_ok=True)
+        for path, content in ((os.path.join(self.dict_dir, f"{dict_id}.dict"), zdict),
+                              (self._active_path(cache_type), dict_id.encode('utf-8'))):
+            fd, tmp_path = tempfile.mkstemp(dir=self.dict_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._dictionaries[dict_id] = zdict
+            self._active[cache_type] = dict_id
+        return dict_id
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Train a compression dictionary on cached entries.")
+    parser.add_argument('command', choices=['train'])
+    parser.add_argument('--type', default='transcript', help="Cache type to train for")
+    parser.add_argument('--samples', type=int, default=500, help="Most recently used entries to sample")
+    args = parser.parse_args(argv)
+
+    from utils import cache
+
+    samples = []
+    for item in cache.list_entries(args.type, limit=args.samples):
+        entry = cache.backend.get(args.type, item['key'])
+        if entry is None:
+            continue
+        try:
+            samples.append(json.dumps(entry.data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        except ValueError:
+            continue
+    if len(samples) < 10:
+        print(f"Need at least 10 cached {args.type} entries to train on, found {len(samples)}")
+        return 1
+    dict_id = cache.compressor.train(args.type, samples)
+    print(f"Trained {dict_id} on {len(samples)} {args.type} entries; new entries use it")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,26 @@
+"""
+Loading of the ``.env`` file.
+
+Settings are read from the environment when modules are imported, so entry
+points (app.py, batch.py) call load_env() before importing the rest of
+utils. Library modules never load it on import; get_openai_api_key() loads
+it on first use so the API key is found wherever the pipeline is started.
+"""
+import threading
+
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def load_env() -> None:
+    """Load ``.env`` into the environment once per process; variables already set win."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        from dotenv import load_dotenv
+        load_dotenv()
+        _loaded = True
@@ -1,40 +1,115 @@
 import json
+import re
 from typing import List, Dict, Any
 
 
-def parse_actions_json(actions_json_string: str) -> List[Dict[str, Any]]:
+def format_summary_html(summary: str) -> str:
     """
-    Parse the actions JSON string and extract steps.
-    
+    Put every bullet of a summary on its own line for the summary card.
+
     Args:
-        actions_json_string: JSON string containing actions
-    
+        summary: Summary text from the model
+
     Returns:
-        List of step dictionaries
+        Non-empty lines joined with ``<br>``
     """
-    try:
-        data = json.loads(actions_json_string)
-        if "steps" in data:
-            return data["steps"]
-        # Fallback: if it's a list directly
-        if isinstance(data, list):
-            return data
-        return []
-    except json.JSONDecodeError:
-        return []
+    # Normalize newlines, then make sure each bullet starts a new line
+    summary_formatted = summary.replace('\r\n', '\n').replace('\r', '\n')
+    summary_formatted = summary_formatted.replace('• ', '\n• ').replace('- ', '\n- ').replace('* ', '\n* ')
+    lines = [line.strip() for line in summary_formatted.split('\n')]
+    return '<br>'.join(line for line in lines if line)
 
 
 def format_timestamp(seconds: float) -> str:
     """
-    Format seconds to mm:ss format.
+    Format seconds to mm:ss format (h:mm:ss for videos over an hour).
     
     Args:
         seconds: Time in seconds
     
     Returns:
-        Formatted timestamp string (mm:ss)
+        Formatted timestamp string (mm:ss or h:mm:ss)
     """
-    minutes = int(seconds // 60)
+    hours = int(seconds // 3600)
+    minutes = int(seconds % 3600 // 60)
     secs = int(seconds % 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
     return f"{minutes:02d}:{secs:02d}"
 
+
+class IncrementalStepParser:
+    """
+    Pull complete ``steps[]`` elements out of a JSON document as it streams in.
+
+    Feed the model's output piece by piece; each call returns the step
+    objects that became complete with that piece. Only the ``steps`` array is
+    parsed incrementally; the full document is still parsed once at the end.
+    """
+
+    _STEPS_KEY = re.compile(r'"steps"\s*:\s*\[')
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._in_steps = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Add streamed text and return any newly completed steps.
+
+        Args:
+            text: Next piece of the model's output
+
+        Returns:
+            List of step dictionaries completed by this piece
+        """
+        self._buffer += text
+        if self._finished:
+            return []
+
+        if not self._in_steps:
+            match = self._STEPS_KEY.search(self._buffer)
+            if not match:
+                return []
+            self._in_steps = True
+            self._pos = match.end()
+
+        steps = []
+        buffer = self._buffer
+        for index in range(self._pos, len(buffer)):
+            char = buffer[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._start = index
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the steps array
+                    self._finished = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    try:
+                        step = json.loads(buffer[self._start:index + 1])
+                    except json.JSONDecodeError:
+                        step = None
+                    if isinstance(step, dict):
+                        steps.append(step)
+                    self._start = None
+        self._pos = len(buffer)
+        return steps
@@ -0,0 +1,495 @@
+"""
+Persistent analysis jobs: a SQLite job table and a pool of worker threads.
+
+The UI submits a job per video and polls its status instead of running the
+pipeline in the Streamlit script thread, so a rerun or a user navigating
+away does not lose the work, and one session can have several analyses in
+flight. At most one queued or running job exists per video; submitting the
+same video again returns that job.
+
+Workers claim jobs atomically, run the cache-aware pipeline (transcript,
+then analysis) and record the outcome; the results themselves live in the
+cache. Jobs submitted with ``stream`` publish the summary and steps as the
+model generates them (``job_events``), which the UI polls for a live
+preview; the events are dropped when the job ends. Workers heartbeat their
+running jobs, and a job whose worker died is requeued once its lease runs
+out. Any number of processes can work the same
+table: the app runs ``JOB_WORKERS`` threads, and more hosts or cores can be
+added with ``python -m utils.jobs --workers N`` sharing ``CACHE_DIR``.
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils import pipeline
+from utils.cache import CACHE_DIR
+from utils.metrics import metrics
+from utils.rate_limit import PRIORITY_INTERACTIVE
+from utils.transcript import TranscriptFailure
+
+
+JOBS_DB = os.getenv("JOBS_DB", str(CACHE_DIR / "jobs.sqlite3"))
+# Worker threads the app starts in its own process; 0 leaves the queue to
+# separate worker processes (python -m utils.jobs)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Idle workers check the table this often (submissions in the same process wake them at once)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+# A running job whose heartbeat is older than this is requeued
+JOB_LEASE_SECONDS = 60
+JOB_MAX_ATTEMPTS = 3
+# Finished jobs are deleted after this long
+JOB_RETENTION_SECONDS = 7 * 86400
+# Stream events are written in batches at most this often
+JOB_EVENT_FLUSH_SECONDS = 0.2
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    priority INTEGER NOT NULL,
+    stream INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error_kind TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_video ON jobs (video_id) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, id);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+"""
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+# Set on submit so idle workers in this process start right away
+_wake = threading.Event()
+
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    path = path or JOBS_DB
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Transactions are explicit (BEGIN IMMEDIATE) so claims never race
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    if path not in _schema_ready:
+        with _schema_lock:
+            if path not in _schema_ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(_SCHEMA)
+                columns = {row['name'] for row in connection.execute("PRAGMA table_info(jobs)")}
+                if 'stream' not in columns:
+                    # Tables created before streamed jobs
+                    connection.execute("ALTER TABLE jobs ADD COLUMN stream INTEGER NOT NULL DEFAULT 0")
+                _schema_ready.add(path)
+    return connection
+
+
+class Job:
+    """One row of the job table."""
+
+    __slots__ = ("id", "video_id", "status", "stage", "priority", "stream", "attempts",
+                 "error_kind", "error", "created_at", "started_at", "finished_at")
+
+    def __init__(self, row: sqlite3.Row):
+        for name in self.__slots__:
+            setattr(self, name, row[name])
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def failure(self) -> Optional[TranscriptFailure]:
+        """The transcript failure that ended the job, if that is how it failed."""
+        if self.status == FAILED and self.error_kind:
+            return TranscriptFailure(self.error_kind, self.error or "")
+        return None
+
+    def __repr__(self) -> str:
+        return f"Job({self.id}, {self.video_id!r}, {self.status})"
+
+
+def submit(video_id: str, priority: int = PRIORITY_INTERACTIVE, stream: bool = False) -> Job:
+    """
+    Queue an analysis of a video, or return the job already queued or running for it.
+
+    Args:
+        video_id: YouTube video ID
+        priority: PRIORITY_INTERACTIVE (UI) or PRIORITY_BATCH; lower runs first
+        stream: Publish the summary and steps while they are generated (see get_job_events())
+
+    Returns:
+        The video's active job
+    """
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE video_id = ? AND status IN ('queued', 'running')", (video_id,)
+            ).fetchone()
+            if row is None:
+                cursor = connection.execute(
+                    "INSERT INTO jobs (video_id, status, priority, stream, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (video_id, QUEUED, priority, int(stream), time.time())
+                )
+                row = connection.execute("SELECT * FROM jobs WHERE id = ?", (cursor.lastrowid,)).fetchone()
+                result = 'new'
+            else:
+                if priority < row['priority']:
+                    # An interactive request overtakes a queued batch job
+                    connection.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, row['id']))
+                if stream and not row['stream']:
+                    # Takes effect if the analysis has not started yet
+                    connection.execute("UPDATE jobs SET stream = 1 WHERE id = ?", (row['id'],))
+                row = connection.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+                result = 'deduplicated'
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.close()
+    metrics.inc('jobs_submitted', result=result)
+    _wake.set()
+    return Job(row)
+
+
+def get_job(job_id: int) -> Optional[Job]:
+    """Return a job by ID, or None if it does not exist (or was pruned)."""
+    connection = _connect()
+    try:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        connection.close()
+    return None if row is None else Job(row)
+
+
+def get_job_events(job_id: int) -> List[Tuple[str, Any]]:
+    """
+    Return the events a streamed job has published so far, oldest first.
+
+    Consecutive summary pieces are merged, so each call gives the summary
+    text so far and every step found so far. Empty once the job has ended.
+
+    Returns:
+        (event_type, payload) tuples: ``("summary", text)`` or ``("step", dict)``
+    """
+    connection = _connect()
+    try:
+        rows = connection.execute(
+            "SELECT kind, payload FROM job_events WHERE job_id = ? ORDER BY seq", (job_id,)
+        ).fetchall()
+    finally:
+        connection.close()
+    return [(row['kind'], json.loads(row['payload'])) for row in rows]
+
+
+def queue_position(job: Job) -> int:
+    """Number of queued jobs that will be claimed before this one (0 if it is next or not queued)."""
+    if job.status != QUEUED:
+        return 0
+    connection = _connect()
+    try:
+        return connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND id < ?))",
+            (job.priority, job.priority, job.id)
+        ).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def get_job_stats() -> Dict[str, int]:
+    """Return the number of jobs per status."""
+    connection = _connect()
+    try:
+        rows = connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+    finally:
+        connection.close()
+    stats = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+    stats.update({status: count for status, count in rows})
+    return stats
+
+
+def _claim(connection: sqlite3.Connection, worker: str) -> Optional[Job]:
+    """Atomically take the next queued job, requeueing jobs whose worker stopped heartbeating."""
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        expired = now - JOB_LEASE_SECONDS
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Worker stopped responding' "
+            "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (now, expired, JOB_MAX_ATTEMPTS)
+        )
+        connection.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ?",
+            (expired,)
+        )
+        row = connection.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority, id LIMIT 1"
+        ).fetchone()
+        job = None
+        if row is not None:
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                "started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (worker, now, now, row['id'])
+            )
+            job = Job(connection.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone())
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    return job
+
+
+def _update(connection: sqlite3.Connection, job_id: int, **fields) -> None:
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _finish(connection: sqlite3.Connection, job_id: int, **fields) -> None:
+    """Record how a job ended and drop its stream events (the result is in the cache)."""
+    _update(connection, job_id, finished_at=time.time(), **fields)
+    connection.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+
+
+class _EventWriter:
+    """
+    Buffers a streamed job's events and writes them in batches.
+
+    Consecutive summary pieces are merged into one event. Events are a
+    preview only, so a failed write drops them instead of failing the job.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, job_id: int):
+        self.connection = connection
+        self.job_id = job_id
+        self.seq = 0
+        self._pending: List[List[Any]] = []
+        self._flushed_at = time.monotonic()
+
+    def add(self, kind: str, payload: Any) -> None:
+        if kind == 'summary' and self._pending and self._pending[-1][0] == 'summary':
+            self._pending[-1][1] += payload
+        else:
+            self._pending.append([kind, payload])
+        if time.monotonic() - self._flushed_at >= JOB_EVENT_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self) -> None:
+        pending, self._pending = self._pending, []
+        self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        rows = []
+        for kind, payload in pending:
+            self.seq += 1
+            rows.append((self.job_id, self.seq, kind, json.dumps(payload, ensure_ascii=False)))
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany("INSERT OR REPLACE INTO job_events VALUES (?, ?, ?, ?)", rows)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            pass
+
+
+def _stream_analysis(connection: sqlite3.Connection, job: Job, transcript) -> None:
+    """Analyze through the streaming pipeline, publishing the summary and steps as they arrive."""
+    # Left over from an earlier attempt whose worker died
+    connection.execute("DELETE FROM job_events WHERE job_id = ?", (job.id,))
+    events = _EventWriter(connection, job.id)
+    for kind, payload in pipeline.stream_cached_analysis(job.video_id, transcript, priority=job.priority):
+        if kind != 'done':
+            events.add(kind, payload)
+    events.flush()
+
+
+def run_job(connection: sqlite3.Connection, job: Job) -> None:
+    """Run the pipeline for a claimed job and record how it ended."""
+    started = time.perf_counter()
+    try:
+        _update(connection, job.id, stage='transcript')
+        transcript = pipeline.get_cached_transcript(job.video_id)
+        if isinstance(transcript, TranscriptFailure):
+            _finish(connection, job.id, status=FAILED, error_kind=transcript.kind, error=transcript.message)
+            status = FAILED
+        else:
+            _update(connection, job.id, stage='analysis')
+            # Re-read: a streaming submission may have joined the job after it was claimed
+            stream = connection.execute("SELECT stream FROM jobs WHERE id = ?", (job.id,)).fetchone()['stream']
+            if stream:
+                _stream_analysis(connection, job, transcript)
+            else:
+                pipeline.get_cached_analysis(job.video_id, transcript, priority=job.priority)
+            _finish(connection, job.id, status=DONE)
+            status = DONE
+    except Exception as e:
+        _finish(connection, job.id, status=FAILED, error=str(e))
+        status = FAILED
+    metrics.observe('job', time.perf_counter() - started)
+    metrics.inc('jobs_finished', status=status)
+
+
+class WorkerPool:
+    """
+    Worker threads that claim and run jobs until stopped.
+
+    Args:
+        workers: Number of worker threads
+        poll_seconds: How often idle workers check the job table
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, poll_seconds: float = JOB_POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._running: Set[int] = set()
+        self._threads: List[threading.Thread] = []
+        self._name = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self) -> "WorkerPool":
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{self._name}:{index}",),
+                                      name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        return self
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop claiming jobs; with ``wait``, let running jobs finish first."""
+        self._stop.set()
+        _wake.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _work(self, worker: str) -> None:
+        connection = _connect()
+        try:
+            while not self._stop.is_set():
+                try:
+                    job = _claim(connection, worker)
+                except sqlite3.Error:
+                    job = None
+                if job is None:
+                    _wake.wait(self.poll_seconds)
+                    _wake.clear()
+                    continue
+                with self._lock:
+                    self._running.add(job.id)
+                try:
+                    run_job(connection, job)
+                except sqlite3.Error:
+                    # Could not record the outcome; the lease runs out and the job is retried
+                    pass
+                finally:
+                    with self._lock:
+                        self._running.discard(job.id)
+        finally:
+            connection.close()
+
+    def _heartbeat(self) -> None:
+        connection = _connect()
+        last_prune = 0.0
+        try:
+            while not self._stop.wait(JOB_LEASE_SECONDS / 3):
+                now = time.time()
+                with self._lock:
+                    running = list(self._running)
+                try:
+                    connection.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+                                           [(now, job_id) for job_id in running])
+                    if now - last_prune > 3600:
+                        connection.execute(
+                            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                            (now - JOB_RETENTION_SECONDS,)
+                        )
+                        # Events of jobs that ended without cleaning up (e.g. a worker died)
+                        connection.execute(
+                            "DELETE FROM job_events WHERE job_id NOT IN "
+                            "(SELECT id FROM jobs WHERE status IN ('queued', 'running'))"
+                        )
+                        last_prune = now
+                except sqlite3.Error:
+                    pass
+        finally:
+            connection.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of worker threads and jobs running on them."""
+        with self._lock:
+            return {"workers": self.workers, "running": len(self._running)}
+
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def start_workers(workers: int = JOB_WORKERS) -> Optional[WorkerPool]:
+    """
+    Start this process's worker pool once (later calls return the same pool).
+
+    Args:
+        workers: Worker threads; 0 starts none
+
+    Returns:
+        The running pool, or None if ``workers`` is 0
+    """
+    global _pool
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(workers).start()
+        return _pool
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run analysis job workers against the shared job table.")
+    parser.add_argument("--workers", type=int, default=max(1, JOB_WORKERS),
+                        help="Worker threads in this process (default: JOB_WORKERS)")
+    args = parser.parse_args(argv)
+
+    pool = WorkerPool(args.workers).start()
+    print(f"{args.workers} job worker(s) on {JOBS_DB}; Ctrl-C to stop after running jobs finish")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
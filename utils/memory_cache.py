@@ -0,0 +1,151 @@
+"""
+Bounded in-process LRU tier in front of the persistent file cache.
+
+Every session in the process shares one tier keyed by ``(cache_type, key)``,
+where ``key`` is the compact content-addressed cache key (never the transcript
+body). It is bounded by approximate bytes and by entry count, so memory stays
+flat on long-lived servers.
+"""
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.metrics import metrics
+
+
+MEMORY_CACHE_MAX_BYTES = int(float(os.getenv("MEMORY_CACHE_MAX_MB", "64")) * 1024 * 1024)
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "512"))
+
+
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """
+    Approximate the memory held by a value, following containers and slots.
+
+    Args:
+        value: Object to measure
+
+    Returns:
+        Size in bytes (shared objects are only counted once)
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, _seen) for item in value)
+    for cls in type(value).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            size += estimate_size(getattr(value, slot, None), _seen)
+    if hasattr(value, "__dict__"):
+        size += estimate_size(vars(value), _seen)
+    return size
+
+
+class MemoryCache:
+    """
+    Thread-safe LRU mapping with per-entry expiry and byte/entry bounds.
+
+    Args:
+        max_bytes: Evict least recently used entries past this many bytes
+        max_entries: Evict least recently used entries past this count
+        clock: Time source (seconds)
+    """
+
+    def __init__(self, max_bytes: int = MEMORY_CACHE_MAX_BYTES,
+                 max_entries: int = MEMORY_CACHE_MAX_ENTRIES, clock=time.time):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        # (cache_type, key) -> (value, size, expires_at)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.evictions = 0
+
+    def get(self, cache_type: str, key: str) -> Optional[Any]:
+        """Return the value for a key, or None if missing or expired."""
+        entry_key = (cache_type, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[2] <= self.clock():
+                self._remove(entry_key)
+                entry = None
+            counter = self.misses if entry is None else self.hits
+            counter[cache_type] = counter.get(cache_type, 0) + 1
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+        metrics.inc('cache_requests', tier='memory', type=cache_type, result='miss' if entry is None else 'hit')
+        return None if entry is None else entry[0]
+
+    def put(self, cache_type: str, key: str, value: Any, ttl: float) -> None:
+        """
+        Store a value for ``ttl`` seconds, evicting old entries as needed.
+
+        Values larger than the whole byte budget are not kept.
+        """
+        if ttl <= 0:
+            return
+        size = estimate_size(value)
+        entry_key = (cache_type, key)
+        evicted = 0
+        with self._lock:
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            if size > self.max_bytes:
+                return
+            self._entries[entry_key] = (value, size, self.clock() + ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+            self.evictions += evicted
+        metrics.inc('cache_evictions', evicted, tier='memory', reason='lru')
+
+    def discard(self, cache_type: Optional[str] = None) -> None:
+        """Drop every entry, or only those of one cache type."""
+        with self._lock:
+            for entry_key in list(self._entries):
+                if cache_type is None or entry_key[0] == cache_type:
+                    self._remove(entry_key)
+
+    def _remove(self, entry_key: Tuple[str, str]) -> None:
+        _, size, _ = self._entries.pop(entry_key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count, memory use and hit ratios (overall and per cache type)."""
+        with self._lock:
+            hits = sum(self.hits.values())
+            lookups = hits + sum(self.misses.values())
+            by_type = {}
+            for cache_type in set(self.hits) | set(self.misses):
+                type_hits = self.hits.get(cache_type, 0)
+                type_lookups = type_hits + self.misses.get(cache_type, 0)
+                by_type[cache_type] = round(type_hits / type_lookups, 3) if type_lookups else 0.0
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "misses": lookups - hits,
+                "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+                "hit_ratio_by_type": by_type,
+                "evictions": self.evictions,
+            }
+
+
+# Shared by every session in this process
+memory_cache = MemoryCache()
@@ -0,0 +1,202 @@
+"""
+In-process metrics: per-stage timings, token usage and cache counters.
+
+Stages (URL parsing, cache lookup, YouTube fetch, each LLM call, JSON parsing,
+rendering) record durations; p50/p95 come from the most recent observations
+of each stage. Counters carry labels, e.g. tokens by kind and call, or cache
+hits by tier and type. Everything can be exported as JSON or in the
+Prometheus text format, optionally over a small local HTTP endpoint.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+
+METRICS_PREFIX = "vidtodo"
+# Observations kept per stage for percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+# Local scrape endpoint (/metrics and /metrics.json); 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class _Stage:
+    __slots__ = ("count", "total", "recent")
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage timings and labeled counters.
+
+    Args:
+        window: Number of recent observations per stage used for percentiles
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Stage] = {}
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record one duration for a stage."""
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = _Stage(self.window)
+            entry.count += 1
+            entry.total += seconds
+            entry.recent.append(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Time the enclosed block as one observation of ``stage`` (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name: str, amount: float = 1, **labels: Any) -> None:
+        """Add to a counter, e.g. ``inc("cache_requests", tier="file", type="analysis", result="hit")``."""
+        if not amount:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def stage_stats(self) -> Dict[str, Dict[str, float]]:
+        """Return count, total, p50, p95 and max (seconds) per stage."""
+        with self._lock:
+            stages = {name: (entry.count, entry.total, sorted(entry.recent))
+                      for name, entry in self._stages.items()}
+        return {
+            name: {
+                "count": count,
+                "sum": round(total, 6),
+                "p50": round(_percentile(recent, 0.5), 6),
+                "p95": round(_percentile(recent, 0.95), 6),
+                "max": round(recent[-1], 6) if recent else 0.0,
+            }
+            for name, (count, total, recent) in sorted(stages.items())
+        }
+
+    def counters(self) -> Dict[str, list]:
+        """Return counters as ``{name: [{"labels": {...}, "value": n}, ...]}``."""
+        with self._lock:
+            items = sorted(self._counters.items())
+        result: Dict[str, list] = {}
+        for (name, labels), value in items:
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable view of every stage and counter."""
+        return {"stages": self.stage_stats(), "counters": self.counters()}
+
+    def render_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Duration of each pipeline stage",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, stats in self.stage_stats().items():
+            for quantile, field in (("0.5", "p50"), ("0.95", "p95")):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {stats[field]}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats["sum"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+
+        for name, series in self.counters().items():
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for item in series:
+                labels = ",".join(f'{key}="{_escape(value)}"' for key, value in item["labels"].items())
+                lines.append(f"{metric}{{{labels}}} {item['value']:g}" if labels else f"{metric} {item['value']:g}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by every session in this process
+metrics = Metrics()
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_metrics(host: str = METRICS_HOST, port: int = METRICS_PORT,
+                  registry: Optional[Metrics] = None) -> bool:
+    """
+    Serve ``/metrics`` (Prometheus text) and ``/metrics.json`` once per process.
+
+    Args:
+        host: Interface to bind (local only by default)
+        port: TCP port; 0 disables the endpoint
+        registry: Metrics to export (defaults to the shared one)
+
+    Returns:
+        True if the endpoint is running
+    """
+    global _server
+    registry = registry or metrics
+    if not port:
+        return False
+    with _server_lock:
+        if _server is not None:
+            return True
+        # http.server pulls in http.client, email and ssl; only the app serves metrics
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode("utf-8")
+                    content_type = "application/json"
+                elif self.path.split("?")[0] == "/metrics":
+                    body = registry.render_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            _server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            # Port taken, e.g. by another app process: scrape that one instead
+            return False
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return True
@@ -1,9 +1,78 @@
 import os
+import re
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import queue
+import threading
+import time
+from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 
-load_dotenv()
+from utils.cache import make_cache_key
+from utils.env import load_env
+from utils.format import format_timestamp, IncrementalStepParser
+from utils.metrics import metrics
+from utils.preprocess import preprocess_transcript, PREPROCESS_ENABLED, PREPROCESS_DROP_FILLER
+from utils.rate_limit import OpenAIScheduler, PRIORITY_INTERACTIVE, is_transient_error
+from utils.transcript import Transcript, MARKER_INTERVAL_SECONDS
+
+MODEL = "gpt-4o-mini"
+
+# Long transcripts (1-3 hour tutorials) are split into overlapping windows that
+# are analyzed in parallel and merged back into a single document.
+# Token counts are estimated at ~4 characters per token.
+CHARS_PER_TOKEN = 4
+CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "3000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("ANALYSIS_CHUNK_OVERLAP_TOKENS", "150"))
+MAX_PARALLEL_CHUNKS = int(os.getenv("ANALYSIS_MAX_PARALLEL_CHUNKS", "4"))
+SUMMARY_EXCERPT_CHARS = 4000
+
+# How the analysis is requested (ANALYSIS_MODE):
+# - "two_call": JSON-mode action requests per window plus a separate summary request
+# - "single_call": one JSON-schema-constrained request per window that returns
+#   steps, tools and summary together
+ANALYSIS_MODE_TWO_CALL = "two_call"
+ANALYSIS_MODE_SINGLE_CALL = "single_call"
+ANALYSIS_MODES = (ANALYSIS_MODE_TWO_CALL, ANALYSIS_MODE_SINGLE_CALL)
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", ANALYSIS_MODE_TWO_CALL)
+if ANALYSIS_MODE not in ANALYSIS_MODES:
+    raise ValueError(f"ANALYSIS_MODE must be one of {', '.join(ANALYSIS_MODES)}, got {ANALYSIS_MODE!r}")
+# Single-call windows are larger, so most videos need exactly one request
+SINGLE_CALL_CHUNK_TOKENS = int(os.getenv("ANALYSIS_SINGLE_CALL_TOKENS", "24000"))
+
+# Upper bound for a single completion request, in seconds
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "60"))
+
+# Connection pool for the shared client
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# Retries per request, made by the scheduler (the SDK itself never retries)
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+
+# Account rate limits enforced client-side (defaults: gpt-4o-mini, usage tier 1)
+REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_RPM", "500"))
+TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TPM", "200000"))
+# Completion tokens reserved per request when budgeting TPM
+ACTION_COMPLETION_TOKENS = 800
+SUMMARY_COMPLETION_TOKENS = 200
+
+
+def _is_transient_openai_error(error: BaseException) -> bool:
+    """is_transient_error(), plus the SDK's connection errors and timeouts."""
+    from openai import APIConnectionError
+    return isinstance(error, APIConnectionError) or is_transient_error(error)
+
+
+# Shared by every request in this process
+scheduler = OpenAIScheduler(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE,
+                            max_attempts=MAX_RETRIES + 1, transient=_is_transient_openai_error)
+
+# Steps from overlapping windows that are at least this similar are duplicates
+STEP_SIMILARITY_THRESHOLD = 0.85
+
+# Segment markers inserted by Transcript.annotated_text()
+SEGMENT_MARKER_RE = re.compile(r"\[\d+\] ?")
 
 # Get API key from Streamlit secrets (for cloud deployment) or environment variable (for local)
 def get_openai_api_key():
@@ -12,41 +81,130 @@ def get_openai_api_key():
         # Try Streamlit secrets first (works on Streamlit Cloud)
         import streamlit as st
         return st.secrets["OPENAI_API_KEY"]
-    except (KeyError, AttributeError, RuntimeError, ImportError):
+    except (KeyError, AttributeError, RuntimeError, ImportError, FileNotFoundError):
         # Fallback to environment variable (works locally with .env file)
+        load_env()
         return os.getenv("OPENAI_API_KEY")
 
+class ConnectionStats:
+    """
+    Thread-safe counters showing whether HTTP connections are being reused.
+
+    Every request is counted; a request that had to open a TCP connection is
+    counted as a new connection, every other request reused a pooled one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def on_request(self, request) -> None:
+        """httpx request hook: count the request and trace connection setup."""
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current counters."""
+        with self._lock:
+            requests = self.requests
+            new_connections = self.new_connections
+        reused = max(requests - new_connections, 0)
+        return {
+            "requests": requests,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / requests, 3) if requests else 0.0,
+        }
+
+
+# Shared client: created on first use, rebuilt only when the API key changes
+_client = None
+_client_api_key = None
+_client_lock = threading.Lock()
+connection_stats = ConnectionStats()
+
+
+def _build_client(api_key: str):
+    """Create an OpenAI client with a keep-alive connection pool."""
+    # The SDK takes a large share of startup time; pages served from the cache never need it
+    import httpx
+    from openai import OpenAI, DefaultHttpxClient
+
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=10.0),
+        event_hooks={"request": [connection_stats.on_request]},
+    )
+    # No SDK retries: a 429 retried inside the SDK would bypass the scheduler's
+    # shared backoff, so the scheduler retries every failed request instead
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
 # Initialize client lazily to avoid issues with st.secrets at module level
 def get_openai_client():
-    """Get OpenAI client with API key from secrets or environment."""
-    api_key = get_openai_api_key()
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in Streamlit secrets or environment variables. Please set it in .env file (local) or Streamlit Cloud secrets (deployment).")
-    return OpenAI(api_key=api_key)
+    """
+    Get the process-wide OpenAI client, creating it on first use.
+
+    The API key is read from secrets or environment only when the client is
+    built; call refresh_openai_client() after changing the key.
+    """
+    global _client, _client_api_key
+    client = _client
+    if client is not None:
+        return client
 
+    with _client_lock:
+        if _client is None:
+            api_key = get_openai_api_key()
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY not found in Streamlit secrets or environment variables. Please set it in .env file (local) or Streamlit Cloud secrets (deployment).")
+            _client = _build_client(api_key)
+            _client_api_key = api_key
+        return _client
 
-def extract_actions_and_summary(transcript: str):
+
+def refresh_openai_client() -> bool:
     """
-    Extract actionable steps and summary from YouTube transcript using OpenAI.
-    
-    Args:
-        transcript: Full transcript text
-    
+    Re-read the API key and rebuild the shared client if it changed.
+
+    Requests already in flight finish on the previous client.
+
     Returns:
-        tuple: (actions_json_string, summary_string)
+        True if the client was rebuilt
     """
-    # Get client (will load API key from secrets or env)
-    client = get_openai_client()
-    
-    # Truncate transcript if too long (to avoid token limits)
-    transcript_snippet = transcript[:10000] if len(transcript) > 10000 else transcript
-    
-    # --- Action Extraction ---
-    action_prompt = f"""
+    global _client, _client_api_key
+    api_key = get_openai_api_key()
+    with _client_lock:
+        if _client is not None and api_key == _client_api_key:
+            return False
+        _client = _build_client(api_key) if api_key else None
+        _client_api_key = api_key
+        return True
+
+
+def get_connection_stats() -> Dict[str, Any]:
+    """Return connection reuse counters for the shared client."""
+    return connection_stats.snapshot()
+
+
+ACTION_PROMPT_TEMPLATE = """
 You are an AI engineer that extracts clear, actionable steps from YouTube tutorials.
 
+This is part {part} of {total} of the transcript. Only extract steps and tools from this part.
+
 From this transcript, extract:
-1. Actionable steps with timestamps and code (if mentioned)
+1. Actionable steps with code (if mentioned)
 2. Tools mentioned in the video - when a tool (like Super Whisper, API, library, framework, etc.) is discussed, capture:
    - The tool name
    - Why it's being used (the purpose/context)
@@ -55,16 +213,18 @@ From this transcript, extract:
 
 IMPORTANT: If tools are mentioned, provide detailed context about their usage. Don't just mention the tool name - explain why it's needed and how it's used.
 
+The transcript contains numbered markers like [42]. For every step and tool, set "segment" to the number of the last marker before the point where it is discussed.
+
 Return JSON in this exact format:
 {{
   "steps": [
-    {{ "step": "string", "timestamp": "mm:ss", "code": "optional code snippet", "tool_context": "optional - explain tool usage if mentioned" }},
-    {{ "step": "string", "timestamp": "mm:ss", "code": "", "tool_context": "" }}
+    {{ "step": "string", "segment": 0, "code": "optional code snippet", "tool_context": "optional - explain tool usage if mentioned" }},
+    {{ "step": "string", "segment": 0, "code": "", "tool_context": "" }}
   ],
   "tools": [
     {{
       "name": "tool name",
-      "timestamp": "mm:ss",
+      "segment": 0,
       "purpose": "why this tool is used",
       "context": "what aspect/part is explained",
       "usage": "how it fits in the workflow"
@@ -75,31 +235,657 @@ Return JSON in this exact format:
 Note: If no tools are mentioned, return an empty "tools" array. The "tool_context" field in steps should explain any tool usage mentioned in that specific step.
 
 Transcript:
-{transcript_snippet}
+{transcript}
 """
 
-    action_res = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": action_prompt}],
-        response_format={"type": "json_object"}
-    )
+SUMMARY_PROMPT_TEMPLATE = """
+Summarize this video in 3 short bullet points (max 120 words total).
 
-    actions = action_res.choices[0].message.content
+Transcript:
+{transcript}
+"""
 
-    # --- Summary ---
-    summary_snippet = transcript[:4000] if len(transcript) > 4000 else transcript
-    summary_prompt = f"""
-Summarize this video in 3 short bullet points (max 120 words total).
+STRUCTURED_PROMPT_TEMPLATE = """
+You are an AI engineer that extracts clear, actionable steps from YouTube tutorials.
+
+This is part {part} of {total} of the transcript. Only use this part.
+
+From this transcript, extract:
+1. Actionable steps, with code when it is mentioned ("code" and "tool_context" may be empty strings)
+2. Tools discussed in the video (libraries, APIs, frameworks, apps): why each is used, what aspect is explained and how it fits into the workflow
+3. A summary in 3 short bullet points starting with "• " (max 120 words total)
+
+The transcript contains numbered markers like [42]. For every step and tool, set "segment" to the number of the last marker before the point where it is discussed.
 
 Transcript:
-{summary_snippet}
+{transcript}
 """
 
-    summary_res = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": summary_prompt}]
+# Single-call mode, several windows: one summary from the windows' summaries
+SUMMARY_REDUCE_PROMPT_TEMPLATE = """
+These are summaries of consecutive parts of one video, in order.
+
+Combine them into a summary of the whole video in 3 short bullet points starting with "• " (max 120 words total).
+
+Part summaries:
+{summaries}
+"""
+
+_STEP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "step": {"type": "string"},
+        "segment": {"type": "integer"},
+        "code": {"type": "string"},
+        "tool_context": {"type": "string"},
+    },
+    "required": ["step", "segment", "code", "tool_context"],
+    "additionalProperties": False,
+}
+
+_TOOL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "segment": {"type": "integer"},
+        "purpose": {"type": "string"},
+        "context": {"type": "string"},
+        "usage": {"type": "string"},
+    },
+    "required": ["name", "segment", "purpose", "context", "usage"],
+    "additionalProperties": False,
+}
+
+# Steps come first so they can be streamed while the rest is generated
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "steps": {"type": "array", "items": _STEP_SCHEMA},
+        "tools": {"type": "array", "items": _TOOL_SCHEMA},
+        "summary": {"type": "string"},
+    },
+    "required": ["steps", "tools", "summary"],
+    "additionalProperties": False,
+}
+
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "video_analysis", "strict": True, "schema": ANALYSIS_SCHEMA},
+}
+
+
+def _prompt_fingerprint(mode: str = ANALYSIS_MODE) -> str:
+    """Hash everything that shapes the model's output for a given transcript."""
+    if mode == ANALYSIS_MODE_SINGLE_CALL:
+        return make_cache_key(
+            mode, STRUCTURED_PROMPT_TEMPLATE, SUMMARY_REDUCE_PROMPT_TEMPLATE,
+            json.dumps(ANALYSIS_SCHEMA, sort_keys=True),
+            SINGLE_CALL_CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, MARKER_INTERVAL_SECONDS,
+            PREPROCESS_ENABLED, PREPROCESS_DROP_FILLER
+        )[:16]
+    return make_cache_key(
+        ACTION_PROMPT_TEMPLATE, SUMMARY_PROMPT_TEMPLATE,
+        CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, SUMMARY_EXCERPT_CHARS, MARKER_INTERVAL_SECONDS,
+        PREPROCESS_ENABLED, PREPROCESS_DROP_FILLER
+    )[:16]
+
+
+# Each mode has its own fingerprint, so its analyses are cached under their own keys
+PROMPT_FINGERPRINT = _prompt_fingerprint()
+
+# Fingerprints of earlier two-call prompt versions whose cached analyses are
+# still good enough to serve. Add the old value here when a prompt edit should
+# not force recomputing every cached video.
+COMPATIBLE_PROMPT_FINGERPRINTS = (
+    "1e55af00bb1413da",  # before transcript preprocessing
+)
+
+
+def analysis_cache_key(video_id: str, language: Optional[str],
+                       model: str = MODEL, fingerprint: str = PROMPT_FINGERPRINT) -> str:
+    """
+    Cache key for an analysis.
+
+    Changing the transcript language, the model or the prompts yields a new
+    key, so stale analyses are never served after a prompt change.
+    """
+    return make_cache_key('analysis', video_id, language, model, fingerprint)
+
+
+def analysis_fallback_keys(video_id: str, language: Optional[str]) -> List[str]:
+    """
+    Keys of older cached analyses that are still valid for the current prompts.
+
+    Analyses from before versioned keys (keyed by bare video ID) are never
+    reused: they were made from a truncated transcript with timestamps the
+    model guessed.
+    """
+    if ANALYSIS_MODE != ANALYSIS_MODE_TWO_CALL:
+        return []
+    return [analysis_cache_key(video_id, language, fingerprint=fingerprint)
+            for fingerprint in COMPATIBLE_PROMPT_FINGERPRINTS]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def prepare_transcript(transcript: Union[Transcript, str]) -> Transcript:
+    """Wrap plain text and compact the transcript for prompting (see utils/preprocess.py)."""
+    if not isinstance(transcript, Transcript):
+        transcript = Transcript.from_text(transcript)
+    if PREPROCESS_ENABLED:
+        transcript = preprocess_transcript(transcript)
+    return transcript
+
+
+def estimate_analysis_tokens(transcript: Union[Transcript, str], mode: Optional[str] = None) -> int:
+    """Estimate the prompt tokens an uncached analysis of this transcript will send."""
+    transcript = prepare_transcript(transcript)
+    annotated = transcript.annotated_text()
+    if (mode or ANALYSIS_MODE) == ANALYSIS_MODE_SINGLE_CALL:
+        chunks = split_transcript(annotated, max_tokens=SINGLE_CALL_CHUNK_TOKENS) or [annotated]
+        template_tokens = estimate_tokens(STRUCTURED_PROMPT_TEMPLATE)
+        tokens = sum(estimate_tokens(chunk) + template_tokens for chunk in chunks)
+        if len(chunks) > 1:
+            # The request that condenses the windows' summaries
+            tokens += estimate_tokens(SUMMARY_REDUCE_PROMPT_TEMPLATE) + len(chunks) * SUMMARY_COMPLETION_TOKENS
+        return tokens
+    chunks = split_transcript(annotated) or [annotated]
+    template_tokens = estimate_tokens(ACTION_PROMPT_TEMPLATE)
+    return (sum(estimate_tokens(chunk) + template_tokens for chunk in chunks)
+            + estimate_tokens(SUMMARY_PROMPT_TEMPLATE) + estimate_tokens(_summary_excerpt(chunks)))
+
+
+def split_transcript(
+    transcript: str,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> List[str]:
+    """
+    Split a transcript into token-budgeted, overlapping windows.
+
+    Windows end on whitespace so words are never cut in half, and each window
+    repeats the last ``overlap_tokens`` of the previous one so steps that
+    straddle a boundary are seen whole by at least one window.
+
+    Args:
+        transcript: Full transcript text
+        max_tokens: Estimated token budget per window
+        overlap_tokens: Estimated tokens shared between consecutive windows
+
+    Returns:
+        List of transcript windows, in order
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 2)
+    length = len(transcript)
+
+    chunks = []
+    start = 0
+    while start < length:
+        end = min(start + max_chars, length)
+        if end < length:
+            # Back off to the last word boundary inside the window
+            boundary = transcript.rfind(" ", start + overlap_chars + 1, end)
+            if boundary != -1:
+                end = boundary
+        chunks.append(transcript[start:end].strip())
+        if end >= length:
+            break
+
+        # Start the next window a little before this one ended, on a word boundary
+        next_start = transcript.find(" ", end - overlap_chars, end)
+        start = next_start + 1 if next_start != -1 else end
+
+    return [chunk for chunk in chunks if chunk]
+
+
+def _normalize_text(text: str) -> str:
+    """Lowercase and strip punctuation so near-identical strings compare equal."""
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+def merge_chunk_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-window analyses into one ordered ``{"steps", "tools"}`` document.
+
+    Steps keep the order of the windows they came from. A step is dropped when
+    it repeats one of the recently kept steps, which is what the overlap
+    between consecutive windows produces. Tools are deduplicated by name, and
+    empty fields on the first occurrence are filled from later ones.
+
+    Args:
+        results: Parsed JSON responses, one per window, in window order
+
+    Returns:
+        Dictionary with merged ``steps`` and ``tools`` lists
+    """
+    steps = []
+    recent_keys = []
+    tools = []
+    tools_by_name = {}
+
+    for result in results:
+        for step in result.get("steps") or []:
+            if not isinstance(step, dict):
+                continue
+            key = _normalize_text(step.get("step", ""))
+            if not key:
+                continue
+            if any(SequenceMatcher(None, key, seen).ratio() >= STEP_SIMILARITY_THRESHOLD
+                   for seen in recent_keys):
+                continue
+            steps.append(step)
+            recent_keys = (recent_keys + [key])[-10:]
+
+        for tool in result.get("tools") or []:
+            if not isinstance(tool, dict):
+                continue
+            name = _normalize_text(tool.get("name", ""))
+            if not name:
+                continue
+            if name in tools_by_name:
+                existing = tools_by_name[name]
+                for field, value in tool.items():
+                    if value and not existing.get(field):
+                        existing[field] = value
+                continue
+            tools_by_name[name] = dict(tool)
+            tools.append(tools_by_name[name])
+
+    return {"steps": steps, "tools": tools}
+
+
+def attach_timestamps(actions: Dict[str, Any], transcript: Transcript) -> Dict[str, Any]:
+    """
+    Replace the ``segment`` cited by the model with the segment's real time.
+
+    Each step and tool gets ``start`` (seconds) and a formatted ``timestamp``;
+    items citing an unknown segment get ``"N/A"``.
+
+    Args:
+        actions: Merged ``{"steps", "tools"}`` document
+        transcript: Transcript the segment numbers refer to
+
+    Returns:
+        The same document, updated in place
+    """
+    for item in (actions.get("steps") or []) + (actions.get("tools") or []):
+        _attach_timestamp(item, transcript)
+    return actions
+
+
+def _attach_timestamp(item: Dict[str, Any], transcript: Transcript) -> Dict[str, Any]:
+    """Resolve one step or tool's ``segment`` into ``start`` and ``timestamp``."""
+    start = transcript.segment_start(item.pop("segment", None))
+    if start is None:
+        item["timestamp"] = "N/A"
+    else:
+        item["start"] = start
+        item["timestamp"] = format_timestamp(start)
+    return item
+
+
+def _summary_excerpt(chunks: List[str], max_chars: int = SUMMARY_EXCERPT_CHARS) -> str:
+    """Build a summary input that samples evenly from every window."""
+    if not chunks:
+        return ""
+    per_chunk = max(max_chars // len(chunks), 1)
+    return " … ".join(SEGMENT_MARKER_RE.sub("", chunk)[:per_chunk] for chunk in chunks)
+
+
+def _completion_stage(kwargs: Dict[str, Any]) -> str:
+    """Metrics stage name of a request: llm_action, llm_structured or llm_summary."""
+    response_type = (kwargs.get("response_format") or {}).get("type")
+    if response_type == "json_schema":
+        return "llm_structured"
+    return "llm_action" if response_type == "json_object" else "llm_summary"
+
+
+def _record_usage(stage: str, usage) -> None:
+    if usage is not None:
+        metrics.inc("llm_tokens", getattr(usage, "prompt_tokens", 0) or 0, kind="prompt", stage=stage)
+        metrics.inc("llm_tokens", getattr(usage, "completion_tokens", 0) or 0, kind="completion", stage=stage)
+
+
+def _metered_stream(stream, stage: str, started: float):
+    """Pass a stream through, recording its total duration and reported usage."""
+    try:
+        for chunk in stream:
+            _record_usage(stage, getattr(chunk, "usage", None))
+            yield chunk
+    finally:
+        metrics.observe(stage, time.perf_counter() - started)
+
+
+def _create_completion(client, prompt: str, completion_tokens: int,
+                       priority: int = PRIORITY_INTERACTIVE, **kwargs):
+    """
+    Send one chat completion through the rate-limit scheduler.
+
+    Each attempt's duration and token usage are recorded in ``metrics``
+    (streams are timed until fully consumed).
+    """
+    stage = _completion_stage(kwargs)
+    if kwargs.get("stream"):
+        kwargs.setdefault("stream_options", {"include_usage": True})
+
+    def send():
+        started = time.perf_counter()
+        metrics.inc("llm_requests", stage=stage)
+        try:
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=REQUEST_TIMEOUT_SECONDS,
+                **kwargs
+            )
+        except Exception:
+            metrics.observe(stage, time.perf_counter() - started)
+            metrics.inc("llm_errors", stage=stage)
+            raise
+        if kwargs.get("stream"):
+            return _metered_stream(response, stage, started)
+        metrics.observe(stage, time.perf_counter() - started)
+        _record_usage(stage, getattr(response, "usage", None))
+        return response
+
+    return scheduler.call(send, tokens=estimate_tokens(prompt) + completion_tokens, priority=priority)
+
+
+def _analyze_chunk(client, chunk: str, part: int, total: int,
+                   priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+    """Extract steps and tools from a single transcript window."""
+    action_prompt = ACTION_PROMPT_TEMPLATE.format(part=part, total=total, transcript=chunk)
+    action_res = _create_completion(
+        client, action_prompt, ACTION_COMPLETION_TOKENS, priority,
+        response_format={"type": "json_object"}
+    )
+    return _parse_chunk_result(action_res.choices[0].message.content)
+
+
+def _parse_chunk_result(content: str) -> Dict[str, Any]:
+    """
+    Parse one window's JSON response.
+
+    A bare list of steps is accepted; anything that is not a JSON object or
+    array (e.g. output truncated at the token limit) raises ValueError, so a
+    malformed response fails the analysis instead of being cached as empty.
+    """
+    try:
+        with metrics.timer("json_parse"):
+            data = json.loads(content)
+    except (json.JSONDecodeError, TypeError) as e:
+        metrics.inc("json_parse_errors")
+        raise ValueError(f"Malformed JSON in model response: {e}")
+    if isinstance(data, list):
+        return {"steps": data, "tools": []}
+    if not isinstance(data, dict):
+        metrics.inc("json_parse_errors")
+        raise ValueError(f"Malformed model response: expected a JSON object, got {type(data).__name__}")
+    return data
+
+
+def _summarize(client, chunks: List[str], priority: int = PRIORITY_INTERACTIVE) -> str:
+    """Summarize the video from an excerpt of every window."""
+    summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(transcript=_summary_excerpt(chunks))
+    summary_res = _create_completion(client, summary_prompt, SUMMARY_COMPLETION_TOKENS, priority)
+    return summary_res.choices[0].message.content
+
+
+def _analyze_structured(client, chunk: str, part: int, total: int,
+                        priority: int = PRIORITY_INTERACTIVE) -> Dict[str, Any]:
+    """Extract steps, tools and summary from a single window in one request."""
+    prompt = STRUCTURED_PROMPT_TEMPLATE.format(part=part, total=total, transcript=chunk)
+    res = _create_completion(
+        client, prompt, ACTION_COMPLETION_TOKENS + SUMMARY_COMPLETION_TOKENS, priority,
+        response_format=STRUCTURED_RESPONSE_FORMAT
     )
+    return _parse_chunk_result(res.choices[0].message.content)
+
+
+def _window_summaries(results: List[Dict[str, Any]]) -> List[str]:
+    """The non-empty per-window summaries of a single-call analysis, in window order."""
+    summaries = [result.get("summary") for result in results]
+    return [summary.strip() for summary in summaries if isinstance(summary, str) and summary.strip()]
+
+
+def _reduce_summaries_prompt(summaries: List[str]) -> str:
+    parts = "\n\n".join(f"Part {part}:\n{summary}" for part, summary in enumerate(summaries, 1))
+    return SUMMARY_REDUCE_PROMPT_TEMPLATE.format(summaries=parts)
+
 
-    summary = summary_res.choices[0].message.content
+def _combine_summaries(client, results: List[Dict[str, Any]], priority: int = PRIORITY_INTERACTIVE) -> str:
+    """
+    One summary for a single-call analysis.
+
+    A single window's summary is used as is. Several are condensed by one
+    small summary request, so a long video still gets 3 bullets rather than
+    3 per window.
+    """
+    summaries = _window_summaries(results)
+    if len(summaries) <= 1:
+        return summaries[0] if summaries else ""
+    res = _create_completion(client, _reduce_summaries_prompt(summaries), SUMMARY_COMPLETION_TOKENS, priority)
+    return res.choices[0].message.content
+
+
+def _extract_single_call(client, transcript: Transcript, priority: int) -> Tuple[str, str]:
+    """Single-call mode of extract_actions_and_summary()."""
+    annotated = transcript.annotated_text()
+    chunks = split_transcript(annotated, max_tokens=SINGLE_CALL_CHUNK_TOKENS) or [annotated]
+    total = len(chunks)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_CHUNKS, total)))
+    try:
+        futures = [
+            pool.submit(_analyze_structured, client, chunk, part, total, priority)
+            for part, chunk in enumerate(chunks, 1)
+        ]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                raise error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    results = [future.result() for future in futures]
+    merged = attach_timestamps(merge_chunk_results(results), transcript)
+    return json.dumps(merged, ensure_ascii=False), _combine_summaries(client, results, priority)
+
+
+def _stream_text(stream) -> Iterator[str]:
+    """Yield the content deltas of a streamed chat completion."""
+    for chunk in stream:
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+def extract_actions_and_summary(transcript: Union[Transcript, str], client=None,
+                                priority: int = PRIORITY_INTERACTIVE,
+                                mode: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Extract actionable steps and summary from YouTube transcript using OpenAI.
+
+    The transcript is split into overlapping windows that are analyzed
+    concurrently (at most ``MAX_PARALLEL_CHUNKS`` at a time), then the
+    per-window steps and tools are merged into one document. The model cites
+    segment markers rather than writing timestamps; step and tool timestamps
+    are then taken from the caption segments.
+
+    The summary request runs at the same time as the action requests, so the
+    wall-clock time is roughly that of the slowest request rather than the
+    sum of all of them. Each request is bounded by ``REQUEST_TIMEOUT_SECONDS``;
+    if any request fails, requests that have not started yet are cancelled
+    and the error is raised.
+
+    Requests go through the shared rate-limit scheduler; ``priority``
+    decides who goes first when the RPM/TPM budget is exhausted.
+
+    In single-call mode each (larger) window is sent once with a JSON schema
+    that covers steps, tools and summary, so there is no separate summary
+    request.
+
+    Args:
+        transcript: Timestamped transcript (plain text is treated as one segment)
+        client: Optional OpenAI-compatible client (defaults to get_openai_client())
+        priority: PRIORITY_INTERACTIVE (UI) or PRIORITY_BATCH (warm-up)
+        mode: ANALYSIS_MODE_TWO_CALL or ANALYSIS_MODE_SINGLE_CALL (defaults to ANALYSIS_MODE)
+
+    Returns:
+        tuple: (actions_json_string, summary_string)
+    """
+    # Get client (will load API key from secrets or env)
+    if client is None:
+        client = get_openai_client()
+
+    transcript = prepare_transcript(transcript)
+
+    if (mode or ANALYSIS_MODE) == ANALYSIS_MODE_SINGLE_CALL:
+        return _extract_single_call(client, transcript, priority)
+
+    annotated = transcript.annotated_text()
+    chunks = split_transcript(annotated) or [annotated]
+    total = len(chunks)
+
+    # One extra worker so the summary never waits behind the action windows
+    pool = ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_CHUNKS, total)) + 1)
+    try:
+        # --- Summary (independent of the actions) ---
+        summary_future = pool.submit(_summarize, client, chunks, priority)
+
+        # --- Action Extraction (map) ---
+        chunk_futures = [
+            pool.submit(_analyze_chunk, client, chunk, part, total, priority)
+            for part, chunk in enumerate(chunks, 1)
+        ]
+
+        done, _ = wait([summary_future] + chunk_futures, return_when=FIRST_EXCEPTION)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                raise error
+    finally:
+        # Drop queued requests if anything failed; a no-op on success
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Action Extraction (reduce) ---
+    results = [future.result() for future in chunk_futures]
+    merged = attach_timestamps(merge_chunk_results(results), transcript)
+    actions = json.dumps(merged, ensure_ascii=False)
+
+    summary = summary_future.result()
     return actions, summary
 
+
+def stream_actions_and_summary(transcript: Union[Transcript, str], client=None,
+                               priority: int = PRIORITY_INTERACTIVE,
+                               mode: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming variant of extract_actions_and_summary().
+
+    All requests use ``stream=True`` and run concurrently. Events are yielded
+    as soon as they are available:
+
+    - ``("summary", text)``: next piece of the summary
+    - ``("step", dict)``: a complete step from one window, with its timestamp
+      (windows finish in any order and overlapping windows may repeat a step)
+    - ``("done", (actions_json_string, summary_string))``: the merged result,
+      identical in shape to extract_actions_and_summary()
+
+    In single-call mode the summary is part of each window's JSON and is
+    yielded as one ``summary`` event once every window has finished; with
+    several windows it is streamed from the request that condenses their
+    summaries.
+
+    Args:
+        transcript: Timestamped transcript (plain text is treated as one segment)
+        client: Optional OpenAI-compatible client (defaults to get_openai_client())
+        priority: PRIORITY_INTERACTIVE (UI) or PRIORITY_BATCH (warm-up)
+        mode: ANALYSIS_MODE_TWO_CALL or ANALYSIS_MODE_SINGLE_CALL (defaults to ANALYSIS_MODE)
+
+    Yields:
+        (event_type, payload) tuples
+    """
+    if client is None:
+        client = get_openai_client()
+
+    transcript = prepare_transcript(transcript)
+
+    single_call = (mode or ANALYSIS_MODE) == ANALYSIS_MODE_SINGLE_CALL
+    annotated = transcript.annotated_text()
+    max_tokens = SINGLE_CALL_CHUNK_TOKENS if single_call else CHUNK_TOKENS
+    chunks = split_transcript(annotated, max_tokens=max_tokens) or [annotated]
+    total = len(chunks)
+    events = queue.Queue()
+    results: List[Optional[Dict[str, Any]]] = [None] * total
+    summary_parts: List[str] = []
+
+    def run_summary():
+        summary_prompt = SUMMARY_PROMPT_TEMPLATE.format(transcript=_summary_excerpt(chunks))
+        stream = _create_completion(client, summary_prompt, SUMMARY_COMPLETION_TOKENS, priority, stream=True)
+        for delta in _stream_text(stream):
+            summary_parts.append(delta)
+            events.put(("summary", delta))
+
+    def run_chunk(index: int, chunk: str):
+        if single_call:
+            prompt = STRUCTURED_PROMPT_TEMPLATE.format(part=index + 1, total=total, transcript=chunk)
+            stream = _create_completion(
+                client, prompt, ACTION_COMPLETION_TOKENS + SUMMARY_COMPLETION_TOKENS, priority,
+                response_format=STRUCTURED_RESPONSE_FORMAT, stream=True
+            )
+        else:
+            prompt = ACTION_PROMPT_TEMPLATE.format(part=index + 1, total=total, transcript=chunk)
+            stream = _create_completion(
+                client, prompt, ACTION_COMPLETION_TOKENS, priority,
+                response_format={"type": "json_object"}, stream=True
+            )
+        parser = IncrementalStepParser()
+        parts = []
+        for delta in _stream_text(stream):
+            parts.append(delta)
+            for step in parser.feed(delta):
+                events.put(("step", _attach_timestamp(step, transcript)))
+        results[index] = _parse_chunk_result("".join(parts))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(MAX_PARALLEL_CHUNKS, total)) + 1)
+    try:
+        futures = [] if single_call else [pool.submit(run_summary)]
+        futures += [pool.submit(run_chunk, index, chunk) for index, chunk in enumerate(chunks)]
+        for future in futures:
+            future.add_done_callback(lambda f: events.put(("_finished", f)))
+
+        remaining = len(futures)
+        while remaining:
+            kind, payload = events.get()
+            if kind == "_finished":
+                remaining -= 1
+                error = payload.exception()
+                if error is not None:
+                    raise error
+                continue
+            yield kind, payload
+    finally:
+        # Drop queued requests if anything failed or the consumer stopped early
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if single_call:
+        summaries = _window_summaries(results)
+        if len(summaries) > 1:
+            stream = _create_completion(client, _reduce_summaries_prompt(summaries),
+                                        SUMMARY_COMPLETION_TOKENS, priority, stream=True)
+            for delta in _stream_text(stream):
+                summary_parts.append(delta)
+                yield "summary", delta
+        else:
+            summary_parts.append(summaries[0] if summaries else "")
+            yield "summary", summary_parts[-1]
+
+    merged = attach_timestamps(merge_chunk_results(results), transcript)
+    yield "done", (json.dumps(merged, ensure_ascii=False), "".join(summary_parts))
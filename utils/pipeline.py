@@ -0,0 +1,365 @@
+"""
+Cache-aware transcript and analysis pipeline shared by the UI.
+
+Each step checks the bounded in-process tier, then the persistent cache, and
+on a miss runs through the single-flight layer so concurrent requests for the
+same video are computed once.
+
+Entries past their soft TTL but within their hard TTL (see utils/cache.py)
+are served at once with ``stale`` set, and refreshed in the background, at
+most once per key (utils/refresh.py).
+"""
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import threading
+import time
+
+from utils.analysis import Analysis
+from utils.cache import load_from_cache, load_entry, save_to_cache, prefetch, CACHE_TTLS, CACHE_HARD_TTLS
+from utils.memory_cache import memory_cache
+from utils.metrics import metrics
+from utils.openai_api import (
+    extract_actions_and_summary, stream_actions_and_summary, analysis_cache_key, analysis_fallback_keys
+)
+from utils.rate_limit import PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from utils.refresh import refresher
+from utils.search_index import index_analysis
+from utils.singleflight import single_flight
+from utils.transcript import (
+    get_transcript, transcript_cache_key, Transcript, TranscriptFailure, FAILURE_TTLS, TRANSCRIPT_LANGUAGES
+)
+
+
+# Soft TTLs (fresh) and hard TTLs (may still be served stale), per cache type
+TRANSCRIPT_TTL = CACHE_TTLS['transcript']
+TRANSCRIPT_HARD_TTL = CACHE_HARD_TTLS['transcript']
+ANALYSIS_TTL = CACHE_TTLS['analysis']
+ANALYSIS_HARD_TTL = CACHE_HARD_TTLS['analysis']
+# Failures are cached separately; each kind has its own, shorter TTL
+TRANSCRIPT_ERROR_TTL = max(FAILURE_TTLS.values())
+
+
+def get_cached_transcript(video_id: str, cached_only: bool = False) -> Union[Transcript, TranscriptFailure, None]:
+    """
+    Fetch a transcript by video ID through the persistent cache.
+
+    Failures are negatively cached under their own cache type for a short,
+    per-kind TTL, so a YouTube block is never stored as transcript text.
+
+    A transcript past its soft TTL is returned with ``stale`` set while a
+    fresh copy is fetched in the background; if that fetch fails, the stale
+    copy keeps being served until its hard TTL.
+
+    Args:
+        video_id: YouTube video ID
+        cached_only: Only look in the cache, returning None on a miss
+            instead of fetching
+
+    Returns:
+        Transcript on success, or TranscriptFailure
+    """
+    cache_key = transcript_cache_key(video_id)
+
+    def remember(result, ttl=TRANSCRIPT_TTL):
+        if isinstance(result, TranscriptFailure):
+            ttl = result.created_at + result.ttl - time.time()
+        memory_cache.put('transcript', cache_key, result, ttl)
+        return result
+
+    def load(allow_stale=True):
+        entry = load_entry('transcript', cache_key, ttl=TRANSCRIPT_TTL, hard_ttl=TRANSCRIPT_HARD_TTL)
+        if entry is not None and isinstance(entry[0], dict):
+            cached, age = entry
+            if age <= TRANSCRIPT_TTL:
+                return remember(Transcript.from_dict(cached), TRANSCRIPT_TTL - age)
+            if allow_stale:
+                refresher.submit('transcript', cache_key, refresh)
+                transcript = Transcript.from_dict(cached)
+                transcript.stale = True
+                return transcript
+        cached = load_from_cache('transcript_error', cache_key, ttl=TRANSCRIPT_ERROR_TTL)
+        if isinstance(cached, dict):
+            failure = TranscriptFailure.from_dict(cached)
+            if not failure.is_expired():
+                return remember(failure)
+        return None
+
+    def fetch():
+        transcript = get_transcript(video_id)
+        if isinstance(transcript, TranscriptFailure):
+            if transcript.ttl:
+                save_to_cache('transcript_error', cache_key, transcript.to_dict())
+        else:
+            # Save to local cache for persistence, in compact timestamped form
+            save_to_cache('transcript', cache_key, transcript.to_dict())
+        return remember(transcript)
+
+    def fetch_fresh():
+        transcript = get_transcript(video_id)
+        if isinstance(transcript, TranscriptFailure):
+            # Keep the stale copy rather than replacing it with the failure
+            raise Exception(transcript.message)
+        save_to_cache('transcript', cache_key, transcript.to_dict())
+        return remember(transcript)
+
+    def refresh():
+        single_flight.do('transcript', cache_key, lambda: load(allow_stale=False), fetch_fresh)
+
+    cached = memory_cache.get('transcript', cache_key)
+    if cached is not None:
+        return cached
+    if cached_only:
+        return load()
+    return single_flight.do('transcript', cache_key, load, fetch)
+
+
+def prefetch_videos(video_ids: Iterable[str]) -> int:
+    """
+    Warm the near cache with the transcripts and analyses of many videos.
+
+    With the tiered cache backend, entries other replicas already computed
+    are copied from the shared cache in batched multi-gets; otherwise this
+    does nothing. Analyses are looked up for every language a transcript
+    may come back in.
+
+    Args:
+        video_ids: YouTube video IDs about to be processed
+
+    Returns:
+        Number of entries copied
+    """
+    video_ids = list(video_ids)
+    transcript_keys = [transcript_cache_key(video_id) for video_id in video_ids]
+    analysis_keys = [analysis_cache_key(video_id, language)
+                     for video_id in video_ids for language in TRANSCRIPT_LANGUAGES + (None,)]
+    return (prefetch('transcript', transcript_keys) + prefetch('transcript_error', transcript_keys)
+            + prefetch('analysis', analysis_keys))
+
+
+def load_cached_analysis(video_id: str, transcript: Transcript,
+                         allow_stale: bool = True) -> Optional[Analysis]:
+    """
+    Return the cached analysis of a transcript, or None on a miss.
+
+    With ``allow_stale``, an analysis past its soft TTL is returned with
+    ``stale`` set and refreshed in the background; otherwise it is a miss.
+    """
+    cache_key = analysis_cache_key(video_id, transcript.language)
+    cached = memory_cache.get('analysis', cache_key)
+    if cached is not None:
+        return cached
+    return _load_analysis_from_disk(video_id, transcript, cache_key, allow_stale)
+
+
+def _load_analysis_from_disk(video_id: str, transcript: Transcript, cache_key: str,
+                             allow_stale: bool = True) -> Optional[Analysis]:
+    entry = load_entry(
+        'analysis', cache_key, ttl=ANALYSIS_TTL, hard_ttl=ANALYSIS_HARD_TTL,
+        fallback_keys=analysis_fallback_keys(video_id, transcript.language)
+    )
+    if entry is None:
+        return None
+    cached, age = entry
+    if age > ANALYSIS_TTL and not allow_stale:
+        return None
+
+    if isinstance(cached, dict):
+        try:
+            analysis = Analysis.from_dict(cached)
+        except (KeyError, TypeError, ValueError):
+            return None
+    elif isinstance(cached, list) and len(cached) == 2:
+        # Raw [actions_json, summary] written before analyses were validated:
+        # validate once and rewrite in the compact form
+        try:
+            analysis = _validate_analysis(*cached)
+        except ValueError:
+            return None
+        save_to_cache('analysis', cache_key, analysis.to_dict(), timestamp=time.time() - age)
+    else:
+        return None
+    # Analyses cached before the search index existed are added on first use
+    index_analysis(video_id, transcript, analysis, replace=False)
+
+    if age > ANALYSIS_TTL:
+        refresher.submit('analysis', cache_key, lambda: _refresh_analysis(video_id, transcript, cache_key))
+        analysis.stale = True
+    else:
+        memory_cache.put('analysis', cache_key, analysis, ANALYSIS_TTL - age)
+    return analysis
+
+
+def _analyze(video_id: str, transcript: Transcript, cache_key: str, priority: int) -> Analysis:
+    """Run the analysis, validate it and write it to every cache tier."""
+    try:
+        analysis = _validate_analysis(*extract_actions_and_summary(transcript, priority=priority))
+    except Exception as e:
+        raise Exception(f"Error calling OpenAI API: {e}")
+    _store_analysis(video_id, transcript, cache_key, analysis)
+    return analysis
+
+
+def _refresh_analysis(video_id: str, transcript: Transcript, cache_key: str) -> None:
+    # Background refreshes yield to interactive requests
+    single_flight.do(
+        'analysis', cache_key,
+        lambda: _load_analysis_from_disk(video_id, transcript, cache_key, allow_stale=False),
+        lambda: _analyze(video_id, transcript, cache_key, PRIORITY_BATCH)
+    )
+
+
+def _validate_analysis(actions: str, summary: str) -> Analysis:
+    """Validate and repair a model response (raises ValueError if it is malformed)."""
+    analysis = Analysis.from_response(actions, summary)
+    metrics.inc('analysis_repairs', analysis.repairs)
+    return analysis
+
+
+def _store_analysis(video_id: str, transcript: Transcript, cache_key: str, analysis: Analysis) -> None:
+    # Save to local cache for persistence, in compact validated form
+    save_to_cache('analysis', cache_key, analysis.to_dict())
+    memory_cache.put('analysis', cache_key, analysis, ANALYSIS_TTL)
+    index_analysis(video_id, transcript, analysis)
+
+
+def get_cached_analysis(video_id: str, transcript: Transcript,
+                        priority: int = PRIORITY_INTERACTIVE, allow_stale: bool = True) -> Analysis:
+    """
+    Analyze a transcript through the persistent cache.
+
+    The cache key covers the transcript language, model and prompt version.
+    The model's response is validated and repaired before it is cached, so
+    a malformed response raises instead of being stored.
+
+    Args:
+        video_id: YouTube video ID
+        transcript: Transcript of the video
+        priority: Scheduling priority for the OpenAI requests on a miss
+        allow_stale: Serve an analysis past its soft TTL (``stale`` set) and
+            refresh it in the background, instead of re-analyzing first
+
+    Returns:
+        Analysis with typed steps, tools and the summary
+    """
+    cache_key = analysis_cache_key(video_id, transcript.language)
+    cached = memory_cache.get('analysis', cache_key)
+    if cached is not None:
+        return cached
+    return single_flight.do(
+        'analysis', cache_key,
+        lambda: _load_analysis_from_disk(video_id, transcript, cache_key, allow_stale),
+        lambda: _analyze(video_id, transcript, cache_key, priority)
+    )
+
+
+class _Broadcast:
+    """Events of one streamed analysis, replayed to every caller waiting on it."""
+
+    __slots__ = ("events", "finished", "result", "error", "condition")
+
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.result = None
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, event: Tuple[str, Any]) -> None:
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self.condition:
+            self.result = result
+            self.error = error
+            self.finished = True
+            self.condition.notify_all()
+
+    def subscribe(self) -> Iterator[Tuple[str, Any]]:
+        """Yield every event from the first one, then ``("done", result)`` or raise the error."""
+        seen = 0
+        while True:
+            with self.condition:
+                while seen == len(self.events) and not self.finished:
+                    self.condition.wait()
+                events = self.events[seen:]
+                seen = len(self.events)
+                finished = self.finished
+            yield from events
+            if finished and seen == len(self.events):
+                break
+        if self.error is not None:
+            raise self.error
+        yield "done", self.result
+
+
+# Streamed analyses in flight in this process, by cache key
+_streams: Dict[str, _Broadcast] = {}
+_streams_lock = threading.Lock()
+
+
+def stream_cached_analysis(video_id: str, transcript: Transcript,
+                           priority: int = PRIORITY_INTERACTIVE) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming variant of get_cached_analysis().
+
+    A cache hit (possibly stale, see load_cached_analysis()) yields a single
+    ``("done", analysis)`` event. On a miss the analysis runs through the
+    single-flight layer on a background thread: the first caller streams
+    from OpenAI, and other callers in this process replay the same events;
+    callers coalesced with another process (or a non-streaming call) only
+    get the final result. The events of stream_actions_and_summary() are
+    passed through, and the final result is validated, written to the cache
+    and yielded as ``("done", analysis)``. A caller that stops listening
+    does not cancel the analysis.
+
+    Args:
+        video_id: YouTube video ID
+        transcript: Transcript of the video
+        priority: Scheduling priority for the OpenAI requests on a miss
+
+    Yields:
+        (event_type, payload) tuples
+    """
+    cached = load_cached_analysis(video_id, transcript)
+    if cached is not None:
+        yield "done", cached
+        return
+
+    cache_key = analysis_cache_key(video_id, transcript.language)
+    with _streams_lock:
+        broadcast = _streams.get(cache_key)
+        leader = broadcast is None
+        if leader:
+            broadcast = _streams[cache_key] = _Broadcast()
+
+    if leader:
+        def compute() -> Analysis:
+            try:
+                for kind, payload in stream_actions_and_summary(transcript, priority=priority):
+                    if kind == "done":
+                        analysis = _validate_analysis(*payload)
+                        _store_analysis(video_id, transcript, cache_key, analysis)
+                        return analysis
+                    broadcast.publish((kind, payload))
+            except Exception as e:
+                raise Exception(f"Error calling OpenAI API: {e}")
+            raise Exception("Error calling OpenAI API: the stream ended without a result")
+
+        def run() -> None:
+            try:
+                analysis = single_flight.do(
+                    'analysis', cache_key,
+                    lambda: _load_analysis_from_disk(video_id, transcript, cache_key), compute
+                )
+                broadcast.finish(result=analysis)
+            except BaseException as e:
+                broadcast.finish(error=e)
+            finally:
+                with _streams_lock:
+                    _streams.pop(cache_key, None)
+
+        threading.Thread(target=run, name="analysis-stream", daemon=True).start()
+
+    yield from broadcast.subscribe()
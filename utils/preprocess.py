@@ -0,0 +1,149 @@
+"""
+Transcript normalization and compaction before prompting.
+
+Auto-generated captions repeat the tail of the previous line ("rolling"
+captions), contain non-speech tags such as ``[Music]`` and split sentences
+into many tiny segments. Removing that noise cuts prompt tokens, and with
+them latency and cost, without losing timing: merged sentences keep the
+start time of their first segment.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from utils.transcript import Transcript, MARKER_INTERVAL_SECONDS
+
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_TRANSCRIPT", "1") != "0"
+PREPROCESS_DROP_FILLER = os.getenv("PREPROCESS_DROP_FILLER", "0") == "1"
+
+# Merged sentences never span more than this, so segment markers stay as
+# precise as the marker interval used in the prompt
+SENTENCE_MAX_SECONDS = MARKER_INTERVAL_SECONDS
+
+# Shortest repeated word run treated as a rolling-caption duplicate. A single
+# repeated word is often real speech ("that that", "very, very"), while
+# rolling captions repeat whole phrases
+MIN_ROLLING_OVERLAP_WORDS = 2
+
+TOKENIZER_MODEL = "gpt-4o-mini"
+CHARS_PER_TOKEN = 4
+
+NON_SPEECH_RE = re.compile(
+    r"\[[^\]]{0,40}\]|♪+|\((?:music|musique|applause|applaudissements|laughter|rires|silence|inaudible)\)",
+    re.IGNORECASE,
+)
+FILLER_RE = re.compile(r"\b(?:um+|uh+|uhm|erm|hmm+|mm+|euh+|heu+)\b[,.]?\s*", re.IGNORECASE)
+SENTENCE_END_RE = re.compile(r"[.!?…]['\")\]]*$")
+_WORD_RE = re.compile(r"\w+")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count prompt tokens with tiktoken when it is installed.
+
+    Falls back to the same ~4 characters per token estimate the analysis
+    budget uses.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _clean(text: str, drop_filler: bool) -> str:
+    text = NON_SPEECH_RE.sub(" ", text)
+    if drop_filler:
+        text = FILLER_RE.sub("", text)
+    return " ".join(text.split())
+
+
+def _rolling_overlap(previous: List[str], current: List[str]) -> int:
+    """Length of the longest run of words ending ``previous`` that starts ``current``."""
+    for size in range(min(len(previous), len(current)), 0, -1):
+        if previous[-size:] == current[:size]:
+            return size
+    return 0
+
+
+def _drop_repeated_words(text: str, previous_words: List[str]) -> str:
+    """Remove the leading words of ``text`` that repeat the end of the previous segment."""
+    words = text.split()
+    normalized = [" ".join(_WORD_RE.findall(word.lower())) for word in words]
+    overlap = _rolling_overlap(previous_words, normalized)
+    if overlap >= MIN_ROLLING_OVERLAP_WORDS:
+        words = words[overlap:]
+    return " ".join(words)
+
+
+def preprocess_transcript(transcript: Transcript, drop_filler: bool = PREPROCESS_DROP_FILLER) -> Transcript:
+    """
+    Normalize and compact a transcript for prompting.
+
+    Strips non-speech tags, removes rolling caption repeats, optionally
+    drops filler words and merges segments into sentences of at most
+    SENTENCE_MAX_SECONDS, each keeping the start time of its first segment.
+
+    Args:
+        transcript: Transcript as fetched
+        drop_filler: Also remove disfluencies (um, uh, euh, ...)
+
+    Returns:
+        A new, compacted Transcript
+    """
+    merged: List[Dict[str, Any]] = []
+    previous_words: List[str] = []
+    for segment in transcript.segments():
+        text = _drop_repeated_words(_clean(segment["text"], drop_filler), previous_words)
+        if not text:
+            continue
+        previous_words = (previous_words + [" ".join(_WORD_RE.findall(w.lower())) for w in text.split()])[-50:]
+
+        start = segment["start"]
+        end = start + segment["duration"]
+        current = merged[-1] if merged else None
+        if (current is not None and not SENTENCE_END_RE.search(current["text"])
+                and start - current["start"] < SENTENCE_MAX_SECONDS):
+            current["text"] += " " + text
+            current["duration"] = max(current["duration"], end - current["start"])
+        else:
+            merged.append({"text": text, "start": start, "duration": segment["duration"]})
+
+    return Transcript.from_segments(merged, language=transcript.language)
+
+
+def compaction_stats(transcript: Transcript, compacted: Optional[Transcript] = None) -> Dict[str, Any]:
+    """
+    Compare prompt tokens before and after preprocessing.
+
+    Args:
+        transcript: Transcript as fetched
+        compacted: Its preprocessed form (computed when omitted)
+
+    Returns:
+        Dictionary with tokens_before, tokens_after, saved_ratio, segments
+        before/after and whether tiktoken was used
+    """
+    if compacted is None:
+        compacted = preprocess_transcript(transcript)
+    before = count_tokens(transcript.annotated_text())
+    after = count_tokens(compacted.annotated_text())
+    return {
+        "tokens_before": before,
+        "tokens_after": after,
+        "saved_ratio": round(1 - after / before, 3) if before else 0.0,
+        "segments_before": len(transcript),
+        "segments_after": len(compacted),
+        "tokenizer": "tiktoken" if _encoding else "estimate",
+    }
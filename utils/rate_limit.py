@@ -0,0 +1,422 @@
+"""
+Client-side rate limiting for outbound API calls.
+
+``OpenAIScheduler`` keeps OpenAI requests under the account's requests-per-
+minute and tokens-per-minute limits with two token buckets, hands out
+capacity in priority order (interactive UI requests before batch warm-up),
+and backs off on 429 responses using the server's ``Retry-After`` hint.
+It is the only place requests are retried: transient failures (connection
+errors, timeouts, 5xx) are retried by the failing call after its own backoff.
+
+``HostGuard`` protects scraping-style hosts (YouTube) that answer overload
+with IP blocks: an adaptive limiter caps concurrency and spaces out requests
+more when blocks appear, and a circuit breaker fails fast while blocked.
+
+Clocks and waits are injectable so the scheduler can be driven by a
+simulated clock.
+"""
+import os
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to ``capacity`` units, refilled continuously.
+
+    Args:
+        capacity: Maximum burst size
+        refill_per_second: Units added per second
+        clock: Monotonic time source in seconds
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.clock = clock
+        self.available = float(capacity)
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        elapsed = max(now - self.updated, 0.0)
+        self.available = min(self.capacity, self.available + elapsed * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return (amount - self.available) / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        """Take ``amount`` units (callers check wait_time() first)."""
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Read the server's ``Retry-After`` / ``retry-after-ms`` hint from an HTTP error."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _is_rate_limited(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Timeouts, conflicts, server errors and dropped connections: worth retrying."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409) or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+class _Ticket:
+    __slots__ = ("priority", "seq", "tokens", "enqueued")
+
+    def __init__(self, priority: int, seq: int, tokens: int, enqueued: float):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.enqueued = enqueued
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OpenAIScheduler:
+    """
+    Priority queue in front of RPM/TPM token buckets.
+
+    Requests are admitted strictly in (priority, arrival) order: a batch
+    request never overtakes a waiting interactive one. A 429 pauses admission
+    for everyone for the ``Retry-After`` period plus jitter; a transient
+    error only delays the call that hit it.
+
+    Args:
+        requests_per_minute: RPM ceiling
+        tokens_per_minute: TPM ceiling
+        clock: Monotonic time source in seconds
+        wait: ``wait(condition, timeout)`` used to block while holding the
+            condition; defaults to ``condition.wait``
+        max_attempts: Attempts per call before a 429 or transient error is
+            raised to the caller
+        base_backoff: Backoff (seconds) for a retry without ``Retry-After``
+        transient: Whether an error other than a 429 is worth retrying
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 clock: Callable[[], float] = time.monotonic,
+                 wait: Optional[Callable[[threading.Condition, float], Any]] = None,
+                 max_attempts: int = 5, base_backoff: float = 1.0,
+                 transient: Callable[[BaseException], bool] = is_transient_error):
+        self.clock = clock
+        self._wait = wait or (lambda condition, timeout: condition.wait(timeout))
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0, clock)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0, clock)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.transient = transient
+        self._condition = threading.Condition()
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        # Metrics
+        self._wait_times: List[float] = []
+        self.admitted = 0
+        self.rate_limited = 0
+        self.retried = 0
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """
+        Block until one request of ``tokens`` estimated tokens may be sent.
+
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        with self._condition:
+            ticket = _Ticket(priority, next(self._seq), tokens, self.clock())
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    if self._queue[0] is ticket:
+                        delay = max(
+                            self._paused_until - self.clock(),
+                            self.requests.wait_time(1),
+                            self.tokens.wait_time(ticket.tokens),
+                        )
+                        if delay <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(ticket.tokens)
+                            break
+                        self._wait(self._condition, delay)
+                    else:
+                        # Woken when the head of the queue changes
+                        self._wait(self._condition, None)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+            waited = self.clock() - ticket.enqueued
+            self.admitted += 1
+            self._wait_times.append(waited)
+            del self._wait_times[:-1000]
+            return waited
+
+    def backoff(self, seconds: float) -> None:
+        """Pause admission for every caller (after a 429)."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+            self.rate_limited += 1
+            self._condition.notify_all()
+
+    def _sleep(self, seconds: float) -> None:
+        """Block this caller only, on the scheduler's clock."""
+        deadline = self.clock() + seconds
+        with self._condition:
+            while True:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return
+                self._wait(self._condition, remaining)
+
+    def call(self, fn: Callable[[], Any], tokens: int,
+             priority: int = PRIORITY_INTERACTIVE) -> Any:
+        """
+        Run ``fn`` once capacity is available, retrying 429s and transient errors.
+
+        Args:
+            fn: Function that sends the request
+            tokens: Estimated tokens (prompt + expected completion)
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH (lower runs first)
+
+        Returns:
+            Whatever ``fn`` returns
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire(tokens, priority)
+            try:
+                return fn()
+            except Exception as e:
+                rate_limited = _is_rate_limited(e)
+                if attempt == self.max_attempts or not (rate_limited or self.transient(e)):
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = self.base_backoff * 2 ** (attempt - 1)
+                # Jitter so queued callers don't all retry in the same instant
+                delay += random.uniform(0, delay * 0.25)
+                if rate_limited:
+                    self.backoff(delay)
+                else:
+                    with self._condition:
+                        self.retried += 1
+                    self._sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait-time metrics."""
+        with self._condition:
+            waits = sorted(self._wait_times)
+            depth = len(self._queue)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(int(len(waits) * p), len(waits) - 1)], 3)
+
+        return {
+            "queue_depth": depth,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "retried": self.retried,
+            "wait_p50_seconds": percentile(0.50),
+            "wait_p95_seconds": percentile(0.95),
+            "wait_max_seconds": round(waits[-1], 3) if waits else 0.0,
+        }
+
+
+class CircuitBreaker:
+    """
+    Fail fast after repeated failures, then probe again after a cool-down.
+
+    Closed: requests flow. After ``failure_threshold`` consecutive failures
+    it opens and rejects requests for ``reset_timeout`` seconds, then lets a
+    single probe through (half-open); the probe's outcome closes or reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a request may be attempted now."""
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self._probe_in_flight = False
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit plus minimum spacing that adapt to blocks (AIMD).
+
+    A block halves the concurrency limit and doubles the spacing between
+    request starts; every ``recovery_successes`` successes in a row add one
+    slot back and halve the spacing.
+    """
+
+    def __init__(self, max_concurrency: int = 4, base_interval: float = 0.5,
+                 max_interval: float = 30.0, recovery_successes: int = 5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.interval = 0.0
+        self.recovery_successes = recovery_successes
+        self.clock = clock
+        self.active = 0
+        self._successes = 0
+        self._next_start = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Block until a slot is free and the spacing since the last start has passed."""
+        with self._condition:
+            while True:
+                delay = self._next_start - self.clock()
+                if self.active < self.limit and delay <= 0:
+                    break
+                self._condition.wait(delay if self.active < self.limit else None)
+            self.active += 1
+            self._next_start = self.clock() + self.interval
+
+    def release(self, blocked: bool = False) -> None:
+        """Free the slot and adapt to the outcome of the request."""
+        with self._condition:
+            self.active -= 1
+            if blocked:
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+                self.interval = min(self.max_interval, max(self.interval * 2, self.base_interval))
+            else:
+                self._successes += 1
+                if self._successes >= self.recovery_successes:
+                    self._successes = 0
+                    self.limit = min(self.max_concurrency, self.limit + 1)
+                    self.interval = self.interval / 2 if self.interval > self.base_interval else 0.0
+            self._condition.notify_all()
+
+
+class HostGuard:
+    """Adaptive limiter and circuit breaker for one upstream host."""
+
+    def __init__(self, host: str, max_concurrency: int = 4,
+                 failure_threshold: int = 3, reset_timeout: float = 300.0):
+        self.host = host
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.blocks = 0
+
+    def allow(self) -> bool:
+        return self.breaker.allow()
+
+    def acquire(self) -> None:
+        self.limiter.acquire()
+
+    def release(self, blocked: bool = False) -> None:
+        """Report the outcome: blocks slow the host down and count toward opening the breaker."""
+        self.limiter.release(blocked)
+        if blocked:
+            self.blocks += 1
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "circuit": self.breaker.state,
+            "rejected": self.breaker.rejected,
+            "blocks": self.blocks,
+            "concurrency_limit": self.limiter.limit,
+            "active": self.limiter.active,
+            "interval_seconds": round(self.limiter.interval, 3),
+        }
+
+
+_host_guards: Dict[str, HostGuard] = {}
+_host_guards_lock = threading.Lock()
+
+
+def get_host_guard(host: str) -> HostGuard:
+    """Return the process-wide guard for a host, creating it on first use."""
+    with _host_guards_lock:
+        guard = _host_guards.get(host)
+        if guard is None:
+            guard = _host_guards[host] = HostGuard(
+                host,
+                max_concurrency=int(os.getenv("HOST_MAX_CONCURRENCY", "4")),
+                failure_threshold=int(os.getenv("HOST_BREAKER_FAILURES", "3")),
+                reset_timeout=float(os.getenv("HOST_BREAKER_RESET_SECONDS", "300")),
+            )
+        return guard
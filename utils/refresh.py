@@ -0,0 +1,129 @@
+"""
+Background refresh of stale cache entries (stale-while-revalidate).
+
+When the pipeline serves an entry past its soft TTL, it hands a refresh to
+the shared ``refresher``. At most one refresh per key is queued or running
+in this process, and refreshes run on a small thread pool so they never
+hold up the request that found the stale entry. Refreshes go through the
+single-flight layer, which also keeps other processes from repeating them.
+A key whose refresh failed is not refreshed again for a while, so a popular
+stale entry does not hit a failing upstream on every request.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Set, Tuple
+
+from utils.cache import CACHE_TTLS
+from utils.metrics import metrics
+
+
+REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "2"))
+# After a failed refresh, keep serving the stale entry this long before trying
+# again (as long as a transcript failure is cached, by default)
+REFRESH_RETRY_SECONDS = float(os.getenv("CACHE_REFRESH_RETRY_SECONDS", str(CACHE_TTLS['transcript_error'])))
+
+
+class BackgroundRefresher:
+    """
+    Run refresh functions in the background, one per key at a time.
+
+    Args:
+        workers: Refreshes that may run concurrently
+        retry_after: Seconds a key is left alone after its refresh failed
+        clock: Monotonic time source in seconds
+
+    Counters:
+        started: refreshes queued
+        skipped: a refresh for the key was already queued or running
+        backed_off: the key's last refresh failed less than ``retry_after`` ago
+        succeeded / failed: finished refreshes (failures keep the stale entry)
+    """
+
+    def __init__(self, workers: int = REFRESH_WORKERS, retry_after: float = REFRESH_RETRY_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.workers = max(1, workers)
+        self.retry_after = retry_after
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending: Set[Tuple[str, str]] = set()
+        self._failed_until: Dict[Tuple[str, str], float] = {}
+        self.started = 0
+        self.skipped = 0
+        self.backed_off = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    def submit(self, cache_type: str, key: str, refresh: Callable[[], object]) -> bool:
+        """
+        Queue ``refresh`` for a key unless one is already queued or running,
+        or the key's last refresh failed less than ``retry_after`` ago.
+
+        Args:
+            cache_type: Type of cache ('transcript' or 'analysis')
+            key: Cache key being refreshed
+            refresh: Recomputes the value and writes it to the cache
+
+        Returns:
+            True if a refresh was queued
+        """
+        refresh_key = (cache_type, key)
+        with self._lock:
+            if refresh_key in self._pending:
+                self.skipped += 1
+                return False
+            if self._failed_until.get(refresh_key, 0.0) > self.clock():
+                self.backed_off += 1
+                return False
+            self._pending.add(refresh_key)
+            self.started += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cache-refresh')
+            pool = self._pool
+        pool.submit(self._run, refresh_key, refresh)
+        return True
+
+    def _run(self, refresh_key: Tuple[str, str], refresh: Callable[[], object]) -> None:
+        cache_type = refresh_key[0]
+        ok = False
+        try:
+            with metrics.timer(f"refresh_{cache_type}"):
+                refresh()
+            ok = True
+        except Exception:
+            # The stale entry keeps being served until its hard TTL
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(refresh_key)
+                if ok:
+                    self.succeeded += 1
+                    self._failed_until.pop(refresh_key, None)
+                else:
+                    self.failed += 1
+                    now = self.clock()
+                    # Forget keys whose backoff is over so the map stays small
+                    for expired in [k for k, until in self._failed_until.items() if until <= now]:
+                        del self._failed_until[expired]
+                    self._failed_until[refresh_key] = now + self.retry_after
+            metrics.inc('cache_refreshes', type=cache_type, result='ok' if ok else 'error')
+
+    def stats(self) -> Dict[str, int]:
+        """Return refresh counters, the refreshes queued or running and the keys backing off."""
+        with self._lock:
+            now = self.clock()
+            return {
+                "started": self.started,
+                "skipped": self.skipped,
+                "backed_off": self.backed_off,
+                "backing_off": sum(1 for until in self._failed_until.values() if until > now),
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "pending": len(self._pending),
+            }
+
+
+# Shared by every session in this process
+refresher = BackgroundRefresher()
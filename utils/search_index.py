@@ -0,0 +1,236 @@
+"""
+Full-text search across every analyzed video (SQLite FTS5).
+
+Each analysis is indexed as it is cached: transcript passages, steps, code
+snippets and tools become rows of an ``entries`` table carrying the video ID
+and the start time in milliseconds, with an external-content FTS5 index over
+their text kept in sync by triggers. Re-indexing a video replaces its rows
+(found through an ordinary index on ``video_id``), so the index is updated
+incrementally and never needs a full rebuild. Indexing
+errors are swallowed, like cache errors, so search never breaks analysis.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.analysis import Analysis
+from utils.cache import CACHE_DIR
+from utils.preprocess import preprocess_transcript
+from utils.transcript import Transcript
+
+
+SEARCH_DB = os.getenv("SEARCH_DB", str(CACHE_DIR / "search.sqlite3"))
+
+# Consecutive transcript sentences are indexed together in passages of this length
+PASSAGE_SECONDS = 30.0
+
+# Row kinds
+KINDS = ('step', 'tool', 'code', 'transcript')
+
+# bm25() weights per indexed column: title, body
+_BM25_WEIGHTS = "3.0, 1.0"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    start_ms INTEGER,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_video_id ON entries (video_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(
+    title, body, content = 'entries', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO documents (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO documents (documents, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+END;
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    language TEXT,
+    summary TEXT,
+    indexed_at REAL
+);
+"""
+
+_QUERY_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    path = path or SEARCH_DB
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10)
+    if path not in _schema_ready:
+        with _schema_lock:
+            if path not in _schema_ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(_SCHEMA)
+                _schema_ready.add(path)
+    return connection
+
+
+def _passages(transcript: Transcript) -> List[Dict[str, Any]]:
+    """Group the cleaned transcript into passages of about PASSAGE_SECONDS."""
+    passages = []
+    for segment in preprocess_transcript(transcript).segments():
+        if passages and segment["start"] - passages[-1]["start"] < PASSAGE_SECONDS:
+            passages[-1]["text"] += " " + segment["text"]
+        else:
+            passages.append({"start": segment["start"], "text": segment["text"]})
+    return passages
+
+
+def _start_ms(start: Optional[float]) -> Optional[int]:
+    return None if start is None else int(round(start * 1000))
+
+
+def _rows(video_id: str, transcript: Transcript, analysis: Analysis) -> List[tuple]:
+    rows = []
+    for passage in _passages(transcript):
+        rows.append((video_id, 'transcript', int(round(passage["start"] * 1000)), "", passage["text"]))
+    for step in analysis.steps:
+        start_ms = _start_ms(step.start)
+        rows.append((video_id, 'step', start_ms, step.text, step.tool_context))
+        if step.code:
+            rows.append((video_id, 'code', start_ms, step.text, step.code))
+    for tool in analysis.tools:
+        body = " ".join((tool.purpose, tool.context, tool.usage))
+        rows.append((video_id, 'tool', _start_ms(tool.start), tool.name, body))
+    return rows
+
+
+def index_analysis(video_id: str, transcript: Transcript, analysis: Analysis,
+                   replace: bool = True) -> bool:
+    """
+    Add (or replace) a video's transcript and analysis in the search index.
+
+    Args:
+        video_id: YouTube video ID
+        transcript: Transcript of the video
+        analysis: Validated analysis of the video
+        replace: If False, leave a video that is already indexed untouched
+
+    Returns:
+        True if the video was indexed
+    """
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                if not replace and connection.execute(
+                        "SELECT 1 FROM videos WHERE video_id = ?", (video_id,)).fetchone():
+                    return False
+                connection.execute("DELETE FROM entries WHERE video_id = ?", (video_id,))
+                connection.executemany(
+                    "INSERT INTO entries (video_id, kind, start_ms, title, body) VALUES (?, ?, ?, ?, ?)",
+                    _rows(video_id, transcript, analysis)
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO videos (video_id, language, summary, indexed_at) VALUES (?, ?, ?, ?)",
+                    (video_id, transcript.language, analysis.summary, time.time())
+                )
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        # FTS5 missing, disk full, locked for too long: search is best effort
+        return False
+    return True
+
+
+def _match_expression(query: str) -> str:
+    """Turn free text into an FTS5 query where every word must match (prefix match on the last one)."""
+    terms = _QUERY_TERM_RE.findall(query)
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search(query: str, limit: int = 20, kinds: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Search every indexed video.
+
+    Args:
+        query: Free text, e.g. "docker compose volume"
+        limit: Maximum number of hits
+        kinds: Restrict to these row kinds (see KINDS)
+
+    Returns:
+        Hits ranked by relevance, each with video_id, kind, start_ms (None
+        when unknown), title, snippet and score (lower is better)
+    """
+    expression = _match_expression(query)
+    if not expression:
+        return []
+
+    sql = (f"SELECT e.video_id, e.kind, e.start_ms, e.title, "
+           f"snippet(documents, -1, '**', '**', ' … ', 16), bm25(documents, {_BM25_WEIGHTS}) AS score "
+           f"FROM documents JOIN entries e ON e.id = documents.rowid WHERE documents MATCH ?")
+    params: List[Any] = [expression]
+    if kinds:
+        sql += f" AND e.kind IN ({', '.join('?' for _ in kinds)})"
+        params.extend(kinds)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(limit)
+
+    try:
+        connection = _connect()
+        try:
+            rows = connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return []
+
+    return [
+        {"video_id": video_id, "kind": kind, "start_ms": start_ms, "title": title,
+         "snippet": snippet, "score": score}
+        for video_id, kind, start_ms, title, snippet, score in rows
+    ]
+
+
+def clear_index() -> bool:
+    """
+    Remove every video from the search index.
+
+    Returns:
+        True if the index was cleared
+    """
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                # The delete trigger keeps the FTS5 index in sync
+                connection.execute("DELETE FROM entries")
+                connection.execute("DELETE FROM videos")
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return False
+    return True
+
+
+def get_index_stats() -> Dict[str, int]:
+    """Return the number of indexed videos and rows."""
+    try:
+        connection = _connect()
+        try:
+            videos = connection.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            rows = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        return {'videos': 0, 'rows': 0}
+    return {'videos': videos, 'rows': rows}
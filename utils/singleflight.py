@@ -0,0 +1,176 @@
+"""
+Single-flight deduplication for cache misses.
+
+When several sessions ask for the same uncached video at once, only one of
+them fetches the transcript or calls OpenAI; the others wait for its result.
+Threads in one process share an in-flight call, and processes coordinate
+through a lock file per key (POSIX ``flock``), re-checking the cache once the
+lock is acquired. The holder deletes the lock file before releasing it, so
+the lock directory only holds files for keys in flight.
+"""
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.cache import CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to per-process deduplication only
+    fcntl = None
+
+
+LOCK_DIR = CACHE_DIR / "locks"
+
+
+class _Call:
+    """A computation in progress that other threads can wait on."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _is_current(lock_file, path) -> bool:
+    """Whether an open lock file is still the one at ``path``."""
+    try:
+        opened = os.fstat(lock_file.fileno())
+        current = os.stat(path)
+    except OSError:
+        return False
+    return (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino)
+
+
+class SingleFlight:
+    """
+    Run at most one computation per key at a time, sharing its result.
+
+    Counters:
+        hits: value was already cached
+        misses: this caller ran the computation
+        coalesced: this caller waited for another thread or process instead
+    """
+
+    def __init__(self, lock_dir=LOCK_DIR):
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, str], _Call] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @contextmanager
+    def _process_lock(self, cache_type: str, key: str):
+        """Hold an exclusive file lock for the key; yields True if we had to wait."""
+        if fcntl is None:
+            yield False
+            return
+
+        digest = hashlib.sha256(f"{cache_type}:{key}".encode("utf-8")).hexdigest()
+        path = self.lock_dir / f"{digest}.lock"
+        waited = False
+        while True:
+            try:
+                self.lock_dir.mkdir(parents=True, exist_ok=True)
+                lock_file = open(path, "a+")
+            except OSError:
+                # Can't lock across processes; still dedupe within this one
+                yield False
+                return
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                waited = True
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            if _is_current(lock_file, path):
+                break
+            # The previous holder deleted this file while we waited for it
+            lock_file.close()
+
+        with lock_file:
+            try:
+                yield waited
+            finally:
+                # Deleted while still locked: a process waiting on this file
+                # sees that it is gone and locks a new one
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def do(self, cache_type: str, key: str,
+           load: Callable[[], Optional[Any]], compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for a key, computing it at most once.
+
+        Args:
+            cache_type: Type of cache ('transcript' or 'analysis')
+            key: Cache key
+            load: Returns the cached value, or None on a miss
+            compute: Produces the value and saves it to the cache
+
+        Returns:
+            The cached or freshly computed value (errors from compute are
+            raised in every waiting caller)
+        """
+        value = load()
+        if value is not None:
+            self._count("hits")
+            return value
+
+        flight_key = (cache_type, key)
+        with self._lock:
+            call = self._calls.get(flight_key)
+            leader = call is None
+            if leader:
+                call = self._calls[flight_key] = _Call()
+
+        if not leader:
+            self._count("coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self._process_lock(cache_type, key) as waited:
+                # Another process may have filled the cache in the meantime
+                value = load()
+                if value is not None:
+                    self._count("coalesced" if waited else "hits")
+                else:
+                    self._count("misses")
+                    value = compute()
+            call.result = value
+            return value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(flight_key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/coalesced counters and the number of calls in flight."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
+
+
+# Shared by every session in this process
+single_flight = SingleFlight()
@@ -1,13 +1,230 @@
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api._errors import (
-    TranscriptsDisabled,
-    NoTranscriptFound,
-    VideoUnavailable,
-    IpBlocked,
-    RequestBlocked,
-    YouTubeRequestFailed,
-    CouldNotRetrieveTranscript
-)
+import os
+import tempfile
+import time
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, Dict, Any, Optional
+
+from utils.cache import make_cache_key
+from utils.metrics import metrics
+from utils.rate_limit import get_host_guard
+
+
+# Caption languages in order of preference
+TRANSCRIPT_LANGUAGES = ('fr', 'en')
+
+YOUTUBE_HOST = 'www.youtube.com'
+
+# Videos without captions are transcribed from their audio with Whisper
+# (utils/whisper_fallback.py) when it is installed
+WHISPER_FALLBACK = os.getenv("WHISPER_FALLBACK", "1") != "0"
+WHISPER_FALLBACK_KINDS = ('not_found', 'disabled')
+# yt-dlp error text that means YouTube refused the audio download
+DOWNLOAD_BLOCKED_MARKERS = ('http error 429', 'sign in to confirm', 'blocked')
+
+
+# Markers are only inserted into the prompt text once this many seconds have
+# passed since the previous one, which keeps their input-token cost low.
+MARKER_INTERVAL_SECONDS = 10.0
+
+# youtube_transcript_api is imported on the first fetch (see _youtube_api());
+# the benchmarks put a stand-in here
+YouTubeTranscriptApi = None
+
+
+def _youtube_api():
+    """The YouTubeTranscriptApi class, imported on first use."""
+    global YouTubeTranscriptApi
+    if YouTubeTranscriptApi is None:
+        from youtube_transcript_api import YouTubeTranscriptApi as api_class
+        YouTubeTranscriptApi = api_class
+    return YouTubeTranscriptApi
+
+
+class Transcript:
+    """
+    Timestamped transcript backed by compact arrays.
+
+    ``text`` is the caption text joined with single spaces. For each caption
+    segment ``i``, ``starts[i]`` and ``durations[i]`` are in seconds and
+    ``offsets[i]`` is the character offset where the segment begins in
+    ``text``, so any character offset maps back to its segment with a binary
+    search.
+
+    ``stale`` is set by the pipeline on a cached copy served past its soft
+    TTL while a fresh one is fetched in the background.
+    """
+
+    __slots__ = ("text", "starts", "durations", "offsets", "language", "stale")
+
+    def __init__(self, text: str, starts: Iterable[float], durations: Iterable[float],
+                 offsets: Iterable[int], language: Optional[str] = None):
+        self.text = text
+        self.starts = array("d", starts)
+        self.durations = array("d", durations)
+        self.offsets = array("q", offsets)
+        self.language = language
+        self.stale = False
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Dict[str, Any]], language: Optional[str] = None) -> "Transcript":
+        """
+        Build a transcript from raw caption segments.
+
+        Args:
+            segments: Dicts with ``text``, ``start`` and ``duration`` keys
+            language: Language code of the captions
+
+        Returns:
+            Transcript
+        """
+        parts = []
+        starts = array("d")
+        durations = array("d")
+        offsets = array("q")
+        position = 0
+        for segment in segments:
+            text = " ".join(str(segment.get("text", "")).split())
+            if not text:
+                continue
+            if parts:
+                position += 1  # joining space
+            starts.append(float(segment.get("start", 0.0)))
+            durations.append(float(segment.get("duration", 0.0)))
+            offsets.append(position)
+            parts.append(text)
+            position += len(text)
+        return cls(" ".join(parts), starts, durations, offsets, language)
+
+    @classmethod
+    def from_text(cls, text: str, language: Optional[str] = None) -> "Transcript":
+        """Wrap plain text without timing information as a single segment."""
+        return cls(text, [0.0], [0.0], [0], language)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def segments(self) -> Iterator[Dict[str, Any]]:
+        """Yield each segment as a dict with ``text``, ``start`` and ``duration`` keys."""
+        for index, offset in enumerate(self.offsets):
+            end = self.offsets[index + 1] - 1 if index + 1 < len(self.offsets) else len(self.text)
+            yield {"text": self.text[offset:end], "start": self.starts[index], "duration": self.durations[index]}
+
+    def segment_at(self, offset: int) -> int:
+        """Return the index of the segment containing a character offset."""
+        if not self.offsets:
+            return -1
+        return max(bisect_right(self.offsets, offset) - 1, 0)
+
+    def time_at(self, offset: int) -> float:
+        """Return the start time (seconds) of the segment containing a character offset."""
+        index = self.segment_at(offset)
+        return self.starts[index] if index >= 0 else 0.0
+
+    def segment_start(self, index: Any) -> Optional[float]:
+        """Return the start time (seconds) of a segment, or None if the index is invalid."""
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            return None
+        if 0 <= index < len(self.starts):
+            return self.starts[index]
+        return None
+
+    def annotated_text(self, marker_interval: float = MARKER_INTERVAL_SECONDS) -> str:
+        """
+        Return the text with ``[n]`` segment markers for the model to cite.
+
+        A marker is placed before segment ``n`` whenever at least
+        ``marker_interval`` seconds have passed since the previous marker.
+        """
+        parts = []
+        last_marker = None
+        for index, offset in enumerate(self.offsets):
+            end = self.offsets[index + 1] - 1 if index + 1 < len(self.offsets) else len(self.text)
+            start_time = self.starts[index]
+            if last_marker is None or start_time - last_marker >= marker_interval:
+                parts.append(f"[{index}]")
+                last_marker = start_time
+            parts.append(self.text[offset:end])
+        return " ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact, JSON-serializable form used for caching (times in milliseconds)."""
+        return {
+            "text": self.text,
+            "starts_ms": [int(round(start * 1000)) for start in self.starts],
+            "durations_ms": [int(round(duration * 1000)) for duration in self.durations],
+            "offsets": list(self.offsets),
+            "language": self.language,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Transcript":
+        """Rebuild a transcript from its cached form."""
+        return cls(
+            data["text"],
+            (start / 1000.0 for start in data["starts_ms"]),
+            (duration / 1000.0 for duration in data["durations_ms"]),
+            data["offsets"],
+            data.get("language"),
+        )
+
+
+# How long each kind of failure is negatively cached (seconds). Blocks and
+# transient failures are retried soon; permanent ones are remembered longer.
+FAILURE_TTLS = {
+    'blocked': 120,
+    'failed': 60,
+    'disabled': 900,
+    'not_found': 900,
+    'unavailable': 900,
+}
+
+CIRCUIT_OPEN_MESSAGE = """Error: YouTube is temporarily blocking our requests.
+
+We've paused transcript fetching for a few minutes to let the block clear.
+
+What you can do:
+• Try again in a few minutes
+• Videos that were already processed are still served from the cache"""
+
+
+class TranscriptFailure:
+    """
+    Typed result for a transcript that could not be fetched.
+
+    Attributes:
+        kind: 'blocked', 'failed', 'disabled', 'not_found', 'unavailable'
+              or 'circuit_open'
+        message: User-facing explanation (starts with "Error")
+        created_at: When the failure happened (epoch seconds)
+    """
+
+    __slots__ = ("kind", "message", "created_at")
+
+    def __init__(self, kind: str, message: str, created_at: Optional[float] = None):
+        self.kind = kind
+        self.message = message
+        self.created_at = time.time() if created_at is None else created_at
+
+    @property
+    def ttl(self) -> int:
+        """Seconds this failure may be served from the negative cache (0 = never cached)."""
+        return FAILURE_TTLS.get(self.kind, 0)
+
+    def is_expired(self) -> bool:
+        return time.time() - self.created_at > self.ttl
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "message": self.message, "created_at": self.created_at}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TranscriptFailure":
+        return cls(data["kind"], data["message"], data.get("created_at"))
+
+    def __repr__(self) -> str:
+        return f"TranscriptFailure({self.kind!r})"
 
 
 def extract_video_id(video_url: str) -> str:
@@ -28,38 +245,40 @@ def extract_video_id(video_url: str) -> str:
         return video_url  # Assume it's already a video ID
 
 
-def get_transcript(video_url: str):
-    """
-    Extract transcript from YouTube video URL.
-    
-    Args:
-        video_url: YouTube video URL (full URL or video ID)
-    
-    Returns:
-        str: Transcript text or error message
-    """
+def transcript_cache_key(video_id: str) -> str:
+    """Cache key for a video's transcript fetched with TRANSCRIPT_LANGUAGES."""
+    return make_cache_key('transcript', video_id, *TRANSCRIPT_LANGUAGES)
+
+
+def _fetch_transcript(video_id: str):
+    """Fetch captions from YouTube, mapping every failure to a TranscriptFailure."""
+    from youtube_transcript_api._errors import (
+        TranscriptsDisabled,
+        NoTranscriptFound,
+        VideoUnavailable,
+        IpBlocked,
+        RequestBlocked,
+        YouTubeRequestFailed,
+        CouldNotRetrieveTranscript
+    )
+
     try:
-        # Extract video ID from URL
-        video_id = extract_video_id(video_url)
-        
         # Get transcript using the new API
         # Try French first, automatically fall back to English if not available
-        api = YouTubeTranscriptApi()
+        api = _youtube_api()()
         # languages parameter: tries French first, then English if French not available
-        transcript_obj = api.fetch(video_id, languages=('fr', 'en'))
+        transcript_obj = api.fetch(video_id, languages=TRANSCRIPT_LANGUAGES)
         transcript_data = transcript_obj.to_raw_data()
         
-        # Extract text from transcript data
-        text = " ".join([t["text"] for t in transcript_data])
-        return text
+        # Keep segment timings alongside the text
+        return Transcript.from_segments(transcript_data, language=transcript_obj.language_code)
     except TranscriptsDisabled:
-        return "Error: Transcripts are disabled for this video."
+        return TranscriptFailure('disabled', "Error: Transcripts are disabled for this video.")
     except NoTranscriptFound:
-        return "Error: No transcript found for this video. The video may not have captions enabled."
+        return TranscriptFailure('not_found', "Error: No transcript found for this video. The video may not have captions enabled.")
     except VideoUnavailable:
-        return "Error: Video is unavailable. Please check if the video URL is correct."
-    except (IpBlocked, RequestBlocked) as e:
-        error_msg = str(e)
+        return TranscriptFailure('unavailable', "Error: Video is unavailable. Please check if the video URL is correct.")
+    except (IpBlocked, RequestBlocked):
         detailed_msg = """Error: YouTube has blocked requests from your IP address.
 
 This usually happens because:
@@ -74,7 +293,7 @@ Solutions:
 • Try again from a different location/network
 
 Note: On Streamlit Cloud, requests come from cloud provider IPs which YouTube often blocks."""
-        return detailed_msg
+        return TranscriptFailure('blocked', detailed_msg)
     except (YouTubeRequestFailed, CouldNotRetrieveTranscript) as e:
         error_msg = str(e)
         if "IP" in error_msg.upper() or "blocked" in error_msg.lower():
@@ -90,13 +309,13 @@ Solutions:
 • Use a VPN or different network
 • Consider using proxies (see youtube-transcript-api documentation)
 • Try again from a different location/network"""
-            return detailed_msg
-        return f"Error fetching transcript: {error_msg}"
+            return TranscriptFailure('blocked', detailed_msg)
+        return TranscriptFailure('failed', f"Error fetching transcript: {error_msg}")
     except Exception as e:
         error_msg = str(e)
         # Check if it's an IP blocking error
         if "IP" in error_msg.upper() or "blocked" in error_msg.lower() or "requestblocked" in error_msg.lower():
-            return """Error: YouTube is blocking requests from your IP address.
+            return TranscriptFailure('blocked', """Error: YouTube is blocking requests from your IP address.
 
 Common causes:
 • Too many requests (rate limiting)
@@ -109,6 +328,93 @@ What you can do:
 • Try accessing from a different location
 • Consider using proxies for production use
 
-If this persists, you may need to use proxy services or wait longer between requests."""
-        return f"Error fetching transcript: {error_msg}"
+If this persists, you may need to use proxy services or wait longer between requests.""")
+        return TranscriptFailure('failed', f"Error fetching transcript: {error_msg}")
+
+
+def get_transcript(video_url: str):
+    """
+    Extract transcript from YouTube video URL.
 
+    Fetches go through the YouTube host guard: a bounded number run at once,
+    the pace slows down when YouTube starts blocking, and while the circuit
+    breaker is open requests fail fast without touching YouTube. Videos
+    without captions fall back to Whisper transcription of the audio.
+    
+    Args:
+        video_url: YouTube video URL (full URL or video ID)
+    
+    Returns:
+        Transcript on success, or TranscriptFailure
+    """
+    # Extract video ID from URL
+    video_id = extract_video_id(video_url)
+
+    guard = get_host_guard(YOUTUBE_HOST)
+    if not guard.allow():
+        return TranscriptFailure('circuit_open', CIRCUIT_OPEN_MESSAGE)
+
+    guard.acquire()
+    blocked = False
+    try:
+        with metrics.timer('youtube_fetch'):
+            result = _fetch_transcript(video_id)
+        metrics.inc('youtube_fetches', result=result.kind if isinstance(result, TranscriptFailure) else 'ok')
+        blocked = isinstance(result, TranscriptFailure) and result.kind == 'blocked'
+    finally:
+        guard.release(blocked)
+
+    if isinstance(result, TranscriptFailure) and result.kind in WHISPER_FALLBACK_KINDS:
+        return _transcribe_audio(video_id, result)
+    return result
+
+
+def _transcribe_audio(video_id: str, failure: TranscriptFailure):
+    """
+    Transcribe the video's audio with Whisper, or return the caption failure.
+
+    The audio download is a YouTube request like any other, so it goes
+    through the host guard and a refused download is returned as its own
+    TranscriptFailure.
+    """
+    if not WHISPER_FALLBACK:
+        return failure
+    # Imported lazily: Whisper pulls in torch
+    from utils import whisper_fallback
+    if not whisper_fallback.is_available():
+        return failure
+    with tempfile.TemporaryDirectory(prefix="whisper-") as directory:
+        audio_path = _download_audio(video_id, directory)
+        if isinstance(audio_path, TranscriptFailure):
+            return audio_path
+        try:
+            with metrics.timer('whisper_transcribe'):
+                transcript, _ = whisper_fallback.transcribe_file(audio_path)
+        except Exception:
+            return failure
+    return transcript if transcript.text else failure
+
+
+def _download_audio(video_id: str, directory: str):
+    """Download the video's audio through the YouTube host guard; returns its path or a TranscriptFailure."""
+    from utils import whisper_fallback
+
+    guard = get_host_guard(YOUTUBE_HOST)
+    if not guard.allow():
+        return TranscriptFailure('circuit_open', CIRCUIT_OPEN_MESSAGE)
+
+    guard.acquire()
+    blocked = False
+    try:
+        with metrics.timer('youtube_download'):
+            path = whisper_fallback.download_audio(video_id, directory)
+        metrics.inc('youtube_downloads', result='ok')
+        return path
+    except Exception as e:
+        error_msg = str(e)
+        blocked = any(marker in error_msg.lower() for marker in DOWNLOAD_BLOCKED_MARKERS)
+        kind = 'blocked' if blocked else 'failed'
+        metrics.inc('youtube_downloads', result=kind)
+        return TranscriptFailure(kind, f"Error downloading audio for transcription: {error_msg}")
+    finally:
+        guard.release(blocked)
@@ -0,0 +1,338 @@
+"""
+Offline transcription with Whisper on CPU, for videos without captions.
+
+Audio is decoded to 16 kHz mono with ffmpeg, silence is skipped with a simple
+energy-based voice activity detector, and the speech is cut into chunks of at
+most ``WHISPER_CHUNK_SECONDS`` that are transcribed in parallel on a process
+pool (one single-threaded model per worker, so throughput scales with cores).
+The pool is shared by every transcription in the process, so the model is
+loaded once per worker rather than once per video, and it is shut down once
+it has been idle for ``WHISPER_POOL_IDLE_SECONDS`` so its models do not hold
+memory for the life of the app.
+Segment times are mapped back to the original audio, so the result is the
+same timestamped Transcript the caption path returns.
+
+Requires ``openai-whisper`` (which brings numpy and torch) and the ``ffmpeg``
+binary; downloading a video's audio also needs ``yt-dlp``.
+
+Usage:
+    python -m utils.whisper_fallback lecture.mp4
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.util import find_spec
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.transcript import Transcript
+
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+# Each worker holds its own copy of the model, so keep the pool small
+WHISPER_WORKERS = max(1, int(os.getenv("WHISPER_WORKERS", "2")))
+# Shut the pool down (and free its models) after this long without work
+WHISPER_POOL_IDLE_SECONDS = float(os.getenv("WHISPER_POOL_IDLE_SECONDS", "300"))
+# Whisper decodes 30 s windows; longer chunks are split internally anyway
+WHISPER_CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "30"))
+
+SAMPLE_RATE = 16000
+
+# Voice activity detection: frames quieter than the threshold are silence
+VAD_FRAME_SECONDS = 0.03
+VAD_MIN_RMS = 0.005
+VAD_NOISE_FACTOR = 3.0
+# Silences shorter than this stay inside a chunk; speech is padded by this much
+VAD_MAX_GAP_SECONDS = 1.0
+VAD_PAD_SECONDS = 0.2
+
+_model = None
+
+# Shared by every transcription in this process
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_config: Optional[Tuple[str, int]] = None
+_pool_lock = threading.Lock()
+# Transcriptions using the pool, and the idle shutdown armed when none is
+_pool_leases = 0
+_idle_timer: Optional[threading.Timer] = None
+_idle_generation = 0
+
+
+def is_available() -> bool:
+    """Whether Whisper and ffmpeg are installed."""
+    return find_spec("whisper") is not None and find_spec("numpy") is not None and _has_ffmpeg()
+
+
+def _has_ffmpeg() -> bool:
+    from shutil import which
+    return which("ffmpeg") is not None
+
+
+def download_audio(video_id: str, directory: str) -> str:
+    """
+    Download the audio track of a YouTube video with yt-dlp.
+
+    Args:
+        video_id: YouTube video ID
+        directory: Directory to write the file to
+
+    Returns:
+        Path of the downloaded audio file
+    """
+    from yt_dlp import YoutubeDL
+
+    options = {
+        'format': 'bestaudio/best',
+        'outtmpl': os.path.join(directory, '%(id)s.%(ext)s'),
+        'quiet': True,
+        'noprogress': True,
+    }
+    with YoutubeDL(options) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=True)
+        return ydl.prepare_filename(info)
+
+
+def load_audio(path: str):
+    """Decode any audio/video file to a float32 mono array at SAMPLE_RATE."""
+    import numpy as np
+
+    command = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    result = subprocess.run(command, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def detect_speech(audio) -> List[Tuple[int, int]]:
+    """
+    Find speech regions with an energy-based voice activity detector.
+
+    The threshold adapts to the recording: a frame is speech when its RMS is
+    above both VAD_MIN_RMS and VAD_NOISE_FACTOR times the noise floor (the
+    10th percentile of frame energies).
+
+    Args:
+        audio: Float32 mono samples at SAMPLE_RATE
+
+    Returns:
+        Sorted, non-overlapping (start, end) sample ranges
+    """
+    import numpy as np
+
+    frame = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+    count = len(audio) // frame
+    if count == 0:
+        return []
+    frames = audio[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    threshold = max(VAD_MIN_RMS, VAD_NOISE_FACTOR * float(np.percentile(rms, 10)))
+    voiced = np.flatnonzero(rms > threshold)
+    if len(voiced) == 0:
+        return []
+
+    max_gap = int(VAD_MAX_GAP_SECONDS / VAD_FRAME_SECONDS)
+    pad = int(VAD_PAD_SECONDS * SAMPLE_RATE)
+    regions = []
+    region_start = previous = int(voiced[0])
+    for index in voiced[1:]:
+        index = int(index)
+        if index - previous > max_gap:
+            regions.append((region_start, previous + 1))
+            region_start = index
+        previous = index
+    regions.append((region_start, previous + 1))
+
+    return [(max(0, start * frame - pad), min(len(audio), end * frame + pad)) for start, end in regions]
+
+
+def plan_chunks(regions: List[Tuple[int, int]],
+                max_seconds: float = WHISPER_CHUNK_SECONDS) -> List[Tuple[int, int]]:
+    """
+    Group speech regions into contiguous chunks of at most ``max_seconds``.
+
+    Regions are joined while they fit (the short silences between them are
+    kept so timing stays continuous); longer regions are split.
+    """
+    limit = int(max_seconds * SAMPLE_RATE)
+    chunks: List[Tuple[int, int]] = []
+    for start, end in regions:
+        if chunks and end - chunks[-1][0] <= limit and start - chunks[-1][1] <= VAD_MAX_GAP_SECONDS * SAMPLE_RATE:
+            chunks[-1] = (chunks[-1][0], end)
+            continue
+        while end - start > limit:
+            chunks.append((start, start + limit))
+            start += limit
+        chunks.append((start, end))
+    return chunks
+
+
+def _init_worker(model_name: str) -> None:
+    """Load one single-threaded model per worker process."""
+    global _model
+    import torch
+    import whisper
+
+    torch.set_num_threads(1)
+    _model = whisper.load_model(model_name, device="cpu")
+
+
+def _acquire_pool(model_name: str, workers: int) -> ProcessPoolExecutor:
+    """
+    Lease the process-wide worker pool, starting it if needed (see _release_pool).
+
+    Workers come from a fork server (spawned where that is unavailable)
+    rather than being forked from the app, whose other threads may hold locks
+    at fork time. Asking for another model or pool size replaces the pool.
+    """
+    global _pool, _pool_config, _pool_leases, _idle_timer
+    with _pool_lock:
+        if _idle_timer is not None:
+            _idle_timer.cancel()
+            _idle_timer = None
+        _pool_leases += 1
+        if _pool is not None and _pool_config != (model_name, workers):
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method),
+                                        initializer=_init_worker, initargs=(model_name,))
+            _pool_config = (model_name, workers)
+        return _pool
+
+
+def _release_pool() -> None:
+    """Arm the idle shutdown once no transcription is using the pool."""
+    global _pool_leases, _idle_timer, _idle_generation
+    with _pool_lock:
+        _pool_leases -= 1
+        if _pool_leases or _pool is None:
+            return
+        _idle_generation += 1
+        _idle_timer = threading.Timer(WHISPER_POOL_IDLE_SECONDS, _shutdown_idle_pool, args=(_idle_generation,))
+        _idle_timer.daemon = True
+        _idle_timer.start()
+
+
+def _shutdown_idle_pool(generation: int) -> None:
+    global _pool, _idle_timer
+    with _pool_lock:
+        # A transcription started, or a newer timer was armed, since this one
+        if _pool_leases or generation != _idle_generation or _pool is None:
+            return
+        pool, _pool, _idle_timer = _pool, None, None
+    pool.shutdown(wait=False)
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next transcription starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _transcribe_chunk(audio, offset: float, language: Optional[str]) -> Tuple[List[Dict[str, Any]], str]:
+    result = _model.transcribe(audio, language=language, fp16=False,
+                               condition_on_previous_text=False, verbose=None)
+    segments = [
+        {
+            'text': segment['text'],
+            'start': offset + segment['start'],
+            'duration': max(0.0, segment['end'] - segment['start']),
+        }
+        for segment in result.get('segments', [])
+    ]
+    return segments, result.get('language')
+
+
+def transcribe_file(path: str, language: Optional[str] = None, workers: int = WHISPER_WORKERS,
+                    model_name: str = WHISPER_MODEL) -> Tuple[Transcript, Dict[str, float]]:
+    """
+    Transcribe a local audio or video file.
+
+    Args:
+        path: Audio or video file readable by ffmpeg
+        language: Language code, or None to let Whisper detect it per chunk
+        workers: Number of worker processes (the pool is shared with every
+            other transcription in this process, and shut down when idle)
+        model_name: Whisper model size (tiny, base, small, ...)
+
+    Returns:
+        tuple: (Transcript, stats) where stats has ``audio_seconds``,
+        ``speech_seconds``, ``chunks``, ``wall_seconds`` and
+        ``realtime_factor`` (processing time / audio duration, lower is faster)
+    """
+    started = time.perf_counter()
+    audio = load_audio(path)
+    chunks = plan_chunks(detect_speech(audio))
+
+    segments: List[Dict[str, Any]] = []
+    languages: Counter = Counter()
+    if chunks:
+        pool = _acquire_pool(model_name, workers)
+        try:
+            futures = [
+                pool.submit(_transcribe_chunk, audio[start:end], start / SAMPLE_RATE, language)
+                for start, end in chunks
+            ]
+            for (start, end), future in zip(chunks, futures):
+                chunk_segments, chunk_language = future.result()
+                segments.extend(chunk_segments)
+                if chunk_language:
+                    languages[chunk_language] += end - start
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory)
+            _discard_pool(pool)
+            raise
+        finally:
+            _release_pool()
+
+    audio_seconds = len(audio) / SAMPLE_RATE
+    wall_seconds = time.perf_counter() - started
+    stats = {
+        'audio_seconds': round(audio_seconds, 2),
+        'speech_seconds': round(sum(end - start for start, end in chunks) / SAMPLE_RATE, 2),
+        'chunks': len(chunks),
+        'workers': min(workers, len(chunks)) if chunks else 0,
+        'wall_seconds': round(wall_seconds, 2),
+        'realtime_factor': round(wall_seconds / audio_seconds, 3) if audio_seconds else 0.0,
+    }
+    detected = language or (languages.most_common(1)[0][0] if languages else None)
+    return Transcript.from_segments(segments, language=detected), stats
+
+
+def transcribe_video(video_id: str, language: Optional[str] = None) -> Tuple[Transcript, Dict[str, float]]:
+    """Download a YouTube video's audio and transcribe it (see transcribe_file)."""
+    with tempfile.TemporaryDirectory(prefix="whisper-") as directory:
+        return transcribe_file(download_audio(video_id, directory), language=language)
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Transcribe an audio/video file with Whisper on CPU.")
+    parser.add_argument('path', help="Audio or video file")
+    parser.add_argument('--language', help="Language code (detected when omitted)")
+    parser.add_argument('--workers', type=int, default=WHISPER_WORKERS, help="Worker processes")
+    parser.add_argument('--model', default=WHISPER_MODEL, help="Whisper model size")
+    args = parser.parse_args(argv)
+
+    transcript, stats = transcribe_file(args.path, args.language, args.workers, args.model)
+    print(transcript.text)
+    print(f"{stats['audio_seconds']}s audio ({stats['speech_seconds']}s speech, {stats['chunks']} chunks) "
+          f"in {stats['wall_seconds']}s on {stats['workers']} worker(s): "
+          f"realtime factor {stats['realtime_factor']}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())